@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест бота без подключения к Telegram API.
+Прогоняет полные диалоги создания договоров через настоящие роутеры
+с поддельной сессией Bot и сохраняет перцентили задержек в JSON.
+
+Запуск: python benchmark.py --users 20 --output bench_results.json
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import config
+
+# Отдельная база, чтобы не засорять рабочую; задается до импорта db и handlers
+BENCH_DIR = tempfile.mkdtemp(prefix='contract_bot_bench_')
+config.DATABASE_PATH = os.path.join(BENCH_DIR, 'contracts.db')
+config.SAVE_OUTPUT_FILES = False
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import EditMessageText, SendDocument, SendMessage, TelegramMethod
+from aiogram.types import Message, Update
+
+from handlers import common, flow, admin
+from handlers.document_generator import document_generator
+from db.fsm_storage import SQLiteStorage
+from utils.metrics import setup_metrics
+from utils.state_context import setup_state_context
+
+# Сценарии диалогов: (название шага, тип события, значение)
+FLOWS = {
+    'agent': [
+        ('start', 'message', '/start'),
+        ('contract_type', 'callback', 'agent'),
+        ('contract_name', 'message', 'АС-{user}-{round}'),
+        ('contract_date', 'message', '01.02.2025'),
+        ('agent_name', 'message', 'ООО "Агент {user}"'),
+        ('principal_name', 'message', 'ООО "Принципал {user}"'),
+        ('reward', 'message', '150000 рублей'),
+        ('requisites', 'message', 'ИНН 1234567890, КПП 123456789, р/с 40702810000000000{user}'),
+        ('assignment_details', 'message', 'Поиск клиентов, раунд {round}'),
+        ('report_details', 'message', 'Привлечено {user} клиентов'),
+    ],
+    'subagent': [
+        ('start', 'message', '/start'),
+        ('contract_type', 'callback', 'subagent'),
+        ('contract_name', 'message', 'САС-{user}-{round}'),
+        ('contract_date', 'message', '01.02.2025'),
+        ('agent_name', 'message', 'ООО "Агент {user}"'),
+        ('subagent_name', 'message', 'ООО "Субагент {user}"'),
+        ('principal_name', 'message', 'ООО "Принципал {user}"'),
+        ('agreement_subject', 'message', 'Продвижение услуг, раунд {round}'),
+        ('reward', 'message', '50000 рублей'),
+        ('requisites', 'message', 'ИНН 0987654321, КПП 987654321, р/с 40702810000000000{user}'),
+        ('assignment_details', 'message', 'Поиск клиентов, раунд {round}'),
+        ('report_details', 'message', 'Привлечено {user} клиентов'),
+    ],
+    'delivery': [
+        ('start', 'message', '/start'),
+        ('contract_type', 'callback', 'delivery'),
+        ('contract_name', 'message', 'ДП-{user}-{round}'),
+        ('contract_date', 'message', '01.02.2025'),
+        ('supplier_name', 'message', 'ООО "Поставщик {user}"'),
+        ('buyer_name', 'message', 'ООО "Покупатель {user}"'),
+        ('goods_services', 'message', 'Компьютеры - {user} шт.'),
+        ('price_payment_terms', 'message', '500000 рублей, оплата за 10 дней'),
+        ('delivery_terms', 'message', '14 дней, раунд {round}'),
+        ('responsibility', 'message', 'Пеня 0.1% в день'),
+        ('requisites', 'message', 'ИНН 1111111111, КПП 111111111, р/с 40702810000000000{user}'),
+    ],
+}
+
+# Шаг сценария, к которому относятся операции с хранилищем FSM
+current_step: contextvars.ContextVar[str] = contextvars.ContextVar('current_step', default='')
+
+class CountingStorage(BaseStorage):
+    """Обертка хранилища FSM, считающая операции по шагам сценария"""
+    
+    # Совмещенные операции есть не у всех хранилищ: наличие повторяет обернутое хранилище
+    COMBINED_OPERATIONS = ('get_state_and_data', 'set_state_and_data')
+    
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+        self.operations: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    
+    def _count(self, operation: str):
+        self.operations[current_step.get()][operation] += 1
+    
+    def __getattr__(self, name: str):
+        if name not in self.COMBINED_OPERATIONS:
+            raise AttributeError(name)
+        operation = getattr(self.storage, name)
+        
+        async def counted(*args, **kwargs):
+            self._count(name)
+            return await operation(*args, **kwargs)
+        
+        return counted
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._count('set_state')
+        await self.storage.set_state(key, state)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        self._count('get_state')
+        return await self.storage.get_state(key)
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._count('set_data')
+        await self.storage.set_data(key, data)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        self._count('get_data')
+        return await self.storage.get_data(key)
+    
+    async def close(self) -> None:
+        await self.storage.close()
+
+class StubSession(BaseSession):
+    """Сессия Bot, которая отвечает на запросы API без сети и считает вызовы"""
+    
+    def __init__(self):
+        super().__init__()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.documents = 0
+        self.errors = 0
+        self._message_id = 0
+    
+    async def close(self) -> None:
+        pass
+    
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True):
+        yield b''
+    
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        
+        if isinstance(method, SendDocument):
+            self.documents += 1
+        if isinstance(method, (SendMessage, EditMessageText)) and method.text.startswith('❌'):
+            self.errors += 1
+        
+        if isinstance(method, (SendMessage, SendDocument, EditMessageText)):
+            self._message_id += 1
+            return Message.model_validate({
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': getattr(method, 'chat_id', 0) or 0, 'type': 'private'},
+            }, context={'bot': bot})
+        return True
+
+class UpdateFactory:
+    """Поддельные обновления Telegram от имени пользователя"""
+    
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._update_id = 0
+    
+    def _next_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+    
+    def _user(self, user_id: int) -> Dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    
+    def _message(self, user_id: int, text: Optional[str]) -> Dict:
+        message = {
+            'message_id': self._next_id(),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+        }
+        if text is not None:
+            message['text'] = text
+        return message
+    
+    def message(self, user_id: int, text: str) -> Update:
+        return Update.model_validate(
+            {'update_id': self._next_id(), 'message': self._message(user_id, text)},
+            context={'bot': self.bot}
+        )
+    
+    def callback(self, user_id: int, data: str) -> Update:
+        return Update.model_validate({
+            'update_id': self._next_id(),
+            'callback_query': {
+                'id': str(self._next_id()),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': self._message(user_id, 'menu'),
+            }
+        }, context={'bot': self.bot})
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(values: List[float]) -> Dict:
+    """Сводка задержек в миллисекундах"""
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'max_ms': round(max(values) * 1000, 3) if values else 0.0,
+    }
+
+class Benchmark:
+    def __init__(self, storage: str, buffered_state: bool = True):
+        self.session = StubSession()
+        self.bot = Bot(token='42:BENCHMARK', session=self.session)
+        
+        if storage == 'sqlite':
+            self.storage = SQLiteStorage(os.path.join(BENCH_DIR, 'fsm.db'))
+        else:
+            self.storage = MemoryStorage()
+        self.counting_storage = CountingStorage(self.storage)
+        self.buffered_state = buffered_state
+        
+        self.dp = Dispatcher(storage=self.counting_storage)
+        if buffered_state:
+            setup_state_context(self.dp)
+        setup_metrics(self.dp)
+        self.dp.include_router(common.router)
+        self.dp.include_router(flow.router)
+        self.dp.include_router(admin.router)
+        
+        self.updates = UpdateFactory(self.bot)
+        self.step_timings: Dict[str, List[float]] = defaultdict(list)
+        self.render_timings: Dict[str, List[float]] = defaultdict(list)
+        self._instrument_renders()
+    
+    def _instrument_renders(self):
+        """Замер времени рендеринга каждого документа (в пуле потоков)"""
+        render_document = document_generator.render_document
+        
+        def timed_render(template_name: str, data: Dict, filename: str, fmt: str = 'docx'):
+            started = time.perf_counter()
+            try:
+                return render_document(template_name, data, filename, fmt)
+            finally:
+                self.render_timings[template_name].append(time.perf_counter() - started)
+        
+        document_generator.render_document = timed_render
+    
+    async def run_flow(self, user_id: int, contract_type: str, round_number: int):
+        for step, kind, value in FLOWS[contract_type]:
+            value = value.format(user=user_id, round=round_number)
+            if kind == 'message':
+                update = self.updates.message(user_id, value)
+            else:
+                update = self.updates.callback(user_id, value)
+            
+            step_name = f"{contract_type}:{step}"
+            current_step.set(step_name)
+            started = time.perf_counter()
+            await self.dp.feed_update(self.bot, update)
+            self.step_timings[step_name].append(time.perf_counter() - started)
+    
+    async def run_user(self, user_id: int, flows: List[str], rounds: int):
+        for round_number in range(rounds):
+            for contract_type in flows:
+                await self.run_flow(user_id, contract_type, round_number)
+    
+    async def run(self, users: int, flows: List[str], rounds: int) -> Dict:
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_user(100000 + index, flows, rounds) for index in range(users)))
+        elapsed = time.perf_counter() - started
+        
+        await self.dp.storage.close()
+        await self.bot.session.close()
+        
+        all_steps = [value for values in self.step_timings.values() for value in values]
+        all_renders = [value for values in self.render_timings.values() for value in values]
+        
+        return {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'parameters': {
+                'users': users,
+                'rounds': rounds,
+                'flows': flows,
+                'storage': type(self.storage).__name__,
+                'buffered_state': self.buffered_state,
+                'generation_executor': config.GENERATION_EXECUTOR,
+                'generation_workers': config.GENERATION_WORKERS,
+            },
+            'elapsed_s': round(elapsed, 3),
+            'updates': len(all_steps),
+            'updates_per_second': round(len(all_steps) / elapsed, 2) if elapsed else 0.0,
+            'documents': self.session.documents,
+            'documents_per_second': round(self.session.documents / elapsed, 2) if elapsed else 0.0,
+            'errors': self.session.errors,
+            'api_calls': dict(self.session.calls),
+            'steps': {name: summarize(values) for name, values in sorted(self.step_timings.items())},
+            'steps_total': summarize(all_steps),
+            'storage_ops': self._storage_ops(),
+            'renders': {name: summarize(values) for name, values in sorted(self.render_timings.items())},
+            'renders_total': summarize(all_renders),
+        }
+    
+    def _storage_ops(self) -> Dict:
+        """Операции с хранилищем FSM по шагам и в среднем на одно обновление"""
+        report = {}
+        for name, operations in sorted(self.counting_storage.operations.items()):
+            updates = len(self.step_timings.get(name, ())) or 1
+            report[name] = {
+                'per_update': round(sum(operations.values()) / updates, 2),
+                'operations': dict(operations),
+            }
+        return report
+
+def print_report(report: Dict):
+    print(f"👥 Пользователей: {report['parameters']['users']}, раундов: {report['parameters']['rounds']}")
+    print(f"⏱️ Время: {report['elapsed_s']} с, обновлений: {report['updates']} ({report['updates_per_second']}/с)")
+    print(f"📄 Документов: {report['documents']} ({report['documents_per_second']}/с), ошибок: {report['errors']}")
+    print()
+    print(f"{'Шаг':<32}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'FSM-оп.':>10}")
+    for name, stats in report['steps'].items():
+        operations = report['storage_ops'].get(name, {}).get('per_update', 0.0)
+        print(f"{name:<32}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{operations:>10.2f}")
+    for name, stats in report['renders'].items():
+        print(f"{name:<32}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диалогов и генерации документов")
+    parser.add_argument('--users', type=int, default=10, help="Количество одновременных пользователей")
+    parser.add_argument('--rounds', type=int, default=1, help="Сколько раз каждый пользователь проходит сценарии")
+    parser.add_argument('--flows', default='agent,subagent,delivery', help="Сценарии через запятую")
+    parser.add_argument('--storage', choices=['memory', 'sqlite'], default='memory', help="Хранилище FSM")
+    parser.add_argument('--direct-state', action='store_true',
+                        help="Без буферизации состояния FSM (для сравнения числа операций)")
+    parser.add_argument('--output', default='bench_results.json', help="Файл для результатов в JSON")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING)
+    
+    flows = [contract_type.strip() for contract_type in args.flows.split(',') if contract_type.strip()]
+    report = asyncio.run(Benchmark(args.storage, buffered_state=not args.direct_state).run(args.users, flows, args.rounds))
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    print_report(report)
+    print(f"\n💾 Результаты сохранены в {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Пакетная генерация договоров из CSV или JSONL без Telegram.
+Строки читаются потоком, пачками проверяются по схеме полей и рендерятся
+параллельно в пуле процессов; договоры сохраняются в базу пачками.
+
+Запуск: python bulk_generate.py contracts.csv --output contracts.zip
+Колонки CSV (ключи JSONL) совпадают с полями договора: contract_type,
+contract_name, contract_date, agent_name и т.д.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import config
+from db.database import db_manager
+from handlers.document_generator import DOCUMENT_BUNDLES, GeneratedDocument, TemplateError, document_generator
+from utils.validator import CONTRACT_TYPES, validator
+
+# Строки проверяются пачками: validate_many проверяет одинаковые значения столбца один раз
+VALIDATION_CHUNK_SIZE = 1000
+
+@dataclass
+class BulkReport:
+    """Итог пакетной генерации"""
+    rows: int = 0
+    generated: int = 0
+    documents: int = 0
+    saved: int = 0
+    invalid: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+    
+    @property
+    def rate(self) -> float:
+        """Договоров в секунду"""
+        return self.generated / self.elapsed if self.elapsed else 0.0
+
+class OutputWriter:
+    """Запись готовых документов в zip-архив или папку"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._zip: Optional[zipfile.ZipFile] = None
+        if path.lower().endswith('.zip'):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # docx уже сжат, повторное сжатие только тратит время
+            self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED)
+        else:
+            os.makedirs(path, exist_ok=True)
+    
+    def write(self, filename: str, content: bytes):
+        # Файлы пишутся только внутрь архива или папки результата
+        filename = os.path.basename(filename.replace('\\', '/'))
+        if filename in ('', '.', '..'):
+            raise ValueError("Недопустимое имя файла результата")
+        if self._zip is not None:
+            self._zip.writestr(filename, content)
+        else:
+            with open(os.path.join(self.path, filename), 'wb') as f:
+                f.write(content)
+    
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+def _jsonl_rows(lines: Iterator[str]) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """Строки JSONL; вместо нечитаемой строки или строки не с объектом - None"""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+def read_rows(path: str, contract_type: Optional[str] = None) -> Iterator[Tuple[int, Dict, Optional[str]]]:
+    """
+    Потоковое чтение строк (номер строки, данные договора, ошибка чтения); пустые значения отбрасываются.
+    Нечитаемая строка не прерывает чтение: она выдается с пустыми данными и текстом ошибки
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.jsonl'):
+            rows = _jsonl_rows(f)
+        else:
+            # Номер строки файла с учетом заголовка
+            rows = enumerate(csv.DictReader(f), start=2)
+        
+        for number, row in rows:
+            if row is None:
+                yield number, {}, "строка не является JSON-объектом"
+                continue
+            data = {
+                key.strip(): str(value).strip()
+                for key, value in row.items()
+                if key and value is not None and str(value).strip()
+            }
+            if contract_type and 'contract_type' not in data:
+                data['contract_type'] = contract_type
+            yield number, data, None
+
+def template_fields(contract_type: str) -> frozenset:
+    """Поля, которые подставляются в шаблоны комплекта документов"""
+    fields = set()
+    for template_name, _ in DOCUMENT_BUNDLES[contract_type]:
+        fields |= document_generator.get_template(template_name).placeholders
+    return frozenset(fields)
+
+def check_rows(rows: List[Dict]) -> List[List[str]]:
+    """Ошибки валидации по схеме и незаполненные поля шаблонов для каждой строки пачки"""
+    required: Dict[str, frozenset] = {}
+    results = []
+    for data, field_errors in zip(rows, validator.validate_many(rows)):
+        if field_errors:
+            results.append([f"{field}: {error}" for field, error in field_errors.items()])
+            continue
+        
+        contract_type = data['contract_type']
+        if contract_type not in required:
+            required[contract_type] = template_fields(contract_type)
+        missing = sorted(required[contract_type] - data.keys())
+        results.append([f"Не заполнены поля: {', '.join(missing)}"] if missing else [])
+    return results
+
+def render_row(data: Dict) -> List[GeneratedDocument]:
+    """Рендеринг комплекта документов одной строки (выполняется в дочернем процессе)"""
+    return document_generator.render_bundle(data['contract_type'], data)
+
+def generate_bulk(input_path: str, output_path: str, user_id: int, workers: Optional[int] = None,
+                  batch_size: int = 200, contract_type: Optional[str] = None, save: bool = True,
+                  progress_every: int = 100) -> BulkReport:
+    """Генерация всех договоров файла; возвращает отчет"""
+    workers = workers or os.cpu_count() or 1
+    # Ограничиваем число строк в работе, чтобы не держать весь файл в памяти
+    max_pending = workers * 4
+    
+    report = BulkReport()
+    writer = OutputWriter(output_path)
+    batch: List[Tuple[int, str, str, Dict]] = []
+    pending: Dict[Future, Tuple[int, Dict]] = {}
+    started = time.perf_counter()
+    
+    def flush_batch():
+        if batch:
+            report.saved += db_manager.save_contracts_batch(batch)
+            batch.clear()
+    
+    def collect(done):
+        for future in done:
+            number, data = pending.pop(future)
+            try:
+                documents = future.result()
+            except Exception as e:
+                report.failed += 1
+                report.errors.append(f"Строка {number}: {e}")
+                continue
+            
+            try:
+                for document in documents:
+                    writer.write(f"{number:06d}_{document.filename}", document.content)
+            except (OSError, ValueError) as e:
+                # Ошибка записи одной строки не прерывает пакет
+                report.failed += 1
+                report.errors.append(f"Строка {number}: не удалось записать документ: {e}")
+                continue
+            report.generated += 1
+            report.documents += len(documents)
+            
+            if save:
+                batch.append((user_id, data['contract_type'], data.get('contract_name', ''), data))
+                if len(batch) >= batch_size:
+                    flush_batch()
+            
+            if progress_every and report.generated % progress_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"⏳ Сформировано договоров: {report.generated} ({report.generated / elapsed:.1f}/с)")
+    
+    # Шаблоны компилируются до запуска пула, дочерние процессы получают их готовыми
+    document_generator.warm_up()
+    
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = read_rows(input_path, contract_type)
+            while True:
+                chunk = list(itertools.islice(rows, VALIDATION_CHUNK_SIZE))
+                if not chunk:
+                    break
+                report.rows += len(chunk)
+                readable = [data for _, data, read_error in chunk if read_error is None]
+                try:
+                    checked = check_rows(readable)
+                except (TemplateError, FileNotFoundError) as e:
+                    checked = [[str(e)]] * len(readable)
+                checked_errors = iter(checked)
+                
+                for number, data, read_error in chunk:
+                    errors = [read_error] if read_error else next(checked_errors)
+                    if errors:
+                        report.invalid += 1
+                        report.errors.append(f"Строка {number}: {'; '.join(errors)}")
+                        continue
+                    
+                    pending[executor.submit(render_row, data)] = (number, data)
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+    finally:
+        flush_batch()
+        writer.close()
+        report.elapsed = time.perf_counter() - started
+    
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация договоров из CSV или JSONL")
+    parser.add_argument('input', help="Файл .csv (с заголовком) или .jsonl, по договору в строке")
+    parser.add_argument('--output', default='bulk_output.zip', help="Zip-архив (*.zip) или папка для документов")
+    parser.add_argument('--type', dest='contract_type', choices=CONTRACT_TYPES,
+                        help="Тип договора для строк без колонки contract_type")
+    parser.add_argument('--user-id', type=int, default=config.ADMIN_USER_ID,
+                        help="Пользователь, от имени которого договоры сохраняются в базу")
+    parser.add_argument('--workers', type=int, default=None, help="Число процессов (по умолчанию - число ядер)")
+    parser.add_argument('--batch-size', type=int, default=200, help="Договоров в одной транзакции базы")
+    parser.add_argument('--no-save', action='store_true', help="Не сохранять договоры в базу")
+    args = parser.parse_args()
+    
+    report = generate_bulk(
+        args.input,
+        args.output,
+        user_id=args.user_id,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        contract_type=args.contract_type,
+        save=not args.no_save
+    )
+    
+    for error in report.errors[:20]:
+        print(f"❌ {error}")
+    if len(report.errors) > 20:
+        print(f"... и еще ошибок: {len(report.errors) - 20}")
+    
+    print(f"\n📄 Строк: {report.rows}, договоров: {report.generated}, документов: {report.documents}")
+    print(f"⚠️ Не прошли проверку: {report.invalid}, ошибок генерации: {report.failed}")
+    print(f"💾 Сохранено в базу: {report.saved}")
+    print(f"⏱️ Время: {report.elapsed:.1f} с ({report.rate:.1f} договоров/с)")
+    print(f"📦 Результат: {args.output}")
+    
+    return 0 if not report.errors else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,6 +8,64 @@ class Config:
     TEMPLATES_PATH: str = 'templates'
     OUTPUT_PATH: str = 'output'
     ADMIN_USER_ID: int = int(os.getenv('ADMIN_USER_ID', '0'))
+    
+    # Настройки SQLite
+    DATABASE_BUSY_TIMEOUT_MS: int = int(os.getenv('DATABASE_BUSY_TIMEOUT_MS', '5000'))
+    DATABASE_CACHE_SIZE_KB: int = int(os.getenv('DATABASE_CACHE_SIZE_KB', '8192'))
+    
+    # Режим получения обновлений: 'polling' или 'webhook'
+    RUN_MODE: str = os.getenv('RUN_MODE', 'polling')
+    WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8080'))
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+    # Публичный адрес (https://example.com); если задан, вебхук регистрируется при запуске
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_MAX_IN_FLIGHT: int = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', '64'))
+    
+    # Хранилище состояний FSM: 'sqlite' или 'memory'
+    FSM_STORAGE: str = os.getenv('FSM_STORAGE', 'sqlite')
+    FSM_DATABASE_PATH: str = os.getenv('FSM_DATABASE_PATH', 'db/fsm.db')
+    FSM_FLUSH_INTERVAL_MS: int = int(os.getenv('FSM_FLUSH_INTERVAL_MS', '50'))
+    # Сколько состояний держать в памяти; сохраненные давно не использованные вытесняются
+    FSM_CACHE_SIZE: int = int(os.getenv('FSM_CACHE_SIZE', '10000'))
+    
+    # Пул генерации документов: 'thread' или 'process'
+    GENERATION_EXECUTOR: str = os.getenv('GENERATION_EXECUTOR', 'thread')
+    GENERATION_WORKERS: int = int(os.getenv('GENERATION_WORKERS', '4'))
+    GENERATION_QUEUE_SIZE: int = int(os.getenv('GENERATION_QUEUE_SIZE', '16'))
+    
+    # Очередь задач генерации: одновременно обрабатываемые комплекты и максимум ожидающих
+    GENERATION_JOB_WORKERS: int = int(os.getenv('GENERATION_JOB_WORKERS', '4'))
+    GENERATION_JOB_QUEUE_SIZE: int = int(os.getenv('GENERATION_JOB_QUEUE_SIZE', '32'))
+    
+    # Ограничение частоты запросов одного пользователя (сообщений в секунду и запас); 0 отключает
+    THROTTLE_RATE: float = float(os.getenv('THROTTLE_RATE', '1'))
+    THROTTLE_BURST: int = int(os.getenv('THROTTLE_BURST', '5'))
+    
+    # Генерации комплекта документов: на пользователя в минуту и всего одновременно; 0 отключает
+    GENERATION_RATE_PER_MINUTE: float = float(os.getenv('GENERATION_RATE_PER_MINUTE', '6'))
+    GENERATION_BURST: int = int(os.getenv('GENERATION_BURST', '3'))
+    GENERATION_MAX_IN_FLIGHT: int = int(os.getenv('GENERATION_MAX_IN_FLIGHT', '16'))
+    
+    # Кэш готовых документов
+    DOCUMENT_CACHE_MAX_ITEMS: int = int(os.getenv('DOCUMENT_CACHE_MAX_ITEMS', '256'))
+    DOCUMENT_CACHE_MAX_MB: int = int(os.getenv('DOCUMENT_CACHE_MAX_MB', '64'))
+    
+    # Шрифт TrueType с кириллицей для PDF (встраивается в документ)
+    PDF_FONT_PATH: str = os.getenv('PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+    
+    # Сохранять копии отправленных документов в OUTPUT_PATH
+    SAVE_OUTPUT_FILES: bool = os.getenv('SAVE_OUTPUT_FILES', '0') == '1'
+    
+    # Фоновая очистка OUTPUT_PATH
+    OUTPUT_MAX_AGE_HOURS: float = float(os.getenv('OUTPUT_MAX_AGE_HOURS', '24'))
+    OUTPUT_MAX_TOTAL_MB: int = int(os.getenv('OUTPUT_MAX_TOTAL_MB', '200'))
+    OUTPUT_CLEANUP_INTERVAL_MIN: float = float(os.getenv('OUTPUT_CLEANUP_INTERVAL_MIN', '30'))
+    OUTPUT_CLEANUP_BATCH: int = int(os.getenv('OUTPUT_CLEANUP_BATCH', '100'))
+    
+    # HTTP-адрес метрик в формате Prometheus (/metrics); порт 0 отключает сервер
+    METRICS_HOST: str = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', '9101'))
 
 config = Config()
-
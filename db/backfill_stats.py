@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Пересчет таблиц статистики по существующим договорам.
+Запуск: python -m db.backfill_stats
+"""
+
+from db.database import db_manager
+
+def main():
+    db_manager.backfill_stats()
+    stats = db_manager.get_stats()
+    print(f"✅ Статистика пересчитана: {stats['contracts']} договоров, {stats['users']} пользователей")
+    db_manager.close()
+
+if __name__ == '__main__':
+    main()
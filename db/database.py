@@ -1,58 +1,596 @@
 import sqlite3
 import json
 import os
-from typing import Dict, List, Optional
+import re
+import asyncio
+import functools
+import hashlib
+import logging
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 from config import config
 
+logger = logging.getLogger(__name__)
+
+# Стороны договора хранятся один раз в таблице parties, в договоре - ссылки по ролям
+PARTY_FIELDS = ('agent_name', 'subagent_name', 'principal_name', 'supplier_name', 'buyer_name')
+PARTY_COLUMNS = tuple(field[:-len('_name')] + '_id' for field in PARTY_FIELDS)
+
+# Поля с собственными колонками; остальные поля формы попадают в сжатое поле extra
+COLUMN_FIELDS = ('contract_type', 'contract_name', 'contract_date', 'reward', 'requisites') + PARTY_FIELDS
+
+# Поля предмета договора, попадающие в полнотекстовый индекс
+SEARCH_SUBJECT_FIELDS = ('agreement_subject', 'assignment_details', 'goods_services')
+
+# Сколько самых новых совпадений ранжируется: bm25 считается для каждого кандидата,
+# без ограничения частое слово на миллионах строк ранжировалось бы секунды
+SEARCH_CANDIDATES = 2000
+
+# Служебный ключ extra: поля-колонки, которых не было в исходных данных формы
+ABSENT_KEY = '$absent'
+
+# Тексты короче порога не сжимаются: заголовок zlib съедает выигрыш
+COMPRESS_MIN_LENGTH = 64
+
+CONTRACT_COLUMNS = (
+    'user_id, contract_type, contract_name, contract_date, '
+    + ', '.join(PARTY_COLUMNS)
+    + ', reward, requisites_id, extra'
+)
+
+def _pack_text(text: str) -> Union[str, bytes]:
+    """Длинный текст сохраняется как сжатый BLOB, короткий - как TEXT"""
+    if len(text) < COMPRESS_MIN_LENGTH:
+        return text
+    packed = zlib.compress(text.encode('utf-8'), 9)
+    return packed if len(packed) < len(text.encode('utf-8')) else text
+
+def _unpack_text(value: Union[str, bytes]) -> str:
+    return zlib.decompress(value).decode('utf-8') if isinstance(value, bytes) else value
+
+def search_terms(query: str) -> List[str]:
+    """Слова поискового запроса в нижнем регистре"""
+    return re.findall(r'\w+', query.lower())
+
+def _owner_token(user_id: int) -> str:
+    # Владелец индексируется отдельным словом: фильтр по нему пересекает списки FTS, а не сканирует совпадения
+    return f'u{user_id}'
+
+def _date_to_iso(value: Optional[str]) -> Optional[str]:
+    """Дата ДД.ММ.ГГГГ в ISO для запросов; None, если обратное преобразование не вернет исходную строку"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.strptime(value, "%d.%m.%Y")
+    except ValueError:
+        return None
+    return parsed.strftime("%Y-%m-%d") if parsed.strftime("%d.%m.%Y") == value else None
+
 class DatabaseManager:
-    def __init__(self):
-        self.db_path = config.DATABASE_PATH
-        self._init_database()
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or config.DATABASE_PATH
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # Все асинхронные запросы выполняются в одном выделенном потоке
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+        # Схема создается не при импорте, а явно при запуске или при первом запросе
+        self._initialized = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие соединения с настройками производительности"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=config.DATABASE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        # WAL: читатели не блокируются писателем
+        conn.execute('PRAGMA journal_mode=WAL')
+        # В режиме WAL NORMAL безопасен при сбое процесса и не делает fsync на каждый коммит
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{config.DATABASE_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA busy_timeout={config.DATABASE_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    @contextmanager
+    def _get_connection(self) -> Iterator[sqlite3.Connection]:
+        """Общее долгоживущее соединение; транзакция фиксируется при выходе из блока"""
+        with self._lock:
+            if not self._initialized:
+                self.initialize()
+            if self._connection is None:
+                self._connection = self._connect()
+            with self._connection:
+                yield self._connection
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение функции в потоке базы данных без блокировки event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    def close(self):
+        """Закрытие соединения и потока базы данных"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+    
+    def initialize(self):
+        """Открытие базы, создание схемы и миграции; повторный вызов ничего не делает"""
+        with self._lock:
+            if self._initialized:
+                return
+            # Флаг ставится заранее: _init_database сам работает через _get_connection
+            self._initialized = True
+            try:
+                self._init_database()
+            except Exception:
+                self._initialized = False
+                raise
     
     def _init_database(self):
         """Инициализация базы данных"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS parties (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+            # Реквизиты ищутся по короткому хэшу, чтобы не индексировать сам текст
             conn.execute('''
-                CREATE TABLE IF NOT EXISTS contracts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    contract_type TEXT NOT NULL,
-                    contract_name TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                CREATE TABLE IF NOT EXISTS requisites (
+                    id INTEGER PRIMARY KEY,
+                    hash INTEGER NOT NULL,
+                    body NOT NULL
                 )
             ''')
-            conn.commit()
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_requisites_hash ON requisites (hash)')
+            
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(contracts)')]
+            if 'data' in columns:
+                # База старого формата с JSON в одной колонке
+                self._migrate_contracts(conn)
+            else:
+                conn.execute(self._contracts_table_sql('contracts'))
+            
+            # Индекс под список договоров пользователя и курсорную пагинацию
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_contracts_user_created
+                ON contracts (user_id, created_at, id)
+            ''')
+            self._init_stats(conn)
+            self._init_search(conn)
+    
+    @staticmethod
+    def _contracts_table_sql(name: str) -> str:
+        party_columns = ''.join(f'{column} INTEGER REFERENCES parties (id),\n' for column in PARTY_COLUMNS)
+        return f'''
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                contract_type TEXT NOT NULL,
+                contract_name TEXT NOT NULL,
+                contract_date TEXT,
+                {party_columns}
+                reward TEXT,
+                requisites_id INTEGER REFERENCES requisites (id),
+                extra,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        '''
+    
+    def _migrate_contracts(self, conn: sqlite3.Connection) -> int:
+        """
+        Перенос договоров из JSON-колонки data в нормализованную схему.
+        Таблица пересобирается одной транзакцией с сохранением id и дат создания
+        """
+        logger.info("📦 Перенос договоров в компактный формат хранения...")
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DROP TABLE IF EXISTS contracts_new')
+        conn.execute(self._contracts_table_sql('contracts_new'))
+        
+        migrated = 0
+        cursor = conn.execute('SELECT id, user_id, contract_type, contract_name, data, created_at FROM contracts ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for contract_id, user_id, contract_type, contract_name, data, created_at in rows:
+                values = self._contract_values(conn, user_id, contract_type, contract_name, json.loads(data))
+                conn.execute(
+                    f'INSERT INTO contracts_new (id, {CONTRACT_COLUMNS}, created_at) '
+                    f'VALUES (?, {", ".join("?" * len(values))}, ?)',
+                    (contract_id, *values, created_at)
+                )
+                migrated += 1
+        
+        # Триггеры статистики удаляются вместе со старой таблицей и создаются заново в _init_stats
+        conn.execute('DROP TABLE contracts')
+        conn.execute('ALTER TABLE contracts_new RENAME TO contracts')
+        logger.info(f"📦 Перенесено договоров: {migrated}")
+        return migrated
+    
+    def _party_id(self, conn: sqlite3.Connection, name: Optional[str]) -> Optional[int]:
+        if not name:
+            return None
+        return conn.execute(
+            'INSERT INTO parties (name) VALUES (?) ON CONFLICT (name) DO UPDATE SET name = excluded.name RETURNING id',
+            (name,)
+        ).fetchone()[0]
+    
+    def _requisites_id(self, conn: sqlite3.Connection, text: Optional[str]) -> Optional[int]:
+        if not text:
+            return None
+        body = _pack_text(text)
+        text_hash = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'big', signed=True)
+        row = conn.execute('SELECT id FROM requisites WHERE hash = ? AND body = ?', (text_hash, body)).fetchone()
+        if row:
+            return row[0]
+        return conn.execute('INSERT INTO requisites (hash, body) VALUES (?, ?)', (text_hash, body)).lastrowid
+    
+    def _contract_values(self, conn: sqlite3.Connection, user_id: int, contract_type: str,
+                         contract_name: str, data: Dict) -> Tuple:
+        """Значения колонок договора в порядке CONTRACT_COLUMNS"""
+        extra = {key: value for key, value in data.items() if key not in COLUMN_FIELDS}
+        contract_date = _date_to_iso(data.get('contract_date'))
+        if contract_date is None and data.get('contract_date') is not None:
+            # Дату в нестандартном виде храним как есть
+            extra['contract_date'] = data['contract_date']
+        for key, column_value in (('contract_type', contract_type), ('contract_name', contract_name)):
+            if key not in data:
+                extra.setdefault(ABSENT_KEY, []).append(key)
+            elif data[key] != column_value:
+                extra[key] = data[key]
+        
+        return (
+            user_id,
+            contract_type,
+            contract_name,
+            contract_date,
+            *(self._party_id(conn, data.get(field)) for field in PARTY_FIELDS),
+            data.get('reward'),
+            self._requisites_id(conn, data.get('requisites')),
+            _pack_text(json.dumps(extra, ensure_ascii=False, separators=(',', ':'))) if extra else None
+        )
+    
+    def _insert_contract(self, conn: sqlite3.Connection, user_id: int, contract_type: str,
+                         contract_name: str, data: Dict) -> int:
+        values = self._contract_values(conn, user_id, contract_type, contract_name, data)
+        contract_id = conn.execute(
+            f'INSERT INTO contracts ({CONTRACT_COLUMNS}) VALUES ({", ".join("?" * len(values))})',
+            values
+        ).lastrowid
+        self._index_contract(conn, contract_id, user_id, data)
+        return contract_id
+    
+    def _index_contract(self, conn: sqlite3.Connection, contract_id: int, user_id: int, data: Dict):
+        """Добавление договора в полнотекстовый индекс"""
+        conn.execute(
+            'INSERT INTO contracts_fts (rowid, owner, name, parties, subject) VALUES (?, ?, ?, ?, ?)',
+            (
+                contract_id,
+                _owner_token(user_id),
+                data.get('contract_name', ''),
+                '\n'.join(data[field] for field in PARTY_FIELDS if data.get(field)),
+                '\n'.join(data[field] for field in SEARCH_SUBJECT_FIELDS if data.get(field))
+            )
+        )
+    
+    def _load_contracts(self, conn: sqlite3.Connection, where: str, params: Tuple = ()) -> List[Tuple[int, int, Dict]]:
+        """Договоры (id, user_id, данные формы) по условию на таблицу contracts c"""
+        party_joins = ''.join(
+            f' LEFT JOIN parties p{index} ON p{index}.id = c.{column}'
+            for index, column in enumerate(PARTY_COLUMNS)
+        )
+        party_names = ', '.join(f'p{index}.name' for index in range(len(PARTY_COLUMNS)))
+        cursor = conn.execute(
+            f'SELECT c.id, c.user_id, c.contract_type, c.contract_name, c.contract_date, {party_names}, '
+            f'c.reward, r.body, c.extra FROM contracts c{party_joins} '
+            f'LEFT JOIN requisites r ON r.id = c.requisites_id WHERE {where}',
+            params
+        )
+        return [(row[0], row[1], self._decode_contract(row[2:])) for row in cursor]
+    
+    @staticmethod
+    def _decode_contract(row: Tuple) -> Dict:
+        """Сборка данных формы из колонок договора"""
+        contract_type, contract_name, contract_date = row[:3]
+        parties = row[3:3 + len(PARTY_FIELDS)]
+        reward, requisites, extra = row[3 + len(PARTY_FIELDS):]
+        
+        data = {'contract_type': contract_type, 'contract_name': contract_name}
+        if contract_date:
+            data['contract_date'] = datetime.strptime(contract_date, "%Y-%m-%d").strftime("%d.%m.%Y")
+        data.update((field, name) for field, name in zip(PARTY_FIELDS, parties) if name is not None)
+        if reward is not None:
+            data['reward'] = reward
+        if requisites is not None:
+            data['requisites'] = _unpack_text(requisites)
+        if extra is not None:
+            extra = json.loads(_unpack_text(extra))
+            for key in extra.pop(ABSENT_KEY, []):
+                del data[key]
+            data.update(extra)
+        return data
+    
+    def _init_stats(self, conn: sqlite3.Connection):
+        """Таблицы счетчиков статистики, обновляемые триггерами при вставке договора"""
+        stats_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_counters'"
+        ).fetchone()
+        
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS stats_types (
+                contract_type TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day TEXT NOT NULL,
+                contract_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, contract_type)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats_users (
+                user_id INTEGER PRIMARY KEY
+            );
+            
+            CREATE TRIGGER IF NOT EXISTS trg_contracts_stats AFTER INSERT ON contracts
+            BEGIN
+                INSERT INTO stats_counters (name, value) VALUES ('contracts', 1)
+                    ON CONFLICT (name) DO UPDATE SET value = value + 1;
+                INSERT INTO stats_types (contract_type, count) VALUES (NEW.contract_type, 1)
+                    ON CONFLICT (contract_type) DO UPDATE SET count = count + 1;
+                INSERT INTO stats_daily (day, contract_type, count) VALUES (date(NEW.created_at), NEW.contract_type, 1)
+                    ON CONFLICT (day, contract_type) DO UPDATE SET count = count + 1;
+                INSERT OR IGNORE INTO stats_users (user_id) VALUES (NEW.user_id);
+            END;
+            
+            -- Срабатывает только для нового пользователя: повторная вставка игнорируется
+            CREATE TRIGGER IF NOT EXISTS trg_stats_users AFTER INSERT ON stats_users
+            BEGIN
+                INSERT INTO stats_counters (name, value) VALUES ('users', 1)
+                    ON CONFLICT (name) DO UPDATE SET value = value + 1;
+            END;
+        ''')
+        
+        # Существующая база без счетчиков заполняется один раз при обновлении
+        if not stats_exists:
+            self._backfill_stats(conn)
+    
+    def _backfill_stats(self, conn: sqlite3.Connection):
+        """Пересчет счетчиков статистики по всей таблице contracts"""
+        conn.executescript('''
+            BEGIN IMMEDIATE;
+            DELETE FROM stats_counters;
+            DELETE FROM stats_types;
+            DELETE FROM stats_daily;
+            DELETE FROM stats_users;
+            
+            INSERT INTO stats_counters (name, value) SELECT 'contracts', COUNT(*) FROM contracts;
+            INSERT INTO stats_types (contract_type, count)
+                SELECT contract_type, COUNT(*) FROM contracts GROUP BY contract_type;
+            INSERT INTO stats_daily (day, contract_type, count)
+                SELECT date(created_at), contract_type, COUNT(*) FROM contracts GROUP BY 1, 2;
+            INSERT INTO stats_users (user_id) SELECT DISTINCT user_id FROM contracts;
+            -- Триггер trg_stats_users уже посчитал вставленных пользователей
+            INSERT OR REPLACE INTO stats_counters (name, value) SELECT 'users', COUNT(*) FROM stats_users;
+            COMMIT;
+        ''')
+    
+    def backfill_stats(self):
+        """Пересчет статистики для существующей базы"""
+        with self._get_connection() as conn:
+            self._backfill_stats(conn)
+    
+    def _init_search(self, conn: sqlite3.Connection):
+        """
+        Полнотекстовый индекс FTS5 по названию, сторонам и предмету договора.
+        Таблица без собственного содержимого: тексты хранятся только в contracts
+        """
+        search_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contracts_fts'"
+        ).fetchone()
+        if search_exists:
+            return
+        
+        conn.execute('''
+            CREATE VIRTUAL TABLE contracts_fts USING fts5 (
+                owner, name, parties, subject,
+                content = '',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+        # Ранжирование bm25: название важнее сторон, стороны важнее предмета, владелец не учитывается
+        conn.execute("INSERT INTO contracts_fts (contracts_fts, rank) VALUES ('rank', 'bm25(0.0, 10.0, 5.0, 1.0)')")
+        self._rebuild_search_index(conn)
+    
+    def _rebuild_search_index(self, conn: sqlite3.Connection):
+        """Индексация всех договоров (при первом запуске на существующей базе)"""
+        conn.execute("INSERT INTO contracts_fts (contracts_fts) VALUES ('delete-all')")
+        last_id = 0
+        while True:
+            # Пачками, чтобы не собирать в памяти всю таблицу
+            rows = self._load_contracts(conn, 'c.id > ? ORDER BY c.id LIMIT 1000', (last_id,))
+            if not rows:
+                break
+            for contract_id, user_id, data in rows:
+                self._index_contract(conn, contract_id, user_id, data)
+            last_id = rows[-1][0]
+    
+    def rebuild_search_index(self):
+        """Переиндексация договоров для поиска"""
+        with self._get_connection() as conn:
+            self._rebuild_search_index(conn)
+    
+    def get_stats(self, days: int = 7) -> Dict:
+        """Статистика из счетчиков: не зависит от размера таблицы contracts"""
+        with self._get_connection() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM stats_counters').fetchall())
+            by_type = conn.execute('SELECT contract_type, count FROM stats_types ORDER BY contract_type').fetchall()
+            daily = conn.execute(
+                "SELECT day, contract_type, count FROM stats_daily WHERE day >= date('now', ?) "
+                "ORDER BY day DESC, contract_type",
+                (f'-{days - 1} days',)
+            ).fetchall()
+        
+        return {
+            'contracts': counters.get('contracts', 0),
+            'users': counters.get('users', 0),
+            'by_type': by_type,
+            'daily': daily
+        }
     
     def save_contract(self, user_id: int, contract_type: str, contract_name: str, data: Dict) -> int:
         """Сохранение данных договора"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                'INSERT INTO contracts (user_id, contract_type, contract_name, data) VALUES (?, ?, ?, ?)',
-                (user_id, contract_type, contract_name, json.dumps(data, ensure_ascii=False))
-            )
-            return cursor.lastrowid
+        with self._get_connection() as conn:
+            return self._insert_contract(conn, user_id, contract_type, contract_name, data)
+    
+    def save_contracts_batch(self, contracts: List[Tuple[int, str, str, Dict]]) -> int:
+        """Сохранение пачки договоров (user_id, тип, название, данные) одной транзакцией"""
+        with self._get_connection() as conn:
+            for user_id, contract_type, contract_name, data in contracts:
+                self._insert_contract(conn, user_id, contract_type, contract_name, data)
+        return len(contracts)
     
     def get_user_contracts(self, user_id: int) -> List[Dict]:
         """Получение всех договоров пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             cursor = conn.execute(
-                'SELECT id, contract_type, contract_name, created_at FROM contracts WHERE user_id = ? ORDER BY created_at DESC',
+                'SELECT id, contract_type, contract_name, created_at FROM contracts WHERE user_id = ? ORDER BY created_at DESC, id DESC',
                 (user_id,)
             )
             return [{'id': row[0], 'type': row[1], 'name': row[2], 'created_at': row[3]} for row in cursor.fetchall()]
     
-    def get_contract_data(self, contract_id: int, user_id: int) -> Optional[Dict]:
-        """Получение данных конкретного договора"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                'SELECT data FROM contracts WHERE id = ? AND user_id = ?',
-                (contract_id, user_id)
+    def get_user_contracts_page(self, user_id: int, limit: int = 10,
+                                before: Optional[Tuple[str, int]] = None,
+                                after: Optional[Tuple[str, int]] = None) -> Dict:
+        """
+        Страница договоров пользователя (от новых к старым) с курсорной пагинацией.
+        before - курсор (created_at, id): договоры старше него;
+        after - курсор (created_at, id): договоры новее него.
+        """
+        if after is not None:
+            query = (
+                'SELECT id, contract_type, contract_name, created_at FROM contracts '
+                'WHERE user_id = ? AND (created_at, id) > (?, ?) '
+                'ORDER BY created_at ASC, id ASC LIMIT ?'
+            )
+            params = (user_id, after[0], after[1], limit + 1)
+        elif before is not None:
+            query = (
+                'SELECT id, contract_type, contract_name, created_at FROM contracts '
+                'WHERE user_id = ? AND (created_at, id) < (?, ?) '
+                'ORDER BY created_at DESC, id DESC LIMIT ?'
             )
-            row = cursor.fetchone()
-            return json.loads(row[0]) if row else None
+            params = (user_id, before[0], before[1], limit + 1)
+        else:
+            query = (
+                'SELECT id, contract_type, contract_name, created_at FROM contracts '
+                'WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?'
+            )
+            params = (user_id, limit + 1)
+        
+        with self._get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after is not None:
+            rows.reverse()
+        
+        return {
+            'contracts': [{'id': row[0], 'type': row[1], 'name': row[2], 'created_at': row[3]} for row in rows],
+            'has_newer': has_more if after is not None else before is not None,
+            'has_older': True if after is not None else has_more
+        }
+    
+    def get_contract_data(self, contract_id: int, user_id: int) -> Optional[Dict]:
+        """Получение данных конкретного договора (форма восстанавливается из колонок)"""
+        with self._get_connection() as conn:
+            rows = self._load_contracts(conn, 'c.id = ? AND c.user_id = ?', (contract_id, user_id))
+            return rows[0][2] if rows else None
+    
+    def get_party_contracts(self, user_id: int, party_name: str) -> List[Dict]:
+        """Договоры пользователя, в которых сторона участвует в любой роли"""
+        with self._get_connection() as conn:
+            row = conn.execute('SELECT id FROM parties WHERE name = ?', (party_name,)).fetchone()
+            if row is None:
+                return []
+            rows = conn.execute(
+                'SELECT id, contract_type, contract_name, created_at FROM contracts '
+                f'WHERE user_id = ? AND ? IN ({", ".join(PARTY_COLUMNS)}) ORDER BY created_at DESC, id DESC',
+                (user_id, row[0])
+            ).fetchall()
+        return [{'id': row[0], 'type': row[1], 'name': row[2], 'created_at': row[3]} for row in rows]
+    
+    def search_contracts(self, query: str, user_id: Optional[int] = None,
+                         limit: int = 10, offset: int = 0) -> Dict:
+        """
+        Полнотекстовый поиск договоров по словам запроса (с учетом начала слова).
+        Без user_id поиск идет по всем пользователям. По релевантности сортируются
+        SEARCH_CANDIDATES самых новых совпадений
+        """
+        terms = search_terms(query)
+        if not terms:
+            return {'contracts': [], 'has_more': False}
+        
+        match = ' AND '.join(f'{{name parties subject}}: "{term}"*' for term in terms)
+        if user_id is not None:
+            match = f'owner: {_owner_token(user_id)} AND {match}'
+        
+        with self._get_connection() as conn:
+            rows = conn.execute(
+                'SELECT c.id, c.contract_type, c.contract_name, c.created_at, c.user_id '
+                'FROM (SELECT rowid, rank FROM contracts_fts WHERE contracts_fts MATCH ? '
+                'ORDER BY rowid DESC LIMIT ?) f JOIN contracts c ON c.id = f.rowid '
+                'ORDER BY f.rank, c.id DESC LIMIT ? OFFSET ?',
+                (match, SEARCH_CANDIDATES, limit + 1, offset)
+            ).fetchall()
+        
+        contracts = [
+            {'id': row[0], 'type': row[1], 'name': row[2], 'created_at': row[3], 'user_id': row[4]}
+            for row in rows[:limit]
+        ]
+        return {'contracts': contracts, 'has_more': len(rows) > limit}
+    
+    async def asave_contract(self, user_id: int, contract_type: str, contract_name: str, data: Dict) -> int:
+        """Асинхронное сохранение данных договора"""
+        return await self.run(self.save_contract, user_id, contract_type, contract_name, data)
+    
+    async def aget_user_contracts(self, user_id: int) -> List[Dict]:
+        """Асинхронное получение всех договоров пользователя"""
+        return await self.run(self.get_user_contracts, user_id)
+    
+    async def aget_user_contracts_page(self, user_id: int, limit: int = 10,
+                                       before: Optional[Tuple[str, int]] = None,
+                                       after: Optional[Tuple[str, int]] = None) -> Dict:
+        """Асинхронное получение страницы договоров пользователя"""
+        return await self.run(self.get_user_contracts_page, user_id, limit, before, after)
+    
+    async def aget_stats(self, days: int = 7) -> Dict:
+        """Асинхронное получение статистики"""
+        return await self.run(self.get_stats, days)
+    
+    async def aget_contract_data(self, contract_id: int, user_id: int) -> Optional[Dict]:
+        """Асинхронное получение данных конкретного договора"""
+        return await self.run(self.get_contract_data, contract_id, user_id)
+    
+    async def asearch_contracts(self, query: str, user_id: Optional[int] = None,
+                                limit: int = 10, offset: int = 0) -> Dict:
+        """Асинхронный полнотекстовый поиск договоров"""
+        return await self.run(self.search_contracts, query, user_id, limit, offset)
 
 db_manager = DatabaseManager()
-
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _StateRecord:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в SQLite с горячей копией в памяти.
+    Чтения обслуживаются из памяти, изменения накапливаются и записываются
+    одной транзакцией не чаще раза в flush_interval секунд.
+    В памяти остаются не больше cache_size записей: несохраненные и недавно использованные.
+    """
+    
+    def __init__(self, db_path: str, flush_interval: float = 0.05, key_builder: Optional[KeyBuilder] = None,
+                 cache_size: int = 10000):
+        if cache_size <= 0:
+            raise ValueError("Размер кэша FSM должен быть положительным")
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.key_builder = key_builder or DefaultKeyBuilder(
+            with_bot_id=True, with_business_connection_id=True, with_destiny=True
+        )
+        # Порядок записей - от давно использованных к недавним
+        self._cache: OrderedDict[str, _StateRecord] = OrderedDict()
+        self._dirty: set = set()
+        # Записи, которые сейчас пишутся в базу: при ошибке записи они снова станут несохраненными
+        self._flushing: set = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        # Все обращения к файлу базы выполняются в одном потоке
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fsm-storage')
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие соединения в потоке хранилища"""
+        if self._connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            conn = sqlite3.connect(self.db_path, timeout=config.DATABASE_BUSY_TIMEOUT_MS / 1000)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={config.DATABASE_BUSY_TIMEOUT_MS}')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+            self._connection = conn
+        return self._connection
+    
+    def _read(self, key: str) -> _StateRecord:
+        row = self._connect().execute('SELECT state, data FROM fsm_states WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return _StateRecord()
+        return _StateRecord(state=row[0], data=json.loads(row[1]))
+    
+    def _write(self, upserts: List[Tuple[str, Optional[str], str]], deletes: List[Tuple[str]]):
+        conn = self._connect()
+        with conn:
+            if upserts:
+                conn.executemany(
+                    'INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP) '
+                    'ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, '
+                    'updated_at = excluded.updated_at',
+                    upserts
+                )
+            if deletes:
+                conn.executemany('DELETE FROM fsm_states WHERE key = ?', deletes)
+    
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    async def _get_record(self, key: StorageKey) -> Tuple[str, _StateRecord]:
+        """Запись из горячей копии; при промахе загружается из базы"""
+        storage_key = self.key_builder.build(key)
+        record = self._cache.get(storage_key)
+        if record is None:
+            loaded = await self._run(self._read, storage_key)
+            # Пока шла загрузка, запись могла появиться в памяти - она свежее
+            record = self._cache.setdefault(storage_key, loaded)
+            self._evict(keep=storage_key)
+        self._cache.move_to_end(storage_key)
+        return storage_key, record
+    
+    def _evict(self, keep: Optional[str] = None):
+        """Вытеснение давно не использованных сохраненных записей сверх cache_size (кроме keep)"""
+        excess = len(self._cache) - self.cache_size
+        if excess <= 0:
+            return
+        # Несохраненные записи остаются в памяти до записи в базу
+        evicted = []
+        for storage_key in self._cache:
+            if len(evicted) == excess:
+                break
+            if storage_key not in self._dirty and storage_key not in self._flushing and storage_key != keep:
+                evicted.append(storage_key)
+        for storage_key in evicted:
+            del self._cache[storage_key]
+    
+    def _mark_dirty(self, storage_key: str):
+        """Отложенная запись: изменения за интервал сливаются в одну транзакцию"""
+        self._dirty.add(storage_key)
+        if self._flush_handle is None and self._flush_task is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._start_flush)
+    
+    def _start_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self.flush())
+    
+    async def flush(self):
+        """Запись накопленных изменений в базу"""
+        try:
+            while self._dirty:
+                keys, self._dirty = self._dirty, set()
+                upserts = []
+                deletes = []
+                for storage_key in keys:
+                    record = self._cache.get(storage_key)
+                    if record is None or (record.state is None and not record.data):
+                        deletes.append((storage_key,))
+                        # Пустые записи не держим в памяти
+                        self._cache.pop(storage_key, None)
+                    else:
+                        try:
+                            payload = json.dumps(record.data, ensure_ascii=False)
+                        except (TypeError, ValueError) as e:
+                            # Несериализуемые данные одного ключа не мешают записать остальные
+                            logger.error(f"Состояние FSM {storage_key} не сохранено: {e}")
+                            continue
+                        upserts.append((storage_key, record.state, payload))
+                
+                self._flushing = keys
+                try:
+                    await self._run(self._write, upserts, deletes)
+                except Exception as e:
+                    # Изменения остаются в памяти и будут записаны при следующей попытке
+                    logger.error(f"Не удалось сохранить состояние FSM: {e}")
+                    self._dirty.update(keys)
+                    break
+                finally:
+                    self._flushing = set()
+            self._evict()
+        finally:
+            self._flush_task = None
+        
+        if self._dirty and self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._start_flush)
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._get_record(key)
+        return record.state
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key, record = await self._get_record(key)
+        record.data = data.copy()
+        self._mark_dirty(storage_key)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._get_record(key)
+        return record.data.copy()
+    
+    async def get_state_and_data(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Состояние и данные одним чтением"""
+        _, record = await self._get_record(key)
+        return record.state, record.data.copy()
+    
+    async def set_state_and_data(self, key: StorageKey, state: StateType, data: Dict[str, Any]) -> None:
+        """Смена состояния и данных одной операцией: одна запись в памяти и одна строка при сбросе"""
+        storage_key, record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        record.data = data.copy()
+        self._mark_dirty(storage_key)
+    
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
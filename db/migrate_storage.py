@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Перевод базы договоров на компактное нормализованное хранение.
+Миграция выполняется при открытии базы, скрипт дополнительно
+перепаковывает файл и показывает объем данных договоров до и после.
+Запуск: python -m db.migrate_storage
+"""
+
+import os
+import sqlite3
+from typing import Tuple
+
+from config import config
+
+# Таблицы, в которых хранятся сами договоры (до миграции - только contracts)
+CONTRACT_TABLES = ('contracts', 'parties', 'requisites')
+
+def _compact(path: str) -> int:
+    """Перепаковка файла базы; возвращает размер в байтах"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    return os.path.getsize(path)
+
+def _contract_bytes(path: str) -> int:
+    """
+    Место, занятое строками таблиц договоров, по dbstat: без индексов,
+    полнотекстового поиска, статистики и пустого места страниц
+    """
+    conn = sqlite3.connect(path)
+    try:
+        placeholders = ', '.join('?' * len(CONTRACT_TABLES))
+        row = conn.execute(
+            f'SELECT COALESCE(SUM(pgsize - unused), 0) FROM dbstat WHERE name IN ({placeholders})',
+            CONTRACT_TABLES
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0]
+
+def _measure(path: str) -> Tuple[int, int]:
+    """Размер файла после перепаковки и объем данных договоров"""
+    return _compact(path), _contract_bytes(path)
+
+def main():
+    # Размеры до миграции меряем на перепакованном файле, чтобы сравнение было честным
+    file_before, data_before = _measure(config.DATABASE_PATH) if os.path.exists(config.DATABASE_PATH) else (0, 0)
+    
+    # База открывается лениво: миграцию в новую схему запускаем явно
+    from db.database import db_manager
+    db_manager.initialize()
+    stats = db_manager.get_stats()
+    db_manager.close()
+    file_after, data_after = _measure(config.DATABASE_PATH)
+    
+    print(f"✅ База в новом формате: {stats['contracts']} договоров")
+    if data_before:
+        print(f"📦 Данные договоров: {data_before / 1024:.1f} КБ -> {data_after / 1024:.1f} КБ "
+              f"(экономия {(1 - data_after / data_before) * 100:.0f}%)")
+    # Файл целиком растет на индексы, полнотекстовый поиск и статистику - их показываем отдельно
+    print(f"🗂️ Файл базы: {file_before / 1024:.1f} КБ -> {file_after / 1024:.1f} КБ, кроме данных договоров - "
+          f"индексы, поиск, статистика и служебные страницы: {(file_after - data_after) / 1024:.1f} КБ")
+
+if __name__ == '__main__':
+    main()
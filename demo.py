@@ -9,7 +9,7 @@ import os
 from datetime import datetime
 
 # Добавляем путь к проекту
-sys.path.insert(0, '/home/ubuntu/telegram_contract_bot')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from handlers.document_generator import generate_documents
 from db.database import db_manager
@@ -70,7 +70,7 @@ def demo_agent_contract():
         
         print(f"✅ Создано документов: {len(documents)}")
         for doc in documents:
-            print(f"  📄 {os.path.basename(doc)}")
+            print(f"  📄 {doc.filename}")
         
         return True
         
@@ -124,7 +124,7 @@ def demo_delivery_contract():
         
         print(f"✅ Создано документов: {len(documents)}")
         for doc in documents:
-            print(f"  📄 {os.path.basename(doc)}")
+            print(f"  📄 {doc.filename}")
         
         return True
         
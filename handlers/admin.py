@@ -1,12 +1,17 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-import os
-import shutil
+import aiofiles.os
+import re
 
 from config import config
 from db.database import db_manager
+from handlers.common import fit_search_query, search_contracts_page
+from handlers.document_generator import DOCUMENT_FORMATS, document_cache
+from utils.janitor import output_janitor
+from utils import metrics, throttling
+from utils.startup import startup_report
 
 router = Router()
 
@@ -23,12 +28,49 @@ async def admin_command(message: Message):
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+        [InlineKeyboardButton(text="📈 Производительность", callback_data="admin_metrics")],
         [InlineKeyboardButton(text="📁 Управление шаблонами", callback_data="admin_templates")],
         [InlineKeyboardButton(text="🗑️ Очистить выходные файлы", callback_data="admin_cleanup")]
     ])
     
     await message.answer("🔧 Админ-панель:", reply_markup=keyboard)
 
+@router.message(Command("findall"))
+async def admin_find_command(message: Message, command: CommandObject):
+    """Команда /findall <запрос> - поиск по договорам всех пользователей"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет прав администратора.")
+        return
+    
+    query = fit_search_query("findall", command.args or "")
+    if not query:
+        await message.answer("🔎 Укажите, что искать: /findall Ромашка")
+        return
+    
+    result = await search_contracts_page(query, 0, "findall")
+    if result is None:
+        await message.answer(f"🔎 По запросу «{query}» договоров не найдено.")
+        return
+    
+    text, keyboard = result
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.regexp(r'^findall:(\d+):(.+)$').as_("match"))
+async def admin_paginate_search(callback: CallbackQuery, match: re.Match):
+    """Страницы результатов поиска по всем пользователям"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав доступа")
+        return
+    
+    result = await search_contracts_page(match.group(2), int(match.group(1)), "findall")
+    if result is None:
+        await callback.answer("Больше договоров нет")
+        return
+    
+    text, keyboard = result
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
 @router.callback_query(F.data == "admin_stats")
 async def admin_stats(callback: CallbackQuery):
     """Показать статистику использования"""
@@ -36,33 +78,84 @@ async def admin_stats(callback: CallbackQuery):
         await callback.answer("❌ Нет прав доступа")
         return
     
-    # Получаем статистику из базы данных
-    with db_manager._get_connection() as conn:
-        cursor = conn.execute("SELECT COUNT(*) FROM contracts")
-        total_contracts = cursor.fetchone()[0]
-        
-        cursor = conn.execute("SELECT contract_type, COUNT(*) FROM contracts GROUP BY contract_type")
-        type_stats = cursor.fetchall()
-        
-        cursor = conn.execute("SELECT COUNT(DISTINCT user_id) FROM contracts")
-        unique_users = cursor.fetchone()[0]
+    # Счетчики поддерживаются триггерами, запрос не сканирует таблицу договоров
+    stats = await db_manager.aget_stats()
+    
+    type_names = {
+        'agent': 'Агентские',
+        'subagent': 'Субагентские', 
+        'delivery': 'Поставки'
+    }
     
     stats_text = f"📊 Статистика бота:\n\n"
-    stats_text += f"👥 Уникальных пользователей: {unique_users}\n"
-    stats_text += f"📄 Всего договоров: {total_contracts}\n\n"
+    stats_text += f"👥 Уникальных пользователей: {stats['users']}\n"
+    stats_text += f"📄 Всего договоров: {stats['contracts']}\n\n"
     stats_text += "По типам:\n"
     
-    for contract_type, count in type_stats:
-        type_names = {
-            'agent': 'Агентские',
-            'subagent': 'Субагентские', 
-            'delivery': 'Поставки'
-        }
+    for contract_type, count in stats['by_type']:
         stats_text += f"• {type_names.get(contract_type, contract_type)}: {count}\n"
     
+    if stats['daily']:
+        stats_text += "\nЗа последние 7 дней:\n"
+        for day, contract_type, count in stats['daily']:
+            stats_text += f"• {day} — {type_names.get(contract_type, contract_type)}: {count}\n"
+    
+    cache_stats = document_cache.stats()
+    stats_text += "\n🗂️ Кэш документов:\n"
+    stats_text += f"• Попаданий: {cache_stats['hits']}, промахов: {cache_stats['misses']}\n"
+    stats_text += f"• Документов: {cache_stats['items']} ({cache_stats['bytes'] / 1024:.0f} КБ)\n"
+    
     await callback.message.edit_text(stats_text)
     await callback.answer()
 
+@router.callback_query(F.data == "admin_metrics")
+async def admin_metrics(callback: CallbackQuery):
+    """Сводка метрик задержки с момента запуска"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав доступа")
+        return
+    
+    text = "📈 Производительность с момента запуска:\n\n"
+    text += f"📨 Обновлений: {metrics.updates_total.total():.0f}, "
+    text += f"ошибок: {metrics.update_errors_total.total():.0f}, "
+    text += f"в обработке: {metrics.updates_in_flight.total():.0f}\n"
+    
+    if startup_report.first_update_seconds is not None:
+        text += f"🚀 От запуска до первого обновления: {startup_report.first_update_seconds:.1f} с\n"
+    
+    # Самые медленные шаги диалога по p95
+    steps = sorted(metrics.handler_duration.summary(), key=lambda row: row[3], reverse=True)[:5]
+    if steps:
+        text += "\n🐢 Самые медленные шаги (p95):\n"
+        for (handler, state), count, mean, p95 in steps:
+            text += f"• {handler} [{state}]: {p95 * 1000:.0f} мс (среднее {mean * 1000:.0f} мс, {count} раз)\n"
+    
+    renders = metrics.document_render_duration.summary()
+    if renders:
+        text += "\n📄 Рендеринг документов (p95):\n"
+        for (template, fmt), count, mean, p95 in renders:
+            text += f"• {template} ({fmt}): {p95 * 1000:.0f} мс ({count} шт.)\n"
+    
+    hits = sum(metrics.document_cache_requests.value('hit', fmt) for fmt in DOCUMENT_FORMATS)
+    misses = sum(metrics.document_cache_requests.value('miss', fmt) for fmt in DOCUMENT_FORMATS)
+    text += f"\n🗂️ Кэш документов: {hits:.0f} попаданий, {misses:.0f} промахов\n"
+    
+    rejected = {
+        'flood': "частые сообщения",
+        'duplicate': "повторная генерация",
+        'rate': "лимит генераций",
+        'busy': "перегрузка"
+    }
+    text += f"\n🚦 Генераций сейчас: {throttling.generations_in_flight.total():.0f}, отклонено запросов: "
+    text += ", ".join(f"{label} {throttling.throttled_total.value(reason):.0f}" for reason, label in rejected.items())
+    text += "\n"
+    
+    if config.METRICS_PORT:
+        text += f"\n💡 Все метрики: http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics"
+    
+    await callback.message.edit_text(text)
+    await callback.answer()
+
 @router.callback_query(F.data == "admin_templates")
 async def admin_templates(callback: CallbackQuery):
     """Управление шаблонами"""
@@ -71,7 +164,7 @@ async def admin_templates(callback: CallbackQuery):
         return
     
     templates_dir = config.TEMPLATES_PATH
-    templates = os.listdir(templates_dir) if os.path.exists(templates_dir) else []
+    templates = await aiofiles.os.listdir(templates_dir) if await aiofiles.os.path.exists(templates_dir) else []
     
     text = "📁 Шаблоны документов:\n\n"
     if templates:
@@ -92,44 +185,15 @@ async def admin_cleanup(callback: CallbackQuery):
         await callback.answer("❌ Нет прав доступа")
         return
     
-    output_dir = config.OUTPUT_PATH
-    if os.path.exists(output_dir):
-        files = os.listdir(output_dir)
-        for file in files:
-            file_path = os.path.join(output_dir, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-        
-        await callback.message.edit_text(f"🗑️ Удалено {len(files)} файлов из папки output/")
-    else:
+    if not await aiofiles.os.path.exists(config.OUTPUT_PATH):
         await callback.message.edit_text("📁 Папка output/ не найдена")
+        await callback.answer()
+        return
     
-    await callback.answer()
-
-@router.message(Command("help"))
-async def help_command(message: Message):
-    """Команда помощи"""
-    help_text = """
-🤖 Помощь по использованию бота
-
-📋 Основные команды:
-/start - Начать создание договора
-/cancel - Отменить текущий процесс
-/help - Показать эту справку
-
-📝 Типы договоров:
-• Агентское соглашение (+ поручение и акт отчета)
-• Субагентское соглашение (+ поручение и акт отчета)  
-• Договор поставки
-
-💡 Советы:
-• Вводите даты в формате ДД.ММ.ГГГГ
-• Заполняйте все поля подробно
-• Проверяйте данные перед отправкой
-• Используйте /cancel для отмены в любой момент
-
-📞 Поддержка: обратитесь к администратору
-    """
+    # Удаление выполняет фоновая задача очистки, обработчик только ждет ее отчет
+    await callback.answer("🧹 Очистка запущена")
+    report = await output_janitor.trigger(purge_all=True)
     
-    await message.answer(help_text)
-
+    await callback.message.edit_text(
+        f"🗑️ Удалено {report.files} файлов ({report.bytes / 1024:.0f} КБ) из папки output/"
+    )
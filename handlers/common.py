@@ -1,107 +1,213 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 import logging
+import re
 
-from handlers.states import ContractForm
-from db.database import db_manager
+from handlers.document_sender import send_documents
+from handlers.flow import contract_type_keyboard
+from db.database import db_manager, search_terms
+from utils.generation_queue import PRIORITY_REGEN
+from utils.throttling import GENERATION_FLAG
 
 router = Router()
 
+# Количество договоров на одной странице списка "Мои договоры"
+CONTRACTS_PAGE_SIZE = 10
+
+# Ограничение Telegram на размер callback_data в байтах
+CALLBACK_DATA_LIMIT = 64
+
 @router.message(Command("start"))
 async def start_command(message: Message, state: FSMContext):
     """Команда /start - начало работы с ботом"""
     await state.clear()
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🤝 Агентское соглашение", callback_data="agent")],
-        [InlineKeyboardButton(text="👥 Субагентское соглашение", callback_data="subagent")],
-        [InlineKeyboardButton(text="📦 Договор поставки", callback_data="delivery")],
-        [InlineKeyboardButton(text="📋 Мои договоры", callback_data="my_contracts")]
-    ])
-    
     await message.answer(
         "🏢 Добро пожаловать в бот для создания договоров!\n\n"
         "Выберите тип договора, который хотите создать:",
-        reply_markup=keyboard
+        reply_markup=contract_type_keyboard()
     )
 
-@router.callback_query(F.data.in_(["agent", "subagent", "delivery"]))
-async def process_contract_type(callback: CallbackQuery, state: FSMContext):
-    """Обработка выбора типа договора"""
-    contract_type = callback.data
-    await state.update_data(contract_type=contract_type)
-    
-    contract_names = {
-        "agent": "Агентское соглашение",
-        "subagent": "Субагентское соглашение", 
-        "delivery": "Договор поставки"
-    }
-    
-    await callback.message.edit_text(
-        f"📝 Создание: {contract_names[contract_type]}\n\n"
-        "Введите название договора (например: №1, №АС-2024-001):"
-    )
-    await state.set_state(ContractForm.contract_name)
-    await callback.answer()
-
-@router.message(ContractForm.contract_name)
-async def process_contract_name(message: Message, state: FSMContext):
-    """Обработка ввода названия договора"""
-    await state.update_data(contract_name=message.text)
-    await message.answer("📅 Введите дату договора в формате ДД.ММ.ГГГГ:")
-    await state.set_state(ContractForm.contract_date)
-
-@router.message(ContractForm.contract_date)
-async def process_contract_date(message: Message, state: FSMContext):
-    """Обработка и валидация даты договора"""
-    try:
-        datetime.strptime(message.text, "%d.%m.%Y")
-        await state.update_data(contract_date=message.text)
-        
-        user_data = await state.get_data()
-        contract_type = user_data["contract_type"]
-        
-        if contract_type == "agent":
-            await message.answer("👤 Введите название/ФИО Агента:")
-            await state.set_state(ContractForm.agent_name)
-        elif contract_type == "subagent":
-            await message.answer("👤 Введите название/ФИО Агента:")
-            await state.set_state(ContractForm.agent_name)
-        else:  # delivery
-            await message.answer("🏭 Введите название/ФИО Поставщика:")
-            await state.set_state(ContractForm.supplier_name)
-            
-    except ValueError:
-        await message.answer("❌ Неверный формат даты! Введите в формате ДД.ММ.ГГГГ (например: 01.01.2025):")
-
 @router.message(Command("cancel"))
 async def cancel_command(message: Message, state: FSMContext):
     """Команда отмены процесса заполнения"""
     await state.clear()
     await message.answer("❌ Процесс заполнения отменен. Начните заново с /start")
 
+def _encode_cursor(contract: Dict) -> str:
+    """Курсор для callback_data: дата создания без разделителей и id"""
+    timestamp = re.sub(r'\D', '', contract['created_at'])
+    return f"{timestamp}:{contract['id']}"
+
+def _decode_cursor(timestamp: str, contract_id: str) -> Tuple[str, int]:
+    created_at = datetime.strptime(timestamp, "%Y%m%d%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+    return created_at, int(contract_id)
+
+def _regen_buttons(contracts: List[Dict]) -> List[List[InlineKeyboardButton]]:
+    """Кнопки повторной выдачи документов (DOCX или PDF) для каждого договора"""
+    return [
+        [
+            InlineKeyboardButton(text=f"📄 {contract['name'][:30]}", callback_data=f"regen:{contract['id']}"),
+            InlineKeyboardButton(text="📑 PDF", callback_data=f"regen:{contract['id']}:pdf")
+        ]
+        for contract in contracts
+    ]
+
+async def _show_contracts_page(callback: CallbackQuery, page: Dict):
+    """Вывод страницы договоров с кнопками навигации"""
+    text = "📋 Ваши договоры:\n\n"
+    for contract in page['contracts']:
+        text += f"• {contract['name']} ({contract['type']})\n"
+        text += f"  Создан: {contract['created_at'][:16]}\n\n"
+    
+    text += "🔎 Поиск по договорам: /find <запрос>\n"
+    
+    inline_keyboard = _regen_buttons(page['contracts'])
+    
+    navigation = []
+    if page['has_newer']:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Новее", callback_data=f"contracts_newer:{_encode_cursor(page['contracts'][0])}"
+        ))
+    if page['has_older']:
+        navigation.append(InlineKeyboardButton(
+            text="Старее ➡️", callback_data=f"contracts_older:{_encode_cursor(page['contracts'][-1])}"
+        ))
+    
+    if navigation:
+        inline_keyboard.append(navigation)
+    inline_keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")])
+    
+    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=inline_keyboard))
+    await callback.answer()
+
 @router.callback_query(F.data == "my_contracts")
 async def show_user_contracts(callback: CallbackQuery):
     """Показать договоры пользователя"""
     user_id = callback.from_user.id
-    contracts = db_manager.get_user_contracts(user_id)
+    page = await db_manager.aget_user_contracts_page(user_id, limit=CONTRACTS_PAGE_SIZE)
     
-    if not contracts:
+    if not page['contracts']:
         await callback.message.edit_text("📋 У вас пока нет созданных договоров.")
         return
     
-    text = "📋 Ваши договоры:\n\n"
-    for contract in contracts[:10]:  # Показываем последние 10
+    await _show_contracts_page(callback, page)
+
+@router.callback_query(F.data.regexp(r'^contracts_(older|newer):(\d{14}):(\d+)$').as_("match"))
+async def paginate_user_contracts(callback: CallbackQuery, match: re.Match):
+    """Переход между страницами договоров пользователя"""
+    direction, timestamp, contract_id = match.groups()
+    cursor = _decode_cursor(timestamp, contract_id)
+    
+    if direction == "older":
+        page = await db_manager.aget_user_contracts_page(callback.from_user.id, limit=CONTRACTS_PAGE_SIZE, before=cursor)
+    else:
+        page = await db_manager.aget_user_contracts_page(callback.from_user.id, limit=CONTRACTS_PAGE_SIZE, after=cursor)
+    
+    if not page['contracts']:
+        await callback.answer("Больше договоров нет")
+        return
+    
+    await _show_contracts_page(callback, page)
+
+@router.callback_query(F.data.regexp(r'^regen:(\d+)(?::(docx|pdf))?$').as_("match"), flags={GENERATION_FLAG: True})
+async def regenerate_contract(callback: CallbackQuery, match: re.Match):
+    """Повторная выдача документов сохраненного договора в выбранном формате"""
+    user_id = callback.from_user.id
+    data = await db_manager.aget_contract_data(int(match.group(1)), user_id)
+    
+    if data is None:
+        await callback.answer("❌ Договор не найден")
+        return
+    
+    await callback.answer("⏳ Готовлю документы...")
+    
+    try:
+        failed, _ = await send_documents(
+            callback.message, data, user_id, save=False, fmt=match.group(2) or 'docx', priority=PRIORITY_REGEN
+        )
+        if failed:
+            await callback.message.answer("⚠️ Часть документов не сформирована.")
+    except Exception as e:
+        await callback.message.answer(f"❌ Ошибка при генерации документов: {str(e)}")
+
+def fit_search_query(prefix: str, text: str) -> str:
+    """
+    Нормализованный запрос, который помещается в callback_data кнопок страниц
+    вида "<prefix>:<смещение>:<запрос>"; лишние слова в конце отбрасываются
+    """
+    query = ''
+    for term in search_terms(text):
+        candidate = f"{query} {term}".strip()
+        # Запас в 4 цифры под смещение страницы
+        if len(f"{prefix}:0000:{candidate}".encode('utf-8')) > CALLBACK_DATA_LIMIT:
+            break
+        query = candidate
+    return query
+
+def render_search_page(page: Dict, query: str, offset: int, prefix: str,
+                       show_owner: bool = False) -> Tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура страницы результатов поиска"""
+    text = f"🔎 Поиск: «{query}»\n\n"
+    for contract in page['contracts']:
         text += f"• {contract['name']} ({contract['type']})\n"
-        text += f"  Создан: {contract['created_at'][:16]}\n\n"
+        text += f"  Создан: {contract['created_at'][:16]}"
+        text += f", пользователь {contract['user_id']}\n\n" if show_owner else "\n\n"
+    
+    # Чужие договоры админ не выгружает: данные договора доступны только владельцу
+    inline_keyboard = [] if show_owner else _regen_buttons(page['contracts'])
+    
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=f"{prefix}:{max(offset - CONTRACTS_PAGE_SIZE, 0)}:{query}"
+        ))
+    if page['has_more']:
+        navigation.append(InlineKeyboardButton(
+            text="Дальше ➡️", callback_data=f"{prefix}:{offset + CONTRACTS_PAGE_SIZE}:{query}"
+        ))
+    if navigation:
+        inline_keyboard.append(navigation)
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")]
-    ])
+    return text, InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+async def search_contracts_page(query: str, offset: int, prefix: str,
+                                user_id: Optional[int] = None) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Страница результатов поиска; None, если ничего не найдено"""
+    page = await db_manager.asearch_contracts(query, user_id, limit=CONTRACTS_PAGE_SIZE, offset=offset)
+    if not page['contracts']:
+        return None
+    return render_search_page(page, query, offset, prefix, show_owner=user_id is None)
+
+@router.message(Command("find"))
+async def find_command(message: Message, command: CommandObject):
+    """Команда /find <запрос> - поиск по своим договорам"""
+    query = fit_search_query("find", command.args or "")
+    if not query:
+        await message.answer("🔎 Укажите, что искать: название договора, сторону или предмет.\nНапример: /find Ромашка")
+        return
     
+    result = await search_contracts_page(query, 0, "find", user_id=message.from_user.id)
+    if result is None:
+        await message.answer(f"🔎 По запросу «{query}» договоров не найдено.")
+        return
+    
+    text, keyboard = result
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.regexp(r'^find:(\d+):(.+)$').as_("match"))
+async def paginate_search(callback: CallbackQuery, match: re.Match):
+    """Переход между страницами результатов поиска"""
+    result = await search_contracts_page(match.group(2), int(match.group(1)), "find", user_id=callback.from_user.id)
+    if result is None:
+        await callback.answer("Больше договоров нет")
+        return
+    
+    text, keyboard = result
     await callback.message.edit_text(text, reply_markup=keyboard)
     await callback.answer()
 
@@ -110,16 +216,9 @@ async def back_to_main(callback: CallbackQuery, state: FSMContext):
     """Возврат в главное меню"""
     await state.clear()
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🤝 Агентское соглашение", callback_data="agent")],
-        [InlineKeyboardButton(text="👥 Субагентское соглашение", callback_data="subagent")],
-        [InlineKeyboardButton(text="📦 Договор поставки", callback_data="delivery")],
-        [InlineKeyboardButton(text="📋 Мои договоры", callback_data="my_contracts")]
-    ])
-    
     await callback.message.edit_text(
         "🏢 Выберите тип договора, который хотите создать:",
-        reply_markup=keyboard
+        reply_markup=contract_type_keyboard()
     )
     await callback.answer()
 
@@ -1,19 +1,226 @@
+import io
 import os
+import hashlib
+import re
+import asyncio
+import functools
 import shutil
-from typing import Dict, List
-from docx import Document
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
+import aiofiles
+import aiofiles.os
 from datetime import datetime
 
 from config import config
 from db.database import db_manager
+from handlers.states import ContractForm
+from utils.worker_pool import WorkerPool
+from utils.document_cache import DocumentCache
+from utils.metrics import document_cache_requests, document_render_duration, document_wait_duration
+
+if TYPE_CHECKING:
+    from docx.document import Document
+
+logger = logging.getLogger(__name__)
+
+# Плейсхолдер вида {field_name}; всё остальное в фигурных скобках считается ошибкой шаблона
+PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+BROKEN_PLACEHOLDER_RE = re.compile(r'\{[^{}\n]*\}?|\}')
+
+# Символы, недопустимые в имени файла (разделители путей, управляющие и запрещенные в Windows)
+UNSAFE_FILENAME_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+# Поля, которые может заполнить пользователь (по состояниям ContractForm)
+KNOWN_FIELDS = frozenset(
+    state.state.split(':', 1)[1] for state in ContractForm.__all_states__
+)
+
+# Версия алгоритма построения .docx; меняется вместе с render_document, чтобы сбросить кэш
+RENDER_VERSION = '1'
+
+# Форматы выдачи документов; PDF строится только по запросу пользователя
+DOCUMENT_FORMATS = ('docx', 'pdf')
+
+# Комплекты документов по типам договоров: (шаблон, префикс имени файла)
+DOCUMENT_BUNDLES = {
+    'agent': (
+        ('agent_template.docx', 'agent'),
+        ('agent_assignment_template.docx', 'agent_assignment'),
+        ('agent_report_template.docx', 'agent_report'),
+    ),
+    'subagent': (
+        ('subagent_template.docx', 'subagent'),
+        ('subagent_assignment_template.docx', 'subagent_assignment'),
+        ('subagent_report_template.docx', 'subagent_report'),
+    ),
+    'delivery': (
+        ('delivery_template.docx', 'delivery'),
+    ),
+}
+
+def safe_filename_part(text: str, default: str = 'contract') -> str:
+    """Часть имени файла из пользовательского текста: без разделителей путей и '..'"""
+    cleaned = UNSAFE_FILENAME_RE.sub('_', text).replace('..', '_').strip(' .')
+    return cleaned or default
+
+class TemplateError(ValueError):
+    """Ошибка в шаблоне документа или в данных для него"""
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """Шаблон, разобранный на литералы и слоты плейсхолдеров"""
+    name: str
+    literals: Tuple[str, ...]
+    slots: Tuple[str, ...]
+    mtime_ns: int
+    size: int
+    digest: str
+    
+    @property
+    def placeholders(self) -> frozenset:
+        return frozenset(self.slots)
+    
+    def render(self, data: Dict) -> str:
+        """Подстановка данных за один проход"""
+        missing = [slot for slot in self.placeholders if slot not in data]
+        if missing:
+            raise TemplateError(
+                f"Для шаблона {self.name} не заполнены поля: {', '.join(sorted(missing))}"
+            )
+        
+        parts = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            parts.append(str(data[slot]))
+            parts.append(literal)
+        return ''.join(parts)
+
+def compile_template(name: str, content: str, mtime_ns: int = 0, size: int = 0) -> CompiledTemplate:
+    """Разбор текста шаблона на литералы и плейсхолдеры"""
+    literals = []
+    slots = []
+    position = 0
+    
+    for match in PLACEHOLDER_RE.finditer(content):
+        literals.append(content[position:match.start()])
+        slots.append(match.group(1))
+        position = match.end()
+    literals.append(content[position:])
+    
+    # Незакрытые или нераспознанные скобки остались бы в документе как есть
+    broken = [m.group(0) for literal in literals for m in BROKEN_PLACEHOLDER_RE.finditer(literal)]
+    if broken:
+        raise TemplateError(f"Шаблон {name}: некорректные плейсхолдеры {', '.join(broken)}")
+    
+    unknown = sorted(set(slots) - KNOWN_FIELDS)
+    if unknown:
+        raise TemplateError(f"Шаблон {name}: неизвестные плейсхолдеры {', '.join(unknown)}")
+    
+    return CompiledTemplate(
+        name=name,
+        literals=tuple(literals),
+        slots=tuple(slots),
+        mtime_ns=mtime_ns,
+        size=size,
+        digest=hashlib.sha256(content.encode('utf-8')).hexdigest()
+    )
+
+@dataclass(frozen=True)
+class GeneratedDocument:
+    """Готовый документ в памяти"""
+    filename: str
+    content: bytes
 
 class DocumentGenerator:
     def __init__(self):
         self.templates_path = config.TEMPLATES_PATH
         self.output_path = config.OUTPUT_PATH
-        os.makedirs(self.output_path, exist_ok=True)
+        self._templates: Dict[str, CompiledTemplate] = {}
+        self._templates_lock = threading.Lock()
+        self._output_ready = False
     
-    def _replace_placeholders(self, doc: Document, data: Dict) -> Document:
+    def ensure_output_dir(self) -> str:
+        """Папка output/ создается при запуске бота или перед первой записью, а не при импорте"""
+        if not self._output_ready:
+            os.makedirs(self.output_path, exist_ok=True)
+            self._output_ready = True
+        return self.output_path
+    
+    def _cached_template(self, template_name: str, stat: os.stat_result) -> Optional[CompiledTemplate]:
+        """Шаблон из кэша, если файл не менялся с момента компиляции"""
+        cached = self._templates.get(template_name)
+        if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+            return cached
+        return None
+    
+    def _store_template(self, template_name: str, content: str, stat: os.stat_result) -> CompiledTemplate:
+        compiled = compile_template(template_name, content, stat.st_mtime_ns, stat.st_size)
+        with self._templates_lock:
+            self._templates[template_name] = compiled
+        logger.info(f"Шаблон {template_name} скомпилирован: {len(compiled.slots)} плейсхолдеров")
+        return compiled
+    
+    def get_template(self, template_name: str) -> CompiledTemplate:
+        """Скомпилированный шаблон из кэша; перекомпилируется при изменении файла"""
+        template_path = os.path.join(self.templates_path, template_name)
+        
+        try:
+            stat = os.stat(template_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Шаблон {template_name} не найден")
+        
+        cached = self._cached_template(template_name, stat)
+        if cached:
+            return cached
+        
+        with open(template_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return self._store_template(template_name, content, stat)
+    
+    async def aget_template(self, template_name: str) -> CompiledTemplate:
+        """То же, что get_template, без блокирующих файловых операций в event loop"""
+        template_path = os.path.join(self.templates_path, template_name)
+        
+        try:
+            stat = await aiofiles.os.stat(template_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Шаблон {template_name} не найден")
+        
+        cached = self._cached_template(template_name, stat)
+        if cached:
+            return cached
+        
+        async with aiofiles.open(template_path, 'r', encoding='utf-8') as f:
+            content = await f.read()
+        return self._store_template(template_name, content, stat)
+    
+    def warm_up(self) -> int:
+        """Предварительная компиляция всех шаблонов при запуске"""
+        if not os.path.isdir(self.templates_path):
+            return 0
+        
+        count = 0
+        for template_name in sorted(os.listdir(self.templates_path)):
+            if os.path.isfile(os.path.join(self.templates_path, template_name)):
+                self.get_template(template_name)
+                count += 1
+        return count
+    
+    async def awarm_up(self) -> int:
+        """Предварительная компиляция всех шаблонов из event loop"""
+        if not await aiofiles.os.path.isdir(self.templates_path):
+            return 0
+        
+        count = 0
+        for template_name in sorted(await aiofiles.os.listdir(self.templates_path)):
+            if await aiofiles.os.path.isfile(os.path.join(self.templates_path, template_name)):
+                await self.aget_template(template_name)
+                count += 1
+        return count
+    
+    def _replace_placeholders(self, doc: 'Document', data: Dict) -> 'Document':
         """Замена плейсхолдеров в документе"""
         # Замена в параграфах
         for paragraph in doc.paragraphs:
@@ -31,137 +238,234 @@ class DocumentGenerator:
         
         return doc
     
-    def _generate_single_document(self, template_name: str, data: Dict, output_name: str) -> str:
-        """Генерация одного документа"""
-        template_path = os.path.join(self.templates_path, template_name)
-        output_path = os.path.join(self.output_path, output_name)
+    def document_key(self, template: CompiledTemplate, data: Dict, fmt: str = 'docx') -> str:
+        """
+        Ключ кэша документа: формат, версия шаблона и значения только тех полей,
+        которые в него подставляются
+        """
+        key = hashlib.sha256()
+        key.update(f"{RENDER_VERSION}\0{fmt}\0{template.digest}\0".encode('utf-8'))
+        for slot in sorted(template.placeholders):
+            key.update(f"{slot}\0{data.get(slot)}\0".encode('utf-8'))
+        if fmt == 'pdf':
+            # Заголовок записывается в метаданные PDF и тоже входит в документ
+            key.update(f"title\0{self.document_title(template, data)}\0".encode('utf-8'))
+        return key.hexdigest()
+    
+    def document_title(self, template: CompiledTemplate, data: Dict) -> str:
+        """Заголовок документа: шаблон и название договора, без метки времени из имени файла"""
+        stem = os.path.splitext(template.name)[0]
+        return f"{stem} {data.get('contract_name', '')}".strip()
+    
+    def render_document(self, template_name: str, data: Dict, filename: str, fmt: str = 'docx') -> GeneratedDocument:
+        """Генерация одного документа в памяти"""
+        # Заменяем плейсхолдеры в скомпилированном шаблоне
+        template = self.get_template(template_name)
+        template_content = template.render(data)
         
-        if not os.path.exists(template_path):
-            raise FileNotFoundError(f"Шаблон {template_name} не найден")
+        if fmt == 'pdf':
+            return self._render_pdf(template_content, filename, self.document_title(template, data))
+        
+        # python-docx загружается при первом рендеринге DOCX, а не при импорте модуля
+        from docx import Document
         
         # Создаем новый документ на основе шаблона
         doc = Document()
         
-        # Читаем содержимое шаблона как текст и создаем параграфы
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
-        
-        # Заменяем плейсхолдеры
-        for key, value in data.items():
-            template_content = template_content.replace(f"{{{key}}}", str(value))
-        
         # Добавляем содержимое в документ
         for line in template_content.split('\n'):
             if line.strip():
                 doc.add_paragraph(line)
         
-        doc.save(output_path)
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        return GeneratedDocument(filename=filename, content=buffer.getvalue())
+    
+    def _render_pdf(self, text: str, filename: str, title: str) -> GeneratedDocument:
+        """PDF из текста скомпилированного шаблона, без офисного пакета"""
+        # Модуль PDF и шрифт загружаются только при первом запросе PDF
+        from utils.pdf_writer import render_pdf
+        
+        content = render_pdf(text, config.PDF_FONT_PATH, title=title)
+        return GeneratedDocument(filename=filename, content=content)
+    
+    def bundle_files(self, contract_type: str, data: Dict, fmt: str = 'docx') -> List[Tuple[str, str]]:
+        """Список (шаблон, имя файла) для комплекта документов"""
+        if contract_type not in DOCUMENT_BUNDLES:
+            raise ValueError(f"Неизвестный тип договора: {contract_type}")
+        if fmt not in DOCUMENT_FORMATS:
+            raise ValueError(f"Неизвестный формат документа: {fmt}")
+        
+        # Название договора вводит пользователь: "№ 1/2025" не должно превращаться в путь
+        contract_name = safe_filename_part(str(data.get('contract_name', '')))
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        return [
+            (template_name, f"{prefix}_{contract_name}_{timestamp}.{fmt}")
+            for template_name, prefix in DOCUMENT_BUNDLES[contract_type]
+        ]
+    
+    def render_bundle(self, contract_type: str, data: Dict, fmt: str = 'docx') -> List[GeneratedDocument]:
+        """Генерация комплекта документов для типа договора в памяти"""
+        return [
+            self.render_document(template_name, data, filename, fmt)
+            for template_name, filename in self.bundle_files(contract_type, data, fmt)
+        ]
+    
+    def save_document(self, document: GeneratedDocument) -> str:
+        """Сохранение готового документа в папку output/"""
+        output_path = os.path.join(self.ensure_output_dir(), document.filename)
+        with open(output_path, 'wb') as f:
+            f.write(document.content)
         return output_path
     
+    def _generate_single_document(self, template_name: str, data: Dict, output_name: str) -> str:
+        """Генерация одного документа"""
+        return self.save_document(self.render_document(template_name, data, output_name))
+    
     def generate_agent_documents(self, data: Dict, user_id: int) -> List[str]:
         """Генерация документов для агентского соглашения"""
-        contract_name = data.get('contract_name', 'contract')
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        documents = []
-        
-        # Основной договор
-        main_doc = self._generate_single_document(
-            'agent_template.docx',
-            data,
-            f"agent_{contract_name}_{timestamp}.docx"
-        )
-        documents.append(main_doc)
-        
-        # Поручение
-        assignment_doc = self._generate_single_document(
-            'agent_assignment_template.docx',
-            data,
-            f"agent_assignment_{contract_name}_{timestamp}.docx"
-        )
-        documents.append(assignment_doc)
-        
-        # Акт отчета
-        report_doc = self._generate_single_document(
-            'agent_report_template.docx',
-            data,
-            f"agent_report_{contract_name}_{timestamp}.docx"
-        )
-        documents.append(report_doc)
-        
-        return documents
+        return [self.save_document(document) for document in self.render_bundle('agent', data)]
     
     def generate_subagent_documents(self, data: Dict, user_id: int) -> List[str]:
         """Генерация документов для субагентского соглашения"""
-        contract_name = data.get('contract_name', 'contract')
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        documents = []
-        
-        # Основной договор
-        main_doc = self._generate_single_document(
-            'subagent_template.docx',
-            data,
-            f"subagent_{contract_name}_{timestamp}.docx"
-        )
-        documents.append(main_doc)
-        
-        # Поручение
-        assignment_doc = self._generate_single_document(
-            'subagent_assignment_template.docx',
-            data,
-            f"subagent_assignment_{contract_name}_{timestamp}.docx"
-        )
-        documents.append(assignment_doc)
-        
-        # Акт отчета
-        report_doc = self._generate_single_document(
-            'subagent_report_template.docx',
-            data,
-            f"subagent_report_{contract_name}_{timestamp}.docx"
-        )
-        documents.append(report_doc)
-        
-        return documents
+        return [self.save_document(document) for document in self.render_bundle('subagent', data)]
     
     def generate_delivery_documents(self, data: Dict, user_id: int) -> List[str]:
         """Генерация документов для договора поставки"""
-        contract_name = data.get('contract_name', 'contract')
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        documents = []
-        
-        # Основной договор
-        main_doc = self._generate_single_document(
-            'delivery_template.docx',
-            data,
-            f"delivery_{contract_name}_{timestamp}.docx"
-        )
-        documents.append(main_doc)
-        
-        return documents
+        return [self.save_document(document) for document in self.render_bundle('delivery', data)]
 
 document_generator = DocumentGenerator()
 
-async def generate_documents(data: Dict, user_id: int) -> List[str]:
-    """Основная функция генерации документов"""
+generation_pool = WorkerPool(
+    workers=config.GENERATION_WORKERS,
+    queue_size=config.GENERATION_QUEUE_SIZE,
+    kind=config.GENERATION_EXECUTOR
+)
+
+# Готовые документы по хэшу (версия шаблона, данные); используется только из event loop
+document_cache = DocumentCache(
+    max_items=config.DOCUMENT_CACHE_MAX_ITEMS,
+    max_bytes=config.DOCUMENT_CACHE_MAX_MB * 1024 * 1024
+)
+
+# Фоновые задачи сохранения на диск (храним ссылки, чтобы задачи не собрал GC)
+_persist_tasks = set()
+
+@dataclass(frozen=True)
+class DocumentResult:
+    """Результат генерации одного документа из комплекта"""
+    filename: str
+    document: Optional[GeneratedDocument] = None
+    error: Optional[Exception] = None
+    contract_id: Optional[int] = None
+
+def _render_document(template_name: str, data: Dict, filename: str,
+                     fmt: str = 'docx') -> Tuple[GeneratedDocument, float]:
+    """
+    Рендеринг одного документа (выполняется в пуле, в том числе в дочернем процессе).
+    Время рендеринга измеряется в воркере и возвращается вместе с документом.
+    """
+    started = time.perf_counter()
+    document = document_generator.render_document(template_name, data, filename, fmt)
+    return document, time.perf_counter() - started
+
+async def persist_documents(documents: List[GeneratedDocument]) -> List[str]:
+    """Асинхронное сохранение готовых документов в папку output/"""
+    paths = []
+    for document in documents:
+        output_path = os.path.join(document_generator.ensure_output_dir(), document.filename)
+        async with aiofiles.open(output_path, 'wb') as f:
+            await f.write(document.content)
+        paths.append(output_path)
+    return paths
+
+def _log_persist_result(task: asyncio.Task):
+    _persist_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Не удалось сохранить документы на диск: {task.exception()}")
+
+def _schedule_persist(documents: List[GeneratedDocument]):
+    """Копия на диске не нужна для отправки, поэтому пишем ее в фоне"""
+    task = asyncio.create_task(persist_documents(documents))
+    _persist_tasks.add(task)
+    task.add_done_callback(_log_persist_result)
+
+async def iter_documents(data: Dict, user_id: int, save: bool = True,
+                         fmt: str = 'docx') -> AsyncIterator[DocumentResult]:
+    """
+    Генерация комплекта документов с параллельным рендерингом.
+    Результаты выдаются в порядке комплекта по мере готовности;
+    ошибка одного документа не отменяет остальные.
+    save=False - повторная выдача сохраненного договора без новой записи в базе.
+    fmt - формат документов ('docx' или 'pdf'), у каждого формата свой кэш.
+    """
     contract_type = data.get('contract_type')
+    files = document_generator.bundle_files(contract_type, data, fmt)
     
-    # Сохраняем данные в базу
-    db_manager.save_contract(
-        user_id=user_id,
-        contract_type=contract_type,
-        contract_name=data.get('contract_name', ''),
-        data=data
-    )
+    # Повторные запросы с теми же данными обслуживаются из кэша без рендеринга
+    templates = [await document_generator.aget_template(template_name) for template_name, _ in files]
+    keys = [document_generator.document_key(template, data, fmt) for template in templates]
+    cached = [document_cache.get(key) for key in keys]
+    for content in cached:
+        document_cache_requests.inc('miss' if content is None else 'hit', fmt)
+    
+    # Остальные документы комплекта рендерятся одновременно.
+    # Пул принимает порцию целиком или отказывает (PoolOverloadedError) - до записи в базу,
+    # чтобы повторный запрос после отказа не создавал дубликат договора
+    submitted = time.perf_counter()
+    rendering = generation_pool.submit(*(
+        functools.partial(_render_document, template_name, data, filename, fmt)
+        for (template_name, filename), content in zip(files, cached)
+        if content is None
+    ))
+    futures = iter(rendering)
     
-    # Генерируем документы
-    if contract_type == 'agent':
-        return document_generator.generate_agent_documents(data, user_id)
-    elif contract_type == 'subagent':
-        return document_generator.generate_subagent_documents(data, user_id)
-    elif contract_type == 'delivery':
-        return document_generator.generate_delivery_documents(data, user_id)
-    else:
-        raise ValueError(f"Неизвестный тип договора: {contract_type}")
+    try:
+        # Сохраняем данные в базу
+        contract_id = None
+        if save:
+            contract_id = await db_manager.asave_contract(
+                user_id=user_id,
+                contract_type=contract_type,
+                contract_name=data.get('contract_name', ''),
+                data=data
+            )
+        
+        for (template_name, filename), key, content in zip(files, keys, cached):
+            if content is not None:
+                yield DocumentResult(
+                    filename=filename,
+                    document=GeneratedDocument(filename=filename, content=content),
+                    contract_id=contract_id
+                )
+                continue
+            
+            try:
+                document, render_seconds = await next(futures)
+            except Exception as e:
+                logger.error(f"Ошибка генерации {filename}: {e}")
+                yield DocumentResult(filename=filename, error=e, contract_id=contract_id)
+                continue
+            
+            document_render_duration.observe(render_seconds, template_name, fmt)
+            document_wait_duration.observe(time.perf_counter() - submitted, template_name, fmt)
+            document_cache.put(key, document.content)
+            if config.SAVE_OUTPUT_FILES:
+                _schedule_persist([document])
+            yield DocumentResult(filename=filename, document=document, contract_id=contract_id)
+    finally:
+        # Ошибка записи в базу или прерванная выдача: невостребованный рендеринг отменяем,
+        # а ошибки уже завершенного забираем, чтобы они не попали в лог как необработанные
+        for future in rendering:
+            if not future.cancel() and not future.cancelled():
+                future.exception()
 
+async def generate_documents(data: Dict, user_id: int) -> List[GeneratedDocument]:
+    """Основная функция генерации документов"""
+    documents = []
+    async for result in iter_documents(data, user_id):
+        if result.error:
+            raise result.error
+        documents.append(result.document)
+    return documents
@@ -0,0 +1,77 @@
+import asyncio
+import functools
+import logging
+from typing import Dict, Optional, Tuple
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message, BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+
+from handlers.document_generator import iter_documents
+from utils.generation_queue import PRIORITY_NEW, generation_queue
+
+logger = logging.getLogger(__name__)
+
+# Как часто обновлять место в очереди в статусном сообщении, в секундах
+QUEUE_POSITION_REFRESH = 2.0
+
+def pdf_keyboard(contract_id: Optional[int]) -> Optional[InlineKeyboardMarkup]:
+    """Кнопка получения того же договора в PDF"""
+    if contract_id is None:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📑 Получить в PDF", callback_data=f"regen:{contract_id}:pdf")]
+    ])
+
+def _status_text(position: int) -> str:
+    if position:
+        return f"🕒 Вы в очереди: {position}-й. Документы начнут готовиться автоматически."
+    return "⏳ Генерирую документы..."
+
+async def _stream_documents(message: Message, data: Dict, user_id: int, save: bool,
+                            fmt: str) -> Tuple[int, Optional[int]]:
+    """Генерация и отправка документов по мере готовности (выполняется воркером очереди)"""
+    failed = 0
+    contract_id = None
+    
+    async for result in iter_documents(data, user_id, save=save, fmt=fmt):
+        contract_id = result.contract_id
+        if result.document:
+            await message.answer_document(
+                document=BufferedInputFile(result.document.content, filename=result.document.filename)
+            )
+        else:
+            failed += 1
+            await message.answer(f"❌ Не удалось сформировать {result.filename}: {result.error}")
+    
+    return failed, contract_id
+
+async def send_documents(message: Message, data: Dict, user_id: int, save: bool = True,
+                         fmt: str = 'docx', priority: int = PRIORITY_NEW) -> Tuple[int, Optional[int]]:
+    """
+    Генерация и отправка комплекта документов через очередь генерации.
+    Пока задача ждет, статусное сообщение показывает место в очереди.
+    Возвращает количество документов, которые не удалось сформировать,
+    и номер сохраненного договора (при save=True).
+    """
+    job = generation_queue.submit(
+        functools.partial(_stream_documents, message, data, user_id, save, fmt),
+        priority=priority
+    )
+    
+    position = generation_queue.position(job)
+    status = await message.answer(_status_text(position))
+    
+    while not job.dequeued.is_set():
+        try:
+            await asyncio.wait_for(job.dequeued.wait(), timeout=QUEUE_POSITION_REFRESH)
+        except asyncio.TimeoutError:
+            pass
+        
+        current = generation_queue.position(job)
+        if current != position:
+            position = current
+            try:
+                await status.edit_text(_status_text(position))
+            except TelegramAPIError as e:
+                logger.debug(f"Не удалось обновить статус очереди: {e}")
+    
+    return await job.future
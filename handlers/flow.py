@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from aiogram import Router, F
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from handlers.document_generator import DOCUMENT_BUNDLES
+from handlers.document_sender import pdf_keyboard, send_documents
+from handlers.states import ContractForm
+from utils.generation_queue import QueueFullError
+from utils.throttling import GENERATION_FLAG
+from utils.validator import CONTRACT_SCHEMAS, FieldCheck, validator
+from utils.worker_pool import PoolOverloadedError
+
+router = Router()
+
+@dataclass(frozen=True)
+class FlowStep:
+    """Шаг диалога: поле договора и вопрос пользователю; ответ проверяется по схеме типа договора"""
+    field: str
+    prompt: str
+
+@dataclass(frozen=True)
+class ContractFlow:
+    """Диалог заполнения одного типа договора"""
+    contract_type: str
+    title: str
+    button: str
+    steps: Tuple[FlowStep, ...]
+    done_text: str
+
+@dataclass(frozen=True)
+class Transition:
+    """Скомпилированный шаг: как проверить ответ, что сохранить и куда перейти"""
+    flow: ContractFlow
+    step: FlowStep
+    check: FieldCheck
+    next_state: Optional[str] = None
+    next_prompt: Optional[str] = None
+
+# Общее начало всех договоров
+COMMON_STEPS = (
+    FlowStep('contract_name', "Введите название договора (например: №1, №АС-2024-001):"),
+    FlowStep('contract_date', "📅 Введите дату договора в формате ДД.ММ.ГГГГ:"),
+)
+
+AGENT_NAME = FlowStep('agent_name', "👤 Введите название/ФИО Агента:")
+PRINCIPAL_NAME = FlowStep('principal_name', "🏢 Введите название/ФИО Принципала:")
+REWARD = FlowStep('reward', "💰 Введите размер вознаграждения:")
+REQUISITES = FlowStep('requisites', "🏦 Введите реквизиты сторон:")
+ASSIGNMENT_DETAILS = FlowStep('assignment_details', "📝 Введите детали поручения:")
+REPORT_DETAILS = FlowStep('report_details', "📊 Введите детали для акта отчета:")
+
+# Диалоги по типам договоров. Новый тип договора - новая запись здесь и комплект в DOCUMENT_BUNDLES
+CONTRACT_FLOWS: Dict[str, ContractFlow] = {
+    flow.contract_type: flow for flow in (
+        ContractFlow(
+            contract_type='agent',
+            title="Агентское соглашение",
+            button="🤝 Агентское соглашение",
+            steps=COMMON_STEPS + (AGENT_NAME, PRINCIPAL_NAME, REWARD, REQUISITES, ASSIGNMENT_DETAILS, REPORT_DETAILS),
+            done_text="📋 Все документы отправлены! Используйте /start для создания нового договора."
+        ),
+        ContractFlow(
+            contract_type='subagent',
+            title="Субагентское соглашение",
+            button="👥 Субагентское соглашение",
+            steps=COMMON_STEPS + (
+                AGENT_NAME,
+                FlowStep('subagent_name', "👥 Введите название/ФИО Субагента:"),
+                PRINCIPAL_NAME,
+                FlowStep('agreement_subject', "📋 Введите предмет соглашения:"),
+                REWARD, REQUISITES, ASSIGNMENT_DETAILS, REPORT_DETAILS
+            ),
+            done_text="📋 Все документы отправлены! Используйте /start для создания нового договора."
+        ),
+        ContractFlow(
+            contract_type='delivery',
+            title="Договор поставки",
+            button="📦 Договор поставки",
+            steps=COMMON_STEPS + (
+                FlowStep('supplier_name', "🏭 Введите название/ФИО Поставщика:"),
+                FlowStep('buyer_name', "🛒 Введите название/ФИО Покупателя:"),
+                FlowStep('goods_services', "📦 Введите перечень товаров/услуг:"),
+                FlowStep('price_payment_terms', "💰 Введите цену и условия оплаты:"),
+                FlowStep('delivery_terms', "🚚 Введите сроки поставки:"),
+                FlowStep('responsibility', "⚖️ Введите ответственность сторон:"),
+                REQUISITES
+            ),
+            done_text="📋 Документ отправлен! Используйте /start для создания нового договора."
+        ),
+    )
+}
+
+def flow_state(contract_type: str, field: str) -> str:
+    """Состояние FSM шага: тип договора входит в имя, поэтому переход не требует чтения данных"""
+    return f"{contract_type}:{field}"
+
+def compile_flows(flows: Dict[str, ContractFlow]) -> Dict[str, Transition]:
+    """Таблица переходов по состоянию FSM; ошибки описания обнаруживаются при запуске"""
+    known_fields = {state.state.split(':', 1)[1] for state in ContractForm.__all_states__}
+    transitions = {}
+    for contract_type, flow in flows.items():
+        if contract_type not in DOCUMENT_BUNDLES:
+            raise ValueError(f"Для типа договора {contract_type} не описан комплект документов")
+        if not flow.steps:
+            raise ValueError(f"Пустой диалог для типа договора {contract_type}")
+        
+        fields = [step.field for step in flow.steps]
+        unknown = set(fields) - known_fields
+        if unknown:
+            raise ValueError(f"Неизвестные поля в диалоге {contract_type}: {', '.join(sorted(unknown))}")
+        if len(set(fields)) != len(fields):
+            raise ValueError(f"Поле запрашивается дважды в диалоге {contract_type}")
+        if contract_type not in CONTRACT_SCHEMAS:
+            raise ValueError(f"Для типа договора {contract_type} не описана схема полей")
+        schema = set(CONTRACT_SCHEMAS[contract_type])
+        if set(fields) != schema:
+            raise ValueError(
+                f"Диалог {contract_type} не совпадает со схемой полей: "
+                f"лишние {sorted(set(fields) - schema)}, пропущены {sorted(schema - set(fields))}"
+            )
+        
+        for step, next_step in zip(flow.steps, flow.steps[1:] + (None,)):
+            transitions[flow_state(contract_type, step.field)] = Transition(
+                flow=flow,
+                step=step,
+                check=validator.field_check(contract_type, step.field),
+                next_state=flow_state(contract_type, next_step.field) if next_step else None,
+                next_prompt=next_step.prompt if next_step else None
+            )
+    return transitions
+
+# Таблица переходов собирается один раз при импорте, обработчик только ищет в ней состояние
+TRANSITIONS = compile_flows(CONTRACT_FLOWS)
+STEP_STATES = tuple(state for state, transition in TRANSITIONS.items() if transition.next_state)
+FINAL_STATES = tuple(state for state, transition in TRANSITIONS.items() if not transition.next_state)
+
+def contract_type_keyboard() -> InlineKeyboardMarkup:
+    """Главное меню: типы договоров и список своих договоров"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        *([InlineKeyboardButton(text=flow.button, callback_data=flow.contract_type)] for flow in CONTRACT_FLOWS.values()),
+        [InlineKeyboardButton(text="📋 Мои договоры", callback_data="my_contracts")]
+    ])
+
+@router.callback_query(F.data.in_(tuple(CONTRACT_FLOWS)))
+async def process_contract_type(callback: CallbackQuery, state: FSMContext):
+    """Выбор типа договора - начало диалога"""
+    flow = CONTRACT_FLOWS[callback.data]
+    first_step = flow.steps[0]
+    
+    await state.set_state(flow_state(flow.contract_type, first_step.field))
+    await state.set_data({'contract_type': flow.contract_type})
+    await callback.message.edit_text(f"📝 Создание: {flow.title}\n\n{first_step.prompt}")
+    await callback.answer()
+
+async def process_step(message: Message, state: FSMContext, raw_state: str):
+    """Любой шаг любого диалога: переход берется из таблицы по состоянию"""
+    transition = TRANSITIONS[raw_state]
+    
+    if message.text is None:
+        await message.answer("✍️ Отправьте ответ текстом.")
+        return
+    error = transition.check(message.text)
+    if error:
+        await message.answer(f"❌ {error}\n\n{transition.step.prompt}")
+        return
+    
+    data = await state.get_data()
+    data[transition.step.field] = message.text
+    
+    if transition.next_state:
+        # StateContextMiddleware записывает состояние и данные одной операцией после обработчика
+        await state.set_data(data)
+        await state.set_state(transition.next_state)
+        await message.answer(transition.next_prompt)
+        return
+    
+    # Последний шаг: генерация комплекта документов
+    try:
+        failed, contract_id = await send_documents(message, data, message.from_user.id)
+        
+        if failed:
+            await message.answer("⚠️ Часть документов не сформирована. Используйте /start, чтобы попробовать снова.")
+        else:
+            await message.answer(transition.flow.done_text, reply_markup=pdf_keyboard(contract_id))
+    
+    except (QueueFullError, PoolOverloadedError) as e:
+        # Перегрузка временная: форма остается на последнем шаге, ответ можно отправить повторно
+        await message.answer(f"🚦 {e}.\nВведенные данные сохранены - отправьте последний ответ еще раз.")
+        return
+    
+    except Exception as e:
+        await message.answer(f"❌ Ошибка при генерации документов: {str(e)}")
+    
+    await state.clear()
+
+# Команды посреди диалога (/find, /admin и т.д.) не считаются ответом на вопрос шага
+NOT_COMMAND = ~F.text.startswith('/')
+
+# Один обработчик для всех шагов; последние шаги помечены для ограничителя генераций
+router.message.register(process_step, StateFilter(*STEP_STATES), NOT_COMMAND)
+router.message.register(process_step, StateFilter(*FINAL_STATES), NOT_COMMAND, flags={GENERATION_FLAG: True})
+
+@router.message(StateFilter(*ContractForm.__all_states__), NOT_COMMAND)
+async def process_legacy_state(message: Message, state: FSMContext, raw_state: str):
+    """Диалог, начатый со старыми состояниями ContractForm: переводим на состояние своего типа договора"""
+    data = await state.get_data()
+    migrated = flow_state(data.get('contract_type', ''), raw_state.split(':', 1)[1])
+    if migrated not in TRANSITIONS:
+        await state.clear()
+        await message.answer("⚠️ Заполнение договора нужно начать заново: /start")
+        return
+    
+    await state.set_state(migrated)
+    await process_step(message, state, migrated)
@@ -1,12 +1,27 @@
+# Импортируется первым: с этого момента отсчитывается время запуска
+from utils.startup import startup_report
+
+import argparse
 import asyncio
 import logging
 import sys
+from typing import Optional
 from aiogram import Bot, Dispatcher
+from aiohttp import web
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import config
-from handlers import common, agent_handlers, delivery_handlers, admin
+from handlers import common, flow, admin
 from db.database import db_manager
+from db.fsm_storage import SQLiteStorage
+from handlers.document_generator import document_generator, generation_pool
+from utils.webhook import build_webhook_app
+from utils.janitor import output_janitor
+from utils.generation_queue import generation_queue
+from utils.metrics import publish_startup_report, setup_metrics, start_metrics_server
+from utils.state_context import setup_state_context
+from utils.throttling import setup_throttling
 
 # Настройка логирования
 logging.basicConfig(
@@ -20,8 +35,50 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-async def main():
+def create_storage() -> BaseStorage:
+    """Хранилище состояний FSM по настройке FSM_STORAGE"""
+    if config.FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    if config.FSM_STORAGE == 'sqlite':
+        return SQLiteStorage(
+            config.FSM_DATABASE_PATH,
+            flush_interval=config.FSM_FLUSH_INTERVAL_MS / 1000,
+            cache_size=config.FSM_CACHE_SIZE
+        )
+    raise ValueError(f"Неизвестное хранилище FSM: {config.FSM_STORAGE}")
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Прием обновлений через встроенный aiohttp-сервер"""
+    app = build_webhook_app(
+        dp,
+        bot,
+        path=config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET,
+        max_in_flight=config.WEBHOOK_MAX_IN_FLIGHT
+    )
+    
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            config.WEBHOOK_URL.rstrip('/') + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET or None,
+            max_connections=config.WEBHOOK_MAX_IN_FLIGHT
+        )
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"🌐 Вебхук слушает {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+    
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def main(mode: Optional[str] = None):
     """Основная функция запуска бота"""
+    mode = mode or config.RUN_MODE
+    startup_report.mark('imports')
     
     # Проверка токена
     if config.BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
@@ -29,33 +86,72 @@ async def main():
         return
     
     # Инициализация бота и диспетчера
-    bot = Bot(token=config.BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    
-    # Регистрация роутеров
-    dp.include_router(common.router)
-    dp.include_router(agent_handlers.router)
-    dp.include_router(delivery_handlers.router)
-    dp.include_router(admin.router)
+    with startup_report.phase('dispatcher'):
+        bot = Bot(token=config.BOT_TOKEN)
+        storage = create_storage()
+        dp = Dispatcher(storage=storage)
+        setup_state_context(dp)
+        setup_metrics(dp)
+        setup_throttling(dp)
+        
+        # Регистрация роутеров
+        dp.include_router(common.router)
+        dp.include_router(flow.router)
+        dp.include_router(admin.router)
     
     logger.info("🤖 Бот запускается...")
+    metrics_runner = None
     
     try:
         # Инициализация базы данных
         logger.info("📊 Инициализация базы данных...")
+        with startup_report.phase('database'):
+            await db_manager.run(db_manager.initialize)
         
-        # Запуск бота
-        await dp.start_polling(bot)
+        # Папка output/ и компиляция шаблонов документов
+        with startup_report.phase('templates'):
+            document_generator.ensure_output_dir()
+            templates_count = await document_generator.awarm_up()
+        logger.info(f"📄 Скомпилировано шаблонов: {templates_count}")
+        
+        # Фоновая очистка папки output/
+        output_janitor.start()
+        
+        # Метрики для Prometheus на локальном порту
+        if config.METRICS_PORT:
+            with startup_report.phase('metrics_server'):
+                metrics_runner = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
         
+        # Время до первого обновления попадает в метрику bot_cold_start_to_first_update_seconds
+        startup_report.log()
+        publish_startup_report()
+        
+        # Запуск бота
+        if mode == 'webhook':
+            await run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot)
+    
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
     finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await output_janitor.stop()
+        # Принятые задачи генерации дорабатывают до остановки пула
+        await generation_queue.stop()
+        generation_pool.shutdown()
+        db_manager.close()
         await bot.session.close()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Telegram-бот для создания договоров")
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default=None,
+                        help="Режим получения обновлений (по умолчанию RUN_MODE из конфигурации)")
+    args = parser.parse_args()
+    
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.mode))
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен пользователем")
 
@@ -5,11 +5,20 @@
 
 import sys
 import os
+import tempfile
 import unittest
 from datetime import datetime
 
 # Добавляем путь к проекту
-sys.path.insert(0, '/home/ubuntu/telegram_contract_bot')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import config
+
+# Отдельные база и папка документов, чтобы тесты не меняли файлы репозитория;
+# задаются до импорта db и handlers
+TEST_DIR = tempfile.mkdtemp(prefix='contract_bot_test_')
+config.DATABASE_PATH = os.path.join(TEST_DIR, 'contracts.db')
+config.OUTPUT_PATH = os.path.join(TEST_DIR, 'output')
 
 def test_imports():
     """Тест импорта всех модулей"""
@@ -85,11 +94,142 @@ def test_database():
             return False
         
         return True
-        
+    
     except Exception as e:
         print(f"❌ База данных - ОШИБКА: {e}")
         return False
 
+def test_database_async():
+    """Тест асинхронного API и настроек соединения базы данных"""
+    print("\n🗄️ Тестирование соединения с базой данных...")
+    
+    try:
+        import asyncio
+        from db.database import DatabaseManager
+        
+        db_manager = DatabaseManager(os.path.join(tempfile.mkdtemp(), 'contracts.db'))
+        with db_manager._get_connection() as conn:
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        
+        if journal_mode == 'wal':
+            print("✅ Режим WAL - OK")
+        else:
+            print(f"❌ Режим журнала: {journal_mode}")
+            return False
+        
+        async def save_and_load():
+            contract_id = await db_manager.asave_contract(12345, 'agent', 'Тест №4', {'contract_name': 'Тест №4'})
+            return await db_manager.aget_contract_data(contract_id, 12345)
+        
+        loaded = asyncio.run(save_and_load())
+        db_manager.close()
+        if loaded == {'contract_name': 'Тест №4'}:
+            print("✅ Асинхронное сохранение и чтение - OK")
+        else:
+            print("❌ Асинхронное сохранение и чтение - ОШИБКА")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Соединение с базой данных - ОШИБКА: {e}")
+        return False
+
+def test_fsm_storage():
+    """Тест сохранения состояний FSM в SQLite"""
+    print("\n💾 Тестирование хранилища FSM...")
+    
+    try:
+        import asyncio
+        import tempfile
+        from aiogram.fsm.storage.base import StorageKey
+        from db.fsm_storage import SQLiteStorage
+        from handlers.states import ContractForm
+        
+        key = StorageKey(bot_id=1, chat_id=12345, user_id=12345)
+        db_path = os.path.join(tempfile.mkdtemp(), 'fsm.db')
+        
+        async def fill_form():
+            storage = SQLiteStorage(db_path, flush_interval=0.01)
+            writes = []
+            original_write = storage._write
+            storage._write = lambda upserts, deletes: (writes.append(len(upserts)), original_write(upserts, deletes))
+            
+            await storage.set_state(key, ContractForm.contract_date)
+            await storage.update_data(key, {'contract_type': 'agent'})
+            await storage.update_data(key, {'contract_name': 'Тест №5'})
+            await asyncio.sleep(0.05)
+            await storage.close()
+            return writes
+        
+        async def restore_form():
+            storage = SQLiteStorage(db_path)
+            state = await storage.get_state(key)
+            data = await storage.get_data(key)
+            await storage.close()
+            return state, data
+        
+        writes = asyncio.run(fill_form())
+        if len(writes) == 1:
+            print("✅ Изменения записаны одной транзакцией - OK")
+        else:
+            print(f"❌ Количество записей в базу: {len(writes)}")
+            return False
+        
+        state, data = asyncio.run(restore_form())
+        if state == ContractForm.contract_date.state and data == {'contract_type': 'agent', 'contract_name': 'Тест №5'}:
+            print("✅ Состояние восстановлено после перезапуска - OK")
+        else:
+            print(f"❌ Восстановлено неверное состояние: {state}, {data}")
+            return False
+        
+        async def many_users():
+            storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(), 'fsm.db'), cache_size=2)
+            keys = [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(1, 5)]
+            for number, user_key in enumerate(keys):
+                await storage.set_data(user_key, {'contract_name': f'Тест №{number}'})
+            # До записи в базу ни одно изменение не вытесняется
+            unsaved = len(storage._cache)
+            await storage.flush()
+            await storage.get_data(keys[2])
+            await storage.get_data(keys[0])
+            cached = list(storage._cache)
+            restored = [await storage.get_data(user_key) for user_key in keys]
+            await storage.close()
+            return unsaved, cached, [storage.key_builder.build(user_key) for user_key in keys], restored
+        
+        async def unserializable():
+            path = os.path.join(tempfile.mkdtemp(), 'fsm.db')
+            storage = SQLiteStorage(path)
+            broken = StorageKey(bot_id=1, chat_id=1, user_id=1)
+            await storage.set_data(broken, {'value': object()})
+            await storage.set_data(key, {'contract_name': 'Тест №5'})
+            await storage.close()
+            storage = SQLiteStorage(path)
+            data = await storage.get_data(key)
+            await storage.close()
+            return data
+        
+        if asyncio.run(unserializable()) == {'contract_name': 'Тест №5'}:
+            print("✅ Несериализуемое состояние не мешает сохранить остальные - OK")
+        else:
+            print("❌ Состояния потеряны из-за одного несериализуемого значения")
+            return False
+        
+        unsaved, cached, built, restored = asyncio.run(many_users())
+        if unsaved == 4 and cached == [built[2], built[0]] and \
+                restored == [{'contract_name': f'Тест №{number}'} for number in range(4)]:
+            print("✅ Память ограничена недавними записями, вытесненные читаются из базы - OK")
+        else:
+            print(f"❌ Записей до сброса: {unsaved}, в памяти: {cached}, прочитано: {restored}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Хранилище FSM - ОШИБКА: {e}")
+        return False
+
 def test_validator():
     """Тест валидации данных"""
     print("\n✅ Тестирование валидатора...")
@@ -121,7 +261,7 @@ def test_validator():
             return False
         
         return True
-        
+    
     except Exception as e:
         print(f"❌ Валидатор - ОШИБКА: {e}")
         return False
@@ -163,11 +303,1563 @@ def test_document_generation():
             return False
         
         return True
-        
+    
     except Exception as e:
         print(f"❌ Генерация документов - ОШИБКА: {e}")
         return False
 
+def test_template_compiler():
+    """Тест компиляции и кэширования шаблонов"""
+    print("\n🧩 Тестирование компилятора шаблонов...")
+    
+    try:
+        from handlers.document_generator import document_generator, compile_template, TemplateError
+        
+        template = document_generator.get_template('agent_template.docx')
+        if document_generator.get_template('agent_template.docx') is template:
+            print("✅ Повторное обращение берется из кэша - OK")
+        else:
+            print("❌ Шаблон компилируется повторно")
+            return False
+        
+        rendered = compile_template('test', 'Агент: {agent_name}, дата {contract_date}').render(
+            {'agent_name': 'ООО "Тест"', 'contract_date': '01.01.2025'}
+        )
+        if rendered == 'Агент: ООО "Тест", дата 01.01.2025':
+            print("✅ Подстановка значений - OK")
+        else:
+            print(f"❌ Неверный результат подстановки: {rendered}")
+            return False
+        
+        for content in ('{unknown_field}', '{agent_name'):
+            try:
+                compile_template('test', content)
+                print(f"❌ Ошибка в шаблоне не обнаружена: {content}")
+                return False
+            except TemplateError:
+                print(f"✅ Ошибка при компиляции обнаружена: {content}")
+        
+        try:
+            template.render({'agent_name': 'Тест'})
+            print("❌ Незаполненные поля не обнаружены")
+            return False
+        except TemplateError:
+            print("✅ Незаполненные поля обнаружены - OK")
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Компилятор шаблонов - ОШИБКА: {e}")
+        return False
+
+def test_worker_pool():
+    """Тест пула генерации с ограниченной очередью"""
+    print("\n⚙️ Тестирование пула генерации...")
+    
+    try:
+        import asyncio
+        import time
+        from utils.worker_pool import WorkerPool, PoolOverloadedError
+        
+        async def run_jobs():
+            pool = WorkerPool(workers=1, queue_size=1)
+            jobs = [asyncio.create_task(pool.run(time.sleep, 0.2)) for _ in range(3)]
+            
+            # Пока задачи выполняются в пуле, event loop остается свободным
+            started = time.monotonic()
+            await asyncio.sleep(0.01)
+            loop_delay = time.monotonic() - started
+            
+            results = await asyncio.gather(*jobs, return_exceptions=True)
+            pool.shutdown()
+            return loop_delay, results
+        
+        loop_delay, results = asyncio.run(run_jobs())
+        
+        if loop_delay < 0.1:
+            print("✅ Event loop не блокируется - OK")
+        else:
+            print(f"❌ Event loop заблокирован на {loop_delay:.2f} с")
+            return False
+        
+        rejected = [r for r in results if isinstance(r, PoolOverloadedError)]
+        if len(rejected) == 1:
+            print("✅ Переполнение очереди отклоняется - OK")
+        else:
+            print(f"❌ Отклонено задач: {len(rejected)} (ожидалась 1)")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Пул генерации - ОШИБКА: {e}")
+        return False
+
+def test_in_memory_generation():
+    """Тест генерации документов в памяти без записи на диск"""
+    print("\n💾 Тестирование генерации в памяти...")
+    
+    try:
+        import asyncio
+        from handlers.document_generator import document_generator, persist_documents
+        
+        test_data = {
+            'contract_name': 'Тест №2',
+            'contract_date': '01.01.2025',
+            'supplier_name': 'Тестовый поставщик',
+            'buyer_name': 'Тестовый покупатель',
+            'goods_services': 'Тестовые товары',
+            'price_payment_terms': '1000 рублей',
+            'delivery_terms': '10 дней',
+            'responsibility': 'Тестовая ответственность',
+            'requisites': 'Тестовые реквизиты'
+        }
+        
+        documents = document_generator.render_bundle('delivery', test_data)
+        if len(documents) == 1 and documents[0].content.startswith(b'PK'):
+            print(f"✅ Документ создан в памяти: {documents[0].filename}")
+        else:
+            print("❌ Документ в памяти не создан")
+            return False
+        
+        if os.path.exists(os.path.join(document_generator.output_path, documents[0].filename)):
+            print("❌ Документ записан на диск без запроса")
+            return False
+        
+        paths = asyncio.run(persist_documents(documents))
+        with open(paths[0], 'rb') as f:
+            if f.read() == documents[0].content:
+                print("✅ Асинхронное сохранение на диск - OK")
+            else:
+                print("❌ Содержимое файла не совпадает")
+                return False
+        os.remove(paths[0])
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Генерация в памяти - ОШИБКА: {e}")
+        return False
+
+def test_pipelined_generation():
+    """Тест параллельной генерации комплекта с частичной ошибкой"""
+    print("\n🚚 Тестирование потоковой выдачи документов...")
+    
+    try:
+        import asyncio
+        from handlers.document_generator import iter_documents
+        
+        # Без report_details акт отчета не сформируется, остальные документы должны прийти
+        test_data = {
+            'contract_type': 'agent',
+            'contract_name': 'Тест №3',
+            'contract_date': '01.01.2025',
+            'agent_name': 'Тестовый агент',
+            'principal_name': 'Тестовый принципал',
+            'reward': '100000 рублей',
+            'requisites': 'Тестовые реквизиты',
+            'assignment_details': 'Тестовое поручение'
+        }
+        
+        async def collect():
+            return [result async for result in iter_documents(test_data, 12345)]
+        
+        results = asyncio.run(collect())
+        prefixes = [result.filename.split('_Тест')[0] for result in results]
+        
+        if prefixes == ['agent', 'agent_assignment', 'agent_report']:
+            print("✅ Порядок документов сохранен - OK")
+        else:
+            print(f"❌ Неверный порядок документов: {prefixes}")
+            return False
+        
+        if results[0].document and results[1].document and results[2].error:
+            print("✅ Ошибка одного документа не отменяет остальные - OK")
+        else:
+            print("❌ Неверная обработка частичной ошибки")
+            return False
+        
+        # Отказ перегруженного пула не должен оставлять договор в базе
+        from db.database import db_manager
+        from handlers.document_generator import generation_pool
+        from utils.worker_pool import PoolOverloadedError
+        
+        def overloaded(*calls):
+            raise PoolOverloadedError("Сервер перегружен")
+        
+        async def collect_overloaded():
+            return [result async for result in iter_documents({**test_data, 'contract_name': 'Тест №3-перегрузка'}, 12346)]
+        
+        saved_before = len(db_manager.get_user_contracts(12346))
+        generation_pool.submit = overloaded
+        try:
+            asyncio.run(collect_overloaded())
+            print("❌ Отказ пула не передан вызывающему")
+            return False
+        except PoolOverloadedError:
+            pass
+        finally:
+            del generation_pool.submit
+        
+        if len(db_manager.get_user_contracts(12346)) == saved_before:
+            print("✅ При перегрузке пула договор не сохраняется - OK")
+        else:
+            print("❌ Договор сохранен, хотя пул отказал в генерации")
+            return False
+        
+        # Сбой записи в базу: уже поставленный рендеринг отменяется, а не остается без ожидания
+        submitted = []
+        original_submit = generation_pool.submit
+        
+        def recording_submit(*calls):
+            futures = original_submit(*calls)
+            submitted.extend(futures)
+            return futures
+        
+        async def failing_save(*args, **kwargs):
+            raise RuntimeError("база недоступна")
+        
+        generation_pool.submit = recording_submit
+        db_manager.asave_contract = failing_save
+        try:
+            asyncio.run(collect_overloaded())
+            print("❌ Ошибка записи в базу не передана вызывающему")
+            return False
+        except RuntimeError:
+            pass
+        finally:
+            del generation_pool.submit
+            del db_manager.asave_contract
+        
+        if submitted and all(future.cancelled() for future in submitted):
+            print("✅ При ошибке записи в базу рендеринг отменяется - OK")
+        else:
+            print(f"❌ Задачи рендеринга после ошибки базы: {submitted}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Потоковая выдача - ОШИБКА: {e}")
+        return False
+
+def test_document_cache():
+    """Тест кэша готовых документов"""
+    print("\n🗂️ Тестирование кэша документов...")
+    
+    try:
+        import asyncio
+        from utils.document_cache import DocumentCache
+        from handlers.document_generator import document_cache, generate_documents
+        
+        cache = DocumentCache(max_items=2, max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        cache.get('a')
+        cache.put('c', b'1234')
+        if cache.get('b') is None and cache.get('a') == b'1234' and cache.total_bytes == 8:
+            print("✅ Вытеснение давно не используемых - OK")
+        else:
+            print("❌ Неверное вытеснение из кэша")
+            return False
+        
+        test_data = {
+            'contract_type': 'delivery',
+            'contract_name': 'Тест №6',
+            'contract_date': '01.01.2025',
+            'supplier_name': 'Тестовый поставщик',
+            'buyer_name': 'Тестовый покупатель',
+            'goods_services': 'Тестовые товары',
+            'price_payment_terms': '1000 рублей',
+            'delivery_terms': '10 дней',
+            'responsibility': 'Тестовая ответственность',
+            'requisites': 'Тестовые реквизиты'
+        }
+        
+        first = asyncio.run(generate_documents(test_data, 12345))
+        hits = document_cache.hits
+        second = asyncio.run(generate_documents(dict(test_data, contract_type='delivery'), 12345))
+        
+        if document_cache.hits == hits + 1 and first[0].content == second[0].content:
+            print("✅ Повторный запрос обслужен из кэша - OK")
+        else:
+            print("❌ Повторный запрос не попал в кэш")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Кэш документов - ОШИБКА: {e}")
+        return False
+
+def test_output_janitor():
+    """Тест фоновой очистки папки с документами"""
+    print("\n🧹 Тестирование очистки output/...")
+    
+    try:
+        import asyncio
+        import tempfile
+        import time
+        from utils.janitor import OutputJanitor
+        
+        output_dir = tempfile.mkdtemp()
+        for hours in range(10):
+            path = os.path.join(output_dir, f"document_{hours}.docx")
+            with open(path, 'wb') as f:
+                f.write(b'x' * 1000)
+            os.utime(path, (time.time() - hours * 3600,) * 2)
+        
+        async def clean():
+            janitor = OutputJanitor(output_dir, max_age=5.5 * 3600, max_total_bytes=3000, interval=3600, batch_size=2)
+            janitor.start()
+            await asyncio.sleep(0.1)
+            remaining = sorted(os.listdir(output_dir))
+            report = await janitor.trigger(purge_all=True)
+            await janitor.stop()
+            return remaining, report
+        
+        remaining, report = asyncio.run(clean())
+        
+        if remaining == ['document_0.docx', 'document_1.docx', 'document_2.docx']:
+            print("✅ Старые файлы и превышение бюджета удалены - OK")
+        else:
+            print(f"❌ Остались файлы: {remaining}")
+            return False
+        
+        if report.files == 3 and not os.listdir(output_dir):
+            print("✅ Полная очистка по запросу - OK")
+        else:
+            print(f"❌ Полная очистка удалила {report.files} файлов")
+            return False
+        
+        try:
+            OutputJanitor(output_dir, max_age=3600, max_total_bytes=3000, interval=0)
+            print("❌ Нулевой интервал очистки принят")
+            return False
+        except ValueError:
+            print("✅ Нулевой интервал очистки отклонен - OK")
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Очистка output/ - ОШИБКА: {e}")
+        return False
+
+def test_event_loop_latency():
+    """Тест задержки event loop при чтении и записи больших документов"""
+    print("\n⏱️ Тестирование неблокирующего ввода-вывода...")
+    
+    try:
+        import asyncio
+        import tempfile
+        import time
+        from handlers.document_generator import DocumentGenerator, generation_pool, persist_documents
+        
+        generator = DocumentGenerator()
+        generator.templates_path = tempfile.mkdtemp()
+        with open(os.path.join(generator.templates_path, 'large_template.docx'), 'w', encoding='utf-8') as f:
+            f.write('Договор №{contract_name}\n' + 'Пункт договора с подробным описанием условий.\n' * 5000)
+        
+        async def measure():
+            max_delay = 0.0
+            running = True
+            
+            async def monitor():
+                nonlocal max_delay
+                while running:
+                    started = time.perf_counter()
+                    await asyncio.sleep(0.001)
+                    max_delay = max(max_delay, time.perf_counter() - started - 0.001)
+            
+            monitor_task = asyncio.create_task(monitor())
+            await asyncio.sleep(0.01)
+            
+            await generator.aget_template('large_template.docx')
+            document = await generation_pool.run(
+                generator.render_document, 'large_template.docx', {'contract_name': 'Тест №7'}, 'large_test.docx'
+            )
+            paths = await persist_documents([document])
+            
+            running = False
+            await monitor_task
+            return max_delay, document, paths
+        
+        max_delay, document, paths = asyncio.run(measure())
+        for path in paths:
+            os.remove(path)
+        
+        print(f"  Размер документа: {len(document.content) / 1024:.0f} КБ")
+        print(f"  Максимальная задержка event loop: {max_delay * 1000:.1f} мс")
+        
+        if max_delay < 0.1:
+            print("✅ Event loop не блокируется файловыми операциями - OK")
+        else:
+            print("❌ Event loop блокируется файловыми операциями")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Неблокирующий ввод-вывод - ОШИБКА: {e}")
+        return False
+
+def test_webhook():
+    """Тест приема записанных обновлений через вебхук"""
+    print("\n🌐 Тестирование вебхука...")
+    
+    try:
+        import asyncio
+        from aiogram import Bot, Dispatcher, Router
+        from aiogram.types import Message
+        from aiohttp.test_utils import TestClient, TestServer
+        from utils.webhook import build_webhook_app
+        
+        update = {
+            'update_id': 1,
+            'message': {
+                'message_id': 1,
+                'date': 1735689600,
+                'chat': {'id': 12345, 'type': 'private'},
+                'from': {'id': 12345, 'is_bot': False, 'first_name': 'Тест'},
+                'text': 'привет'
+            }
+        }
+        
+        async def post_updates():
+            router = Router()
+            received = []
+            in_flight = []
+            
+            @router.message()
+            async def record(message: Message):
+                in_flight.append(1)
+                received.append((message.text, len(in_flight)))
+                await asyncio.sleep(0.05)
+                in_flight.pop()
+            
+            dp = Dispatcher()
+            dp.include_router(router)
+            bot = Bot(token='42:TEST')
+            app = build_webhook_app(dp, bot, path='/webhook', secret_token='secret', max_in_flight=1)
+            
+            async with TestClient(TestServer(app)) as client:
+                denied = await client.post('/webhook', json=update)
+                responses = await asyncio.gather(*(
+                    client.post('/webhook', json=update, headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'})
+                    for _ in range(3)
+                ))
+                await asyncio.sleep(0.2)
+            
+            return denied.status, [r.status for r in responses], received
+        
+        denied_status, statuses, received = asyncio.run(post_updates())
+        
+        if denied_status == 401:
+            print("✅ Запрос без секрета отклонен - OK")
+        else:
+            print(f"❌ Запрос без секрета вернул {denied_status}")
+            return False
+        
+        if statuses == [200, 200, 200] and len(received) == 3:
+            print("✅ Обновления приняты и обработаны - OK")
+        else:
+            print(f"❌ Статусы {statuses}, обработано {len(received)}")
+            return False
+        
+        if max(concurrent for _, concurrent in received) == 1:
+            print("✅ Лимит одновременной обработки соблюдается - OK")
+        else:
+            print("❌ Лимит одновременной обработки превышен")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Вебхук - ОШИБКА: {e}")
+        return False
+
+def test_benchmark():
+    """Тест нагрузочного прогона диалогов через настоящие роутеры"""
+    print("\n⏱️ Тестирование бенчмарка...")
+    
+    try:
+        import asyncio
+        from benchmark import Benchmark, percentile
+        
+        if percentile([0.3, 0.1, 0.2, 0.4], 50) == 0.2 and percentile([0.3, 0.1, 0.2, 0.4], 99) == 0.4:
+            print("✅ Перцентили считаются - OK")
+        else:
+            print("❌ Неверный расчет перцентилей")
+            return False
+        
+        report = asyncio.run(Benchmark('memory').run(users=2, flows=['agent', 'subagent', 'delivery'], rounds=1))
+        
+        # На свободном боте статус генерации не переключается с "в очереди": правится только меню выбора договора
+        if report['documents'] == 14 and report['errors'] == 0 and report['api_calls'].get('EditMessageText') == 6:
+            print(f"✅ Все диалоги завершены, документов: {report['documents']} - OK")
+        else:
+            print(f"❌ Документов: {report['documents']}, ошибок: {report['errors']}, вызовы API: {report['api_calls']}")
+            return False
+        
+        if 'delivery:requisites' in report['steps'] and 'delivery_template.docx' in report['renders']:
+            print("✅ Задержки по шагам и шаблонам собраны - OK")
+        else:
+            print("❌ Нет задержек по шагам или шаблонам")
+            return False
+        
+        if report['storage_ops'].get('delivery:requisites', {}).get('per_update'):
+            print("✅ Операции с хранилищем FSM посчитаны по шагам - OK")
+        else:
+            print("❌ Нет счетчиков операций с хранилищем FSM")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Бенчмарк - ОШИБКА: {e}")
+        return False
+
+def test_metrics():
+    """Тест сбора метрик и их выдачи в формате Prometheus"""
+    print("\n📈 Тестирование метрик...")
+    
+    try:
+        import asyncio
+        from aiogram import Bot, Dispatcher, Router
+        from aiogram.types import Message, Update
+        from aiohttp.test_utils import TestClient, TestServer
+        from utils.metrics import MetricsRegistry, build_metrics_app, handler_duration, setup_metrics, updates_total
+        
+        registry = MetricsRegistry()
+        histogram = registry.histogram('test_seconds', "Тест", ('step',), buckets=(0.1, 0.2, 0.4))
+        for value in (0.05, 0.15, 0.15, 0.3):
+            histogram.observe(value, 'a')
+        
+        exposition = registry.render()
+        if 'test_seconds_bucket{step="a",le="0.2"} 3' in exposition and 'test_seconds_count{step="a"} 4' in exposition:
+            print("✅ Текстовый формат Prometheus - OK")
+        else:
+            print(f"❌ Неверный вывод метрик:\n{exposition}")
+            return False
+        
+        if abs(histogram.quantile(0.5, 'a') - 0.15) < 1e-9:
+            print("✅ Оценка квантиля по корзинам - OK")
+        else:
+            print(f"❌ Медиана {histogram.quantile(0.5, 'a')}")
+            return False
+        
+        async def feed():
+            router = Router()
+            
+            @router.message()
+            async def echo_handler(message: Message):
+                await asyncio.sleep(0.01)
+            
+            dp = Dispatcher()
+            setup_metrics(dp)
+            dp.include_router(router)
+            bot = Bot(token='42:TEST')
+            update = Update.model_validate({
+                'update_id': 1,
+                'message': {
+                    'message_id': 1,
+                    'date': 1735689600,
+                    'chat': {'id': 12345, 'type': 'private'},
+                    'from': {'id': 12345, 'is_bot': False, 'first_name': 'Тест'},
+                    'text': 'привет'
+                }
+            }, context={'bot': bot})
+            before = updates_total.value('message')
+            await dp.feed_update(bot, update)
+            
+            async with TestClient(TestServer(build_metrics_app())) as client:
+                response = await client.get('/metrics')
+                body = await response.text()
+            await bot.session.close()
+            return updates_total.value('message') - before, response.status, body
+        
+        counted, status, body = asyncio.run(feed())
+        
+        if counted == 1 and any(key == ('echo_handler', 'none') for key, *_ in handler_duration.summary()):
+            print("✅ Middleware учитывает обновления и обработчики - OK")
+        else:
+            print("❌ Обновление не учтено в метриках")
+            return False
+        
+        if status == 200 and 'bot_handler_duration_seconds_count{handler="echo_handler",state="none"}' in body:
+            print("✅ Адрес /metrics отвечает - OK")
+        else:
+            print(f"❌ /metrics вернул {status}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Метрики - ОШИБКА: {e}")
+        return False
+
+def test_bulk_generation():
+    """Тест пакетной генерации договоров из CSV"""
+    print("\n📦 Тестирование пакетной генерации...")
+    
+    try:
+        import csv
+        import json
+        import tempfile
+        import zipfile
+        from bulk_generate import generate_bulk
+        from db.database import db_manager
+        
+        user_id = 777001
+        saved_before = len(db_manager.get_user_contracts(user_id))
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, 'contracts.csv')
+            with open(input_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['contract_name', 'contract_date', 'supplier_name', 'buyer_name', 'goods_services',
+                                 'price_payment_terms', 'delivery_terms', 'responsibility', 'requisites'])
+                for number in range(2):
+                    writer.writerow([f'ДП-ПАКЕТ-{number}', '01.02.2025', 'ООО "Поставщик"', 'ООО "Покупатель"',
+                                     'Компьютеры - 10 шт.', '500000 рублей', 'Поставка за 14 дней',
+                                     'Пеня 0.1% в день', 'ИНН 1111111111, КПП 111111111'])
+                writer.writerow(['ДП-ОШИБКА', '2025-02-01', 'ООО "Поставщик"', '', '', '', '', '', ''])
+            
+            output_path = os.path.join(tmp, 'out.zip')
+            report = generate_bulk(input_path, output_path, user_id=user_id, workers=2, batch_size=1,
+                                   contract_type='delivery', progress_every=0)
+            with zipfile.ZipFile(output_path) as archive:
+                names = archive.namelist()
+        
+        if report.generated == 2 and report.invalid == 1 and len(names) == 2:
+            print("✅ Корректные строки сформированы, некорректная отклонена - OK")
+        else:
+            print(f"❌ Сформировано {report.generated}, отклонено {report.invalid}, файлов {len(names)}")
+            return False
+        
+        saved = db_manager.get_user_contracts(user_id)
+        if report.saved == 2 and len(saved) - saved_before == 2:
+            print("✅ Договоры сохранены в базу пачками - OK")
+        else:
+            print(f"❌ Сохранено в базу: {report.saved}")
+            return False
+        
+        # Название договора из строки не должно становиться путем, ошибка записи - прерывать пакет
+        import bulk_generate
+        original_write = bulk_generate.OutputWriter.write
+        
+        def failing_write(self, filename, content):
+            if 'СБОЙ' in filename:
+                raise OSError("диск заполнен")
+            original_write(self, filename, content)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, 'contracts.jsonl')
+            base = {
+                'contract_date': '01.02.2025', 'supplier_name': 'ООО "Поставщик"', 'buyer_name': 'ООО "Покупатель"',
+                'goods_services': 'Компьютеры - 10 шт.', 'price_payment_terms': '500000 рублей',
+                'delivery_terms': 'Поставка за 14 дней', 'responsibility': 'Пеня 0.1% в день',
+                'requisites': 'ИНН 1111111111, КПП 111111111'
+            }
+            with open(input_path, 'w', encoding='utf-8') as f:
+                # Нечитаемая строка и строка не с объектом отклоняются, остальные обрабатываются
+                for line in ({**base, 'contract_name': '№ 1/2025'}, '{oops', {**base, 'contract_name': '../../escape'},
+                             [1, 2], {**base, 'contract_name': 'СБОЙ'}):
+                    f.write((line if isinstance(line, str) else json.dumps(line, ensure_ascii=False)) + '\n')
+            
+            output_dir = os.path.join(tmp, 'out', 'docs')
+            bulk_generate.OutputWriter.write = failing_write
+            try:
+                report = generate_bulk(input_path, output_dir, user_id=user_id, workers=1,
+                                       contract_type='delivery', save=False, progress_every=0)
+            finally:
+                bulk_generate.OutputWriter.write = original_write
+            written = os.listdir(output_dir)
+            outside = sorted(set(os.listdir(tmp)) - {'contracts.jsonl', 'out'}) + sorted(
+                set(os.listdir(os.path.join(tmp, 'out'))) - {'docs'}
+            )
+        
+        if report.generated == 2 and report.failed == 1 and len(written) == 2 and not outside:
+            print("✅ Имена файлов очищаются, сбой записи строки не прерывает пакет - OK")
+        else:
+            print(f"❌ Сформировано {report.generated}, сбоев {report.failed}, файлы: {written}, снаружи: {outside}")
+            return False
+        
+        rejected = sorted(error.split(':')[0] for error in report.errors if 'JSON' in error)
+        if report.rows == 5 and report.invalid == 2 and rejected == ['Строка 2', 'Строка 4']:
+            print("✅ Некорректные строки JSONL отклонены с номерами строк - OK")
+        else:
+            print(f"❌ Строк: {report.rows}, отклонено: {report.invalid}, ошибки: {report.errors}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Пакетная генерация - ОШИБКА: {e}")
+        return False
+
+def test_pdf_generation():
+    """Тест выдачи документов в PDF"""
+    print("\n📑 Тестирование PDF...")
+    
+    try:
+        import io
+        import asyncio
+        from PyPDF2 import PdfReader
+        from handlers.document_generator import document_generator, iter_documents
+        
+        test_data = {
+            'contract_type': 'delivery',
+            'contract_name': 'ДП-PDF-001',
+            'contract_date': '01.02.2025',
+            'supplier_name': 'ООО "Поставщик"',
+            'buyer_name': 'ООО "Покупатель"',
+            'goods_services': 'Компьютеры - 10 шт. ' * 40,
+            'price_payment_terms': '500000 рублей',
+            'delivery_terms': '14 дней',
+            'responsibility': 'Пеня 0.1% в день',
+            'requisites': 'ИНН 1111111111, КПП 111111111'
+        }
+        
+        document = document_generator.render_document('delivery_template.docx', test_data, 'test.pdf', 'pdf')
+        reader = PdfReader(io.BytesIO(document.content))
+        text = ''.join(page.extract_text() for page in reader.pages)
+        
+        if document.content.startswith(b'%PDF') and 'Поставщик' in text and 'ДП-PDF-001' in text:
+            print(f"✅ PDF с кириллицей сформирован ({len(document.content) / 1024:.0f} КБ) - OK")
+        else:
+            print("❌ Текст договора не найден в PDF")
+            return False
+        
+        docx_key = document_generator.document_key(document_generator.get_template('delivery_template.docx'), test_data)
+        pdf_key = document_generator.document_key(
+            document_generator.get_template('delivery_template.docx'), test_data, 'pdf'
+        )
+        if docx_key != pdf_key:
+            print("✅ У форматов раздельный кэш - OK")
+        else:
+            print("❌ Ключи кэша DOCX и PDF совпадают")
+            return False
+        
+        # Заголовок PDF не зависит от метки времени в имени файла, иначе кэш отдаст устаревший
+        template = document_generator.get_template('delivery_template.docx')
+        later = document_generator.render_document('delivery_template.docx', test_data, 'other_20990101.pdf', 'pdf')
+        titles = {PdfReader(io.BytesIO(doc.content)).metadata.title for doc in (document, later)}
+        renamed_key = document_generator.document_key(template, {**test_data, 'contract_name': 'ДП-PDF-002'}, 'pdf')
+        if titles == {document_generator.document_title(template, test_data)} and renamed_key != pdf_key:
+            print(f"✅ Заголовок PDF входит в ключ кэша: {titles.pop()} - OK")
+        else:
+            print(f"❌ Заголовок PDF не согласован с ключом кэша: {titles}")
+            return False
+        
+        async def generate():
+            return [result async for result in iter_documents(test_data, 12345, save=False, fmt='pdf')]
+        
+        results = asyncio.run(generate())
+        if len(results) == 1 and results[0].document and results[0].filename.endswith('.pdf'):
+            print("✅ Комплект выдается в PDF по запросу - OK")
+        else:
+            print(f"❌ Неверный результат: {results}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ PDF - ОШИБКА: {e}")
+        return False
+
+def test_normalized_storage():
+    """Тест компактного хранения договоров и миграции старой базы"""
+    print("\n🗜️ Тестирование хранения договоров...")
+    
+    try:
+        import json
+        import sqlite3
+        import tempfile
+        from db.database import DatabaseManager
+        
+        requisites = 'ИНН 7701234567, КПП 770101001, р/с 40702810900000012345 в ПАО Сбербанк, БИК 044525225'
+        contracts = [
+            {'contract_type': 'agent', 'contract_name': f'АД-{number}', 'contract_date': '01.02.2025',
+             'agent_name': 'ООО "Агент"', 'principal_name': 'ООО "Принципал"', 'reward': '10%',
+             'requisites': requisites, 'assignment_details': 'Поиск покупателей ' * 10}
+            for number in range(3)
+        ]
+        contracts.append({'contract_name': 'Без типа', 'contract_date': '1.2.2025'})
+        
+        db_path = os.path.join(tempfile.mkdtemp(), 'contracts.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('''CREATE TABLE contracts (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+                        contract_type TEXT NOT NULL, contract_name TEXT NOT NULL, data TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.executemany(
+            'INSERT INTO contracts (user_id, contract_type, contract_name, data) VALUES (1, ?, ?, ?)',
+            [('agent', data['contract_name'], json.dumps(data, ensure_ascii=False)) for data in contracts]
+        )
+        conn.commit()
+        conn.close()
+        
+        manager = DatabaseManager(db_path)
+        restored = [manager.get_contract_data(contract_id, 1) for contract_id in range(1, len(contracts) + 1)]
+        if restored == contracts and manager.get_stats()['contracts'] == len(contracts):
+            print("✅ Старая база перенесена без потерь - OK")
+        else:
+            print(f"❌ Данные после миграции отличаются: {restored}")
+            return False
+        
+        with manager._get_connection() as conn:
+            parties = conn.execute('SELECT COUNT(*) FROM parties').fetchone()[0]
+            stored_requisites = conn.execute('SELECT COUNT(*) FROM requisites').fetchone()[0]
+            dates = {row[0] for row in conn.execute('SELECT contract_date FROM contracts')}
+        
+        if parties == 2 and stored_requisites == 1 and dates == {'2025-02-01', None}:
+            print("✅ Стороны и реквизиты хранятся без повторов - OK")
+        else:
+            print(f"❌ Сторон: {parties}, реквизитов: {stored_requisites}, даты: {dates}")
+            return False
+        
+        contract_id = manager.save_contract(1, 'agent', 'АД-4', dict(contracts[0], contract_name='АД-4'))
+        found = manager.get_party_contracts(1, 'ООО "Принципал"')
+        manager.close()
+        if len(found) == 4 and found[0]['id'] == contract_id:
+            print("✅ Поиск договоров по стороне - OK")
+        else:
+            print(f"❌ Найдено договоров стороны: {len(found)}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Хранение договоров - ОШИБКА: {e}")
+        return False
+
+def test_contract_search():
+    """Тест полнотекстового поиска договоров"""
+    print("\n🔎 Тестирование поиска договоров...")
+    
+    try:
+        import tempfile
+        from db.database import DatabaseManager
+        from handlers.common import CALLBACK_DATA_LIMIT, fit_search_query
+        
+        manager = DatabaseManager(os.path.join(tempfile.mkdtemp(), 'contracts.db'))
+        manager.save_contract(1, 'delivery', 'ДП-1', {
+            'contract_type': 'delivery', 'contract_name': 'ДП-1', 'supplier_name': 'ООО "Ромашка"',
+            'buyer_name': 'ООО "Вектор"', 'goods_services': 'Поставка ноутбуков'
+        })
+        named_id = manager.save_contract(1, 'agent', 'Ромашка-2025', {
+            'contract_type': 'agent', 'contract_name': 'Ромашка-2025', 'agent_name': 'ИП Петров'
+        })
+        manager.save_contract(2, 'agent', 'АД-7', {
+            'contract_type': 'agent', 'contract_name': 'АД-7', 'agent_name': 'ООО "Ромашка"'
+        })
+        for number in range(12):
+            manager.save_contract(3, 'agent', f'Серия-{number}', {
+                'contract_type': 'agent', 'contract_name': f'Серия-{number}', 'agent_name': 'ИП Сидоров'
+            })
+        
+        found = manager.search_contracts('ромаш', user_id=1)
+        if [contract['id'] for contract in found['contracts']][:1] == [named_id] and len(found['contracts']) == 2:
+            print("✅ Поиск по началу слова с ранжированием - OK")
+        else:
+            print(f"❌ Найдено: {found}")
+            return False
+        
+        if len(manager.search_contracts('ромашка')['contracts']) == 3 and \
+                not manager.search_contracts('ноутбуков', user_id=2)['contracts']:
+            print("✅ Поиск ограничен договорами пользователя - OK")
+        else:
+            print("❌ Поиск видит чужие договоры")
+            return False
+        
+        first = manager.search_contracts('сидоров', user_id=3, limit=10)
+        second = manager.search_contracts('сидоров', user_id=3, limit=10, offset=10)
+        manager.close()
+        ids = [contract['id'] for contract in first['contracts'] + second['contracts']]
+        if first['has_more'] and not second['has_more'] and len(set(ids)) == 12:
+            print("✅ Постраничный вывод результатов - OK")
+        else:
+            print(f"❌ Страницы результатов: {len(first['contracts'])}, {len(second['contracts'])}")
+            return False
+        
+        query = fit_search_query('find', 'Ромашка ' * 10)
+        if query and len(f"find:0000:{query}".encode('utf-8')) <= CALLBACK_DATA_LIMIT:
+            print("✅ Запрос помещается в кнопки страниц - OK")
+        else:
+            print(f"❌ Запрос для кнопок: {query}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Поиск договоров - ОШИБКА: {e}")
+        return False
+
+def test_throttling():
+    """Тест ограничения частоты запросов и числа одновременных генераций"""
+    print("\n🚦 Тестирование ограничителей...")
+    
+    try:
+        import asyncio
+        from types import SimpleNamespace
+        from utils.throttling import GENERATION_FLAG, GenerationLimitMiddleware, TokenBucketLimiter
+        
+        now = [0.0]
+        limiter = TokenBucketLimiter(rate=1, capacity=2, clock=lambda: now[0])
+        allowed = [limiter.allow(1) for _ in range(3)]
+        now[0] += 1
+        if allowed == [True, True, False] and limiter.allow(1) and limiter.allow(2):
+            print("✅ Token bucket на пользователя - OK")
+        else:
+            print(f"❌ Ответы ограничителя: {allowed}")
+            return False
+        
+        evicted = []
+        limiter = TokenBucketLimiter(rate=1, capacity=2, max_keys=2, clock=lambda: now[0], on_evict=evicted.append)
+        for user_id in (1, 2, 1, 3):
+            limiter.allow(user_id)
+        kept = list(limiter._buckets)
+        now[0] += 10
+        limiter.allow(4)
+        if evicted == [2, 1, 3] and kept == [1, 3] and list(limiter._buckets) == [4]:
+            print("✅ Давние и восстановившиеся корзины удаляются с начала очереди - OK")
+        else:
+            print(f"❌ Удалены корзины: {evicted}, оставались: {kept}")
+            return False
+        
+        from aiogram.types import Message
+        from utils.throttling import ThrottlingMiddleware
+        
+        class FloodMessage(Message):
+            async def answer(self, text, **kwargs):
+                return None
+        
+        async def flood_then_idle():
+            middleware = ThrottlingMiddleware(rate=1, burst=1)
+            middleware.limiter._clock = lambda: now[0]
+            
+            async def handle(event, data):
+                return 'ok'
+            
+            message = FloodMessage.model_construct(text='спам')
+            data = {'event_from_user': SimpleNamespace(id=5)}
+            await middleware(handle, message, data)
+            await middleware(handle, message, data)
+            warned = set(middleware._warned)
+            now[0] += 10
+            await middleware(handle, message, {'event_from_user': SimpleNamespace(id=6)})
+            return warned, middleware._warned
+        
+        warned, remaining = asyncio.run(flood_then_idle())
+        if warned == {5} and not remaining:
+            print("✅ Отметка о предупреждении удаляется вместе с корзиной - OK")
+        else:
+            print(f"❌ Предупрежденные пользователи: {warned} -> {remaining}")
+            return False
+        
+        class FakeEvent:
+            def __init__(self):
+                self.answers = []
+            
+            async def answer(self, text):
+                self.answers.append(text)
+        
+        async def check_in_flight():
+            middleware = GenerationLimitMiddleware(rate_per_minute=0, burst=1, max_in_flight=2)
+            release = asyncio.Event()
+            
+            async def generate(event, data):
+                await release.wait()
+                return 'done'
+            
+            def call(user_id):
+                data = {'event_from_user': SimpleNamespace(id=user_id),
+                        'handler': SimpleNamespace(flags={GENERATION_FLAG: True})}
+                event = FakeEvent()
+                return event, asyncio.create_task(middleware(generate, event, data))
+            
+            first = call(1)
+            second = call(2)
+            await asyncio.sleep(0)
+            duplicate = call(1)
+            busy = call(3)
+            await asyncio.sleep(0)
+            release.set()
+            results = [await task for _, task in (first, second, duplicate, busy)]
+            return results, duplicate[0].answers, busy[0].answers, middleware.in_flight
+        
+        results, duplicate_answers, busy_answers, in_flight = asyncio.run(check_in_flight())
+        if results == ['done', 'done', None, None] and duplicate_answers and busy_answers and in_flight == 0:
+            print("✅ Повторная генерация и перегрузка отклоняются сразу - OK")
+        else:
+            print(f"❌ Результаты генераций: {results}")
+            return False
+        
+        from handlers import common, flow
+        flagged = {
+            handler.callback.__name__
+            for router in (common.router, flow.router)
+            for observer in (router.message, router.callback_query)
+            for handler in observer.handlers
+            if handler.flags.get(GENERATION_FLAG)
+        }
+        if flagged == {'process_step', 'regenerate_contract'}:
+            print("✅ Лимит применяется к обработчикам генерации - OK")
+        else:
+            print(f"❌ Обработчики с флагом генерации: {flagged}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Ограничители - ОШИБКА: {e}")
+        return False
+
+def test_generation_queue():
+    """Тест очереди задач генерации"""
+    print("\n🕒 Тестирование очереди генерации...")
+    
+    try:
+        import asyncio
+        from utils.generation_queue import GenerationQueue, QueueFullError, PRIORITY_NEW, PRIORITY_REGEN
+        
+        async def run_queue():
+            queue = GenerationQueue(workers=1, max_size=3)
+            release = asyncio.Event()
+            order = []
+            
+            def make_job(name, fail=False):
+                async def job():
+                    await release.wait()
+                    order.append(name)
+                    if fail:
+                        raise ValueError(name)
+                    return name
+                return job
+            
+            running = queue.submit(make_job('running'))
+            # Свободный воркер заберет задачу сразу: в очереди она не стоит
+            idle_position = queue.position(running)
+            await asyncio.sleep(0)
+            regen = queue.submit(make_job('regen'), priority=PRIORITY_REGEN)
+            failing = queue.submit(make_job('failing', fail=True), priority=PRIORITY_NEW)
+            new = queue.submit(make_job('new'), priority=PRIORITY_NEW)
+            positions = [queue.position(job) for job in (running, failing, new, regen)]
+            try:
+                queue.submit(make_job('extra'))
+                overflow = False
+            except QueueFullError:
+                overflow = True
+            
+            release.set()
+            await queue.stop(timeout=5)
+            try:
+                await failing.future
+                error = None
+            except ValueError as e:
+                error = str(e)
+            return [idle_position] + positions, overflow, order, error, regen.future.result(), running.queued_seconds, regen.run_seconds
+        
+        positions, overflow, order, error, regen_result, queued, run = asyncio.run(run_queue())
+        if positions == [0, 0, 1, 2, 3] and overflow:
+            print("✅ Место в очереди с учетом приоритета и ограничение размера - OK")
+        else:
+            print(f"❌ Места в очереди: {positions}, переполнение: {overflow}")
+            return False
+        
+        if order == ['running', 'failing', 'new', 'regen'] and error == 'failing' and regen_result == 'regen':
+            print("✅ Ошибка задачи не останавливает воркер, очередь дорабатывает при остановке - OK")
+        else:
+            print(f"❌ Порядок выполнения: {order}, ошибка: {error}")
+            return False
+        
+        if queued >= 0 and run is not None:
+            print("✅ Время ожидания и выполнения задач записано - OK")
+        else:
+            print("❌ Время задач не записано")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Очередь генерации - ОШИБКА: {e}")
+        return False
+
+def test_contract_flow():
+    """Тест табличного описания диалогов создания договоров"""
+    print("\n🧭 Тестирование диалогов договоров...")
+    
+    try:
+        import asyncio
+        from aiogram.fsm.context import FSMContext
+        from aiogram.fsm.storage.base import StorageKey
+        from aiogram.fsm.storage.memory import MemoryStorage
+        from handlers.flow import (
+            CONTRACT_FLOWS, FINAL_STATES, TRANSITIONS, ContractFlow, FlowStep, compile_flows, process_step
+        )
+        from handlers.states import ContractForm
+        
+        if (TRANSITIONS['agent:requisites'].next_state == 'agent:assignment_details'
+                and TRANSITIONS['delivery:requisites'].next_state is None
+                and set(FINAL_STATES) == {'agent:report_details', 'subagent:report_details', 'delivery:requisites'}):
+            print("✅ Общий шаг реквизитов ведет по своему диалогу - OK")
+        else:
+            print("❌ Неверная таблица переходов")
+            return False
+        
+        broken = {'agent': ContractFlow('agent', "Тест", "Тест", (FlowStep('unknown_field', "?"),), "Готово")}
+        try:
+            compile_flows(broken)
+            print("❌ Неизвестное поле в описании диалога не обнаружено")
+            return False
+        except ValueError:
+            print("✅ Ошибки описания диалога обнаруживаются при запуске - OK")
+        
+        class FakeMessage:
+            def __init__(self, text):
+                self.text = text
+                self.answers = []
+            
+            async def answer(self, text, **kwargs):
+                self.answers.append(text)
+        
+        async def walk():
+            state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+            await state.set_state('subagent:contract_date')
+            await state.set_data({'contract_type': 'subagent', 'contract_name': '№1'})
+            
+            invalid = FakeMessage('31.02.2025')
+            await process_step(invalid, state, 'subagent:contract_date')
+            stayed = await state.get_state() == 'subagent:contract_date'
+            
+            valid = FakeMessage('01.02.2025')
+            await process_step(valid, state, 'subagent:contract_date')
+            return stayed, invalid.answers, valid.answers, await state.get_state(), await state.get_data()
+        
+        stayed, invalid_answers, valid_answers, next_state, data = asyncio.run(walk())
+        subagent = CONTRACT_FLOWS['subagent']
+        if (stayed and invalid_answers[0].startswith("❌")
+                and valid_answers == [subagent.steps[2].prompt]
+                and next_state == 'subagent:agent_name'
+                and data == {'contract_type': 'subagent', 'contract_name': '№1', 'contract_date': '01.02.2025'}):
+            print("✅ Шаг проверяет ответ и переходит к следующему - OK")
+        else:
+            print(f"❌ Шаг диалога: {next_state}, {data}, {invalid_answers}, {valid_answers}")
+            return False
+        
+        # Перегрузка генерации не должна стирать заполненную форму
+        import handlers.flow as flow_module
+        from utils.generation_queue import QueueFullError
+        
+        async def overloaded(*args, **kwargs):
+            raise QueueFullError("Очередь генерации заполнена, повторите запрос через минуту")
+        
+        async def finish_overloaded():
+            state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=2, user_id=2))
+            form = {'contract_type': 'delivery', 'contract_name': '№2'}
+            await state.set_state('delivery:requisites')
+            await state.set_data(form)
+            message = FakeMessage('ИНН 1111111111')
+            message.from_user = type('User', (), {'id': 2})()
+            original_send = flow_module.send_documents
+            flow_module.send_documents = overloaded
+            try:
+                await process_step(message, state, 'delivery:requisites')
+            finally:
+                flow_module.send_documents = original_send
+            return message.answers, await state.get_state(), await state.get_data() == form
+        
+        answers, kept_state, kept_data = asyncio.run(finish_overloaded())
+        if kept_state == 'delivery:requisites' and kept_data and answers[0].startswith("🚦"):
+            print("✅ При перегрузке форма сохраняется для повторной отправки - OK")
+        else:
+            print(f"❌ После перегрузки: {kept_state}, данные сохранены: {kept_data}, ответы: {answers}")
+            return False
+        
+        from handlers.flow import NOT_COMMAND, router as flow_router
+        guarded = all(
+            any(getattr(flt, 'magic', None) is NOT_COMMAND for flt in handler.filters or ())
+            for handler in flow_router.message.handlers
+        )
+        resolved = [bool(NOT_COMMAND.resolve(FakeMessage(text))) for text in ('/findall ООО', 'ООО "Вектор"', None)]
+        if guarded and resolved == [False, True, True]:
+            print("✅ Команды посреди диалога не попадают в поля формы - OK")
+        else:
+            print(f"❌ Фильтр команд: все шаги защищены - {guarded}, проверки - {resolved}")
+            return False
+        
+        asked = {step.field for flow in CONTRACT_FLOWS.values() for step in flow.steps}
+        service_states = {'contract_type', 'generate_documents'}
+        if asked == {state.state.split(':', 1)[1] for state in ContractForm.__all_states__} - service_states:
+            print("✅ Все поля договоров запрашиваются - OK")
+        else:
+            print(f"❌ Поля, запрашиваемые в диалогах: {sorted(asked)}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Диалоги договоров - ОШИБКА: {e}")
+        return False
+
+def test_state_context():
+    """Тест буферизации состояния FSM на время обновления"""
+    print("\n🗂️ Тестирование контекста состояния...")
+    
+    try:
+        import asyncio
+        import tempfile
+        from aiogram import Dispatcher
+        from aiogram.fsm.storage.base import StorageKey
+        from benchmark import CountingStorage
+        from db.fsm_storage import SQLiteStorage
+        from utils.state_context import BufferedFSMContext, StateContextMiddleware, setup_state_context
+        
+        key = StorageKey(bot_id=1, chat_id=777, user_id=777)
+        
+        async def handle_steps():
+            storage = CountingStorage(SQLiteStorage(os.path.join(tempfile.mkdtemp(), 'fsm.db')))
+            
+            # Обработчик шага: прочитать, дополнить данные, сменить состояние
+            state = BufferedFSMContext(storage, key)
+            await state.get_state()
+            await state.update_data(contract_type='agent')
+            data = await state.get_data()
+            data['contract_name'] = '№7'
+            await state.set_data(data)
+            await state.set_state('agent:contract_date')
+            before_flush = dict(storage.operations[''])
+            await state.flush()
+            after_flush = dict(storage.operations[''])
+            
+            # /start без начатого диалога ничего не записывает
+            storage.operations.clear()
+            idle = BufferedFSMContext(storage, StorageKey(bot_id=1, chat_id=778, user_id=778))
+            await idle.get_state()
+            await idle.clear()
+            await idle.flush()
+            idle_operations = dict(storage.operations[''])
+            
+            restored = await storage.get_state_and_data(key)
+            await storage.close()
+            return before_flush, after_flush, idle_operations, restored
+        
+        before_flush, after_flush, idle_operations, restored = asyncio.run(handle_steps())
+        if (before_flush == {'get_state_and_data': 1}
+                and after_flush == {'get_state_and_data': 1, 'set_state_and_data': 1}
+                and restored == ('agent:contract_date', {'contract_type': 'agent', 'contract_name': '№7'})):
+            print("✅ Одно чтение и одна запись на обновление - OK")
+        else:
+            print(f"❌ Операции с хранилищем: {before_flush} -> {after_flush}, сохранено: {restored}")
+            return False
+        
+        if idle_operations == {'get_state_and_data': 1}:
+            print("✅ Неизмененное состояние не записывается - OK")
+        else:
+            print(f"❌ Операции без изменений: {idle_operations}")
+            return False
+        
+        dp = Dispatcher()
+        order = [type(middleware).__name__ for middleware in dp.update.outer_middleware]
+        setup_state_context(dp)
+        replaced = [type(middleware).__name__ for middleware in dp.update.outer_middleware]
+        if isinstance(dp.fsm, StateContextMiddleware) and replaced == [
+            'StateContextMiddleware' if name == 'FSMContextMiddleware' else name for name in order
+        ]:
+            print("✅ FSM-middleware диспетчера заменен на своем месте - OK")
+        else:
+            print(f"❌ Middleware диспетчера: {replaced}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Контекст состояния - ОШИБКА: {e}")
+        return False
+
+def test_lazy_startup():
+    """Тест запуска без побочных эффектов при импорте"""
+    print("\n⚡ Тестирование ленивого запуска...")
+    
+    try:
+        import subprocess
+        import tempfile
+        from db.database import DatabaseManager
+        from utils.startup import StartupReport
+        
+        # Импорт бота в чистой папке не создает базу и output/ и не загружает python-docx
+        workdir = tempfile.mkdtemp()
+        probe = (
+            "import sys; sys.path.insert(0, sys.argv[1]); import main; "
+            "print('docx' in sys.modules, 'PyPDF2' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', probe, os.path.dirname(os.path.abspath(__file__))],
+            cwd=workdir, capture_output=True, text=True, timeout=120
+        )
+        created = sorted(name for name in os.listdir(workdir) if name != 'bot.log')
+        if result.returncode == 0 and result.stdout.split() == ['False', 'False'] and not created:
+            print("✅ Импорт main без базы, output/ и python-docx - OK")
+        else:
+            print(f"❌ Импорт main: {result.stdout.strip()} {result.stderr.strip()[-300:]}, создано: {created}")
+            return False
+        
+        db_path = os.path.join(tempfile.mkdtemp(), 'lazy', 'contracts.db')
+        manager = DatabaseManager(db_path)
+        untouched = not os.path.exists(db_path)
+        contract_id = manager.save_contract(1, 'agent', 'Ленивый', {'contract_type': 'agent'})
+        manager.close()
+        if untouched and contract_id and os.path.exists(db_path):
+            print("✅ База открывается при первом запросе - OK")
+        else:
+            print(f"❌ База создана при конструировании: {not untouched}, договор: {contract_id}")
+            return False
+        
+        ticks = iter([0.0, 1.0, 1.5, 2.0, 2.25, 2.5, 3.0, 4.0, 5.0])
+        report = StartupReport(clock=lambda: next(ticks))
+        report.mark('imports')
+        with report.phase('database'):
+            pass
+        first = report.first_update()
+        again = report.first_update()
+        if report.phases == [('imports', 1.0), ('database', 0.25)] and first == 3.0 and again is None:
+            print("✅ Фазы запуска и время до первого обновления - OK")
+        else:
+            print(f"❌ Отчет о запуске: {report.phases}, {first}, {again}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Ленивый запуск - ОШИБКА: {e}")
+        return False
+
+def test_schema_validation():
+    """Тест проверки полей договора по схеме"""
+    print("\n🧾 Тестирование схемы полей...")
+    
+    try:
+        import time
+        from handlers.flow import TRANSITIONS
+        from utils.validator import CONTRACT_SCHEMAS, parse_date, validator
+        
+        if TRANSITIONS['agent:reward'].check('сто') and not TRANSITIONS['agent:reward'].check('100 рублей'):
+            print("✅ Шаг диалога проверяет ответ по схеме - OK")
+        else:
+            print("❌ Шаг вознаграждения принимает сумму без цифр")
+            return False
+        
+        valid = {
+            'contract_type': 'agent', 'contract_name': 'АС-1', 'contract_date': '01.02.2025',
+            'agent_name': 'ООО "Агент"', 'principal_name': 'ООО "Принципал"', 'reward': '150000 рублей',
+            'requisites': 'ИНН 1234567890, КПП 123456789', 'assignment_details': 'Поиск клиентов',
+            'report_details': 'Привлечено 10 клиентов'
+        }
+        rows = [
+            valid,
+            {**valid, 'contract_date': '31.02.2025', 'agent_name': 'А'},
+            {key: value for key, value in valid.items() if key != 'requisites'},
+            {**valid, 'contract_type': 'lease'},
+        ]
+        errors = validator.validate_many(rows)
+        if (errors[0] == {}
+                and set(errors[1]) == {'contract_date', 'agent_name'}
+                and set(errors[2]) == {'requisites'}
+                and set(errors[3]) == {'contract_type'}):
+            print("✅ Ошибки по строкам и полям без исключений - OK")
+        else:
+            print(f"❌ Результат пакетной проверки: {errors}")
+            return False
+        
+        if set(CONTRACT_SCHEMAS['delivery']) >= {'supplier_name', 'price_payment_terms'} and parse_date('1.2.2025'):
+            print("✅ Схемы по типам договоров - OK")
+        else:
+            print("❌ Неполная схема договора поставки")
+            return False
+        
+        many = [{**valid, 'contract_name': f'АС-{number}', 'contract_date': f'{number % 28 + 1:02d}.02.2025'}
+                for number in range(20000)]
+        started = time.perf_counter()
+        errors = validator.validate_many(many)
+        elapsed = time.perf_counter() - started
+        if not any(errors) and elapsed < 2.0:
+            print(f"✅ 20000 строк проверены за {elapsed * 1000:.0f} мс - OK")
+        else:
+            print(f"❌ Пакетная проверка: {elapsed:.2f} с, ошибок: {sum(1 for row in errors if row)}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Схема полей - ОШИБКА: {e}")
+        return False
+
+def test_contract_pagination():
+    """Тест курсорной пагинации списка договоров"""
+    print("\n📚 Тестирование пагинации договоров...")
+    
+    try:
+        import re
+        import tempfile
+        from db.database import DatabaseManager
+        from handlers.common import _decode_cursor, _encode_cursor
+        
+        manager = DatabaseManager(os.path.join(tempfile.mkdtemp(), 'contracts.db'))
+        ids = [
+            manager.save_contract(1, 'agent', f'АД-{number}', {'contract_type': 'agent', 'contract_name': f'АД-{number}'})
+            for number in range(7)
+        ]
+        manager.save_contract(2, 'agent', 'Чужой', {'contract_type': 'agent', 'contract_name': 'Чужой'})
+        # Три договора созданы в одну секунду: порядок между ними определяет id
+        created = ['2025-01-01 10:00:00', '2025-01-02 10:00:00', '2025-01-03 10:00:00', '2025-01-03 10:00:00',
+                   '2025-01-03 10:00:00', '2025-01-04 10:00:00', '2025-01-05 10:00:00']
+        with manager._get_connection() as conn:
+            conn.executemany('UPDATE contracts SET created_at = ? WHERE id = ?', list(zip(created, ids)))
+        expected = list(reversed(ids))
+        
+        pattern = re.compile(r'^contracts_(older|newer):(\d{14}):(\d+)$')
+        
+        def follow(direction: str, contract: dict) -> dict:
+            # Курсор проходит через callback_data так же, как в обработчике кнопок
+            callback_data = f"contracts_{direction}:{_encode_cursor(contract)}"
+            match = pattern.match(callback_data)
+            cursor = _decode_cursor(*match.groups()[1:])
+            if cursor != (contract['created_at'], contract['id']):
+                raise AssertionError(f"курсор {callback_data} разобран как {cursor}")
+            if direction == 'older':
+                return manager.get_user_contracts_page(1, limit=3, before=cursor)
+            return manager.get_user_contracts_page(1, limit=3, after=cursor)
+        
+        pages = [manager.get_user_contracts_page(1, limit=3)]
+        while pages[-1]['has_older']:
+            pages.append(follow('older', pages[-1]['contracts'][-1]))
+        seen = [contract['id'] for page in pages for contract in page['contracts']]
+        flags = [(page['has_newer'], page['has_older']) for page in pages]
+        if seen == expected and flags == [(False, True), (True, True), (True, False)]:
+            print("✅ Переход к старым страницам без пропусков и повторов - OK")
+        else:
+            print(f"❌ Договоры: {seen} (ожидалось {expected}), флаги: {flags}")
+            return False
+        
+        back = [pages[-1]]
+        while back[-1]['has_newer']:
+            back.append(follow('newer', back[-1]['contracts'][0]))
+        if [page['contracts'] for page in back] == [page['contracts'] for page in reversed(pages)] and \
+                (back[-1]['has_newer'], back[-1]['has_older']) == (False, True):
+            print("✅ Возврат к новым страницам по тем же границам - OK")
+        else:
+            print(f"❌ Страницы назад: {[[contract['id'] for contract in page['contracts']] for page in back]}")
+            return False
+        
+        tied = [contract for contract in pages[1]['contracts'] if contract['created_at'] == '2025-01-03 10:00:00']
+        newer = follow('newer', tied[-1])
+        older = follow('older', tied[0])
+        manager.close()
+        if [contract['id'] for contract in newer['contracts']] == expected[1:4] and \
+                [contract['id'] for contract in older['contracts']] == expected[4:]:
+            print("✅ Курсор внутри одной секунды разделяет договоры по id - OK")
+        else:
+            print(f"❌ Соседи одной секунды: {newer['contracts']}, {older['contracts']}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Пагинация договоров - ОШИБКА: {e}")
+        return False
+
+def test_contract_regeneration():
+    """Тест повторной выдачи документов сохраненного договора"""
+    print("\n🔁 Тестирование повторной выдачи договора...")
+    
+    try:
+        import asyncio
+        import re
+        from types import SimpleNamespace
+        from db.database import db_manager
+        from handlers.common import regenerate_contract
+        from handlers.document_generator import document_cache
+        from utils.generation_queue import generation_queue
+        
+        user_id = 12347
+        test_data = {
+            'contract_type': 'delivery',
+            'contract_name': 'Тест №11',
+            'contract_date': '01.01.2025',
+            'supplier_name': 'Поставщик повторной выдачи',
+            'buyer_name': 'Тестовый покупатель',
+            'goods_services': 'Тестовые товары',
+            'price_payment_terms': '1000 рублей',
+            'delivery_terms': '10 дней',
+            'responsibility': 'Тестовая ответственность',
+            'requisites': 'Тестовые реквизиты'
+        }
+        contract_id = db_manager.save_contract(user_id, 'delivery', test_data['contract_name'], test_data)
+        saved_before = len(db_manager.get_user_contracts(user_id))
+        
+        class FakeMessage:
+            def __init__(self):
+                self.documents = []
+            
+            async def answer(self, text, **kwargs):
+                return SimpleNamespace(edit_text=self.answer)
+            
+            async def answer_document(self, document, **kwargs):
+                self.documents.append(document.data)
+        
+        async def answer_callback(text=None, **kwargs):
+            pass
+        
+        # Все обращения обработчика к базе проходят через db_manager.run
+        reads = []
+        original_run = db_manager.run
+        
+        async def recording_run(func, *args, **kwargs):
+            reads.append(func.__name__)
+            return await original_run(func, *args, **kwargs)
+        
+        async def regenerate():
+            message = FakeMessage()
+            callback = SimpleNamespace(from_user=SimpleNamespace(id=user_id), message=message, answer=answer_callback)
+            hits = document_cache.hits
+            await regenerate_contract(callback, re.match(r'^regen:(\d+)(?::(docx|pdf))?$', f"regen:{contract_id}"))
+            return message.documents, document_cache.hits - hits
+        
+        async def regenerate_twice():
+            first = await regenerate()
+            second = await regenerate()
+            await generation_queue.stop(timeout=5)
+            return first, second
+        
+        db_manager.run = recording_run
+        try:
+            (first, first_hits), (second, second_hits) = asyncio.run(regenerate_twice())
+        finally:
+            del db_manager.run
+        
+        if reads == ['get_contract_data', 'get_contract_data']:
+            print("✅ Данные договора загружаются одним запросом по id - OK")
+        else:
+            print(f"❌ Обращения к базе при повторной выдаче: {reads}")
+            return False
+        
+        if len(db_manager.get_user_contracts(user_id)) == saved_before:
+            print("✅ Повторная выдача не создает новый договор - OK")
+        else:
+            print("❌ При повторной выдаче сохранен новый договор")
+            return False
+        
+        if len(first) == 1 and first_hits == 0 and second_hits == 1 and first == second:
+            print("✅ Повторная выдача того же договора обслужена из кэша - OK")
+        else:
+            print(f"❌ Документов: {len(first)}, {len(second)}; попаданий в кэш: {first_hits}, {second_hits}")
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Повторная выдача договора - ОШИБКА: {e}")
+        return False
+
 def test_templates():
     """Тест наличия шаблонов"""
     print("\n📋 Тестирование шаблонов...")
@@ -182,7 +1874,7 @@ def test_templates():
         'delivery_template.docx'
     ]
     
-    templates_dir = '/home/ubuntu/telegram_contract_bot/templates'
+    templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
     
     for template in templates:
         template_path = os.path.join(templates_dir, template)
@@ -201,9 +1893,33 @@ def main():
     tests = [
         ("Импорт модулей", test_imports),
         ("Шаблоны", test_templates),
+        ("Компилятор шаблонов", test_template_compiler),
+        ("Пул генерации", test_worker_pool),
         ("База данных", test_database),
+        ("Соединение с базой данных", test_database_async),
+        ("Хранилище FSM", test_fsm_storage),
         ("Валидатор", test_validator),
-        ("Генерация документов", test_document_generation)
+        ("Генерация документов", test_document_generation),
+        ("Генерация в памяти", test_in_memory_generation),
+        ("Потоковая выдача документов", test_pipelined_generation),
+        ("Кэш документов", test_document_cache),
+        ("Повторная выдача договора", test_contract_regeneration),
+        ("Очистка output/", test_output_janitor),
+        ("Задержка event loop", test_event_loop_latency),
+        ("Вебхук", test_webhook),
+        ("Бенчмарк", test_benchmark),
+        ("Метрики", test_metrics),
+        ("Пакетная генерация", test_bulk_generation),
+        ("PDF", test_pdf_generation),
+        ("Хранение договоров", test_normalized_storage),
+        ("Пагинация договоров", test_contract_pagination),
+        ("Поиск договоров", test_contract_search),
+        ("Ограничители", test_throttling),
+        ("Очередь генерации", test_generation_queue),
+        ("Диалоги договоров", test_contract_flow),
+        ("Контекст состояния", test_state_context),
+        ("Ленивый запуск", test_lazy_startup),
+        ("Схема полей", test_schema_validation)
     ]
     
     passed = 0
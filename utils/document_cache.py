@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+
+class DocumentCache:
+    """LRU-кэш готовых документов с ограничением по количеству и суммарному размеру"""
+    
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Содержимое документа по ключу или None"""
+        content = self._items.get(key)
+        if content is None:
+            self.misses += 1
+            return None
+        
+        self._items.move_to_end(key)
+        self.hits += 1
+        return content
+    
+    def put(self, key: str, content: bytes):
+        """Добавление документа с вытеснением давно не используемых"""
+        if len(content) > self.max_bytes or self.max_items <= 0:
+            return
+        
+        previous = self._items.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        
+        self._items[key] = content
+        self.total_bytes += len(content)
+        
+        while len(self._items) > self.max_items or self.total_bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.evictions += 1
+    
+    def clear(self):
+        self._items.clear()
+        self.total_bytes = 0
+    
+    def stats(self) -> Dict:
+        """Счетчики кэша для админ-панели"""
+        return {
+            'items': len(self._items),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
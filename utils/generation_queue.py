@@ -0,0 +1,180 @@
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import config
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты задач: меньше - раньше. Новый договор важнее повторной выдачи старого
+PRIORITY_NEW = 0
+PRIORITY_REGEN = 1
+
+generation_queue_wait = registry.histogram(
+    'bot_generation_queue_wait_seconds', "Время ожидания задачи генерации в очереди"
+)
+generation_job_duration = registry.histogram(
+    'bot_generation_job_seconds', "Время выполнения задачи генерации (рендеринг и отправка)"
+)
+generation_queue_size = registry.gauge('bot_generation_queue_size', "Задачи генерации в очереди")
+
+class QueueFullError(RuntimeError):
+    """Очередь генерации заполнена или останавливается, задача не принята"""
+
+@dataclass(eq=False)
+class GenerationJob:
+    """Задача генерации в очереди"""
+    priority: int
+    sequence: int
+    func: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    # Задача покинула очередь: взята воркером, отменена или очередь остановлена
+    dequeued: asyncio.Event = field(default_factory=asyncio.Event)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    
+    @property
+    def queued_seconds(self) -> float:
+        """Время в очереди (до сих пор, если задача еще ждет)"""
+        return (self.started_at or time.perf_counter()) - self.enqueued_at
+    
+    @property
+    def run_seconds(self) -> Optional[float]:
+        """Время выполнения; None, пока задача не завершилась"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+class GenerationQueue:
+    """
+    Ограниченная приоритетная очередь задач генерации с фиксированным числом воркеров.
+    Воркеры запускаются при первой задаче; ошибка задачи передается ожидающему
+    и не останавливает воркер.
+    """
+    
+    def __init__(self, workers: int, max_size: int):
+        self.workers = max(1, workers)
+        self.max_size = max(1, max_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._waiting: Dict[int, GenerationJob] = {}
+        # Воркеры, выполняющие задачу; остальные заберут задачу из очереди сразу
+        self._busy = 0
+        self._sequence = itertools.count()
+        self._closed = False
+    
+    @property
+    def size(self) -> int:
+        """Количество задач, ожидающих воркера"""
+        return len(self._waiting)
+    
+    def position(self, job: GenerationJob) -> int:
+        """
+        Место задачи в очереди начиная с 1; 0 - задача не ждет: уже выполняется
+        или ее сразу заберет свободный воркер
+        """
+        if job.sequence not in self._waiting:
+            return 0
+        key = (job.priority, job.sequence)
+        ahead = sum(1 for other in self._waiting.values() if (other.priority, other.sequence) < key)
+        idle = max(0, self.workers - self._busy) if self._tasks else 0
+        return max(0, ahead + 1 - idle)
+    
+    def start(self):
+        """Запуск воркеров в текущем event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Воркеры прежнего event loop (тесты, бенчмарк) недоступны, начинаем заново
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        self._waiting.clear()
+        self._busy = 0
+        self._closed = False
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f'generation-worker-{number}')
+            for number in range(self.workers)
+        ]
+    
+    def submit(self, func: Callable[[], Awaitable[Any]], priority: int = PRIORITY_NEW) -> GenerationJob:
+        """Постановка задачи в очередь без ожидания; при переполнении - QueueFullError"""
+        if self._closed and self._loop is asyncio.get_running_loop():
+            raise QueueFullError("Бот перезапускается, повторите запрос через минуту")
+        self.start()
+        if len(self._waiting) >= self.max_size:
+            raise QueueFullError("Очередь генерации заполнена, повторите запрос через минуту")
+        
+        job = GenerationJob(
+            priority=priority,
+            sequence=next(self._sequence),
+            func=func,
+            future=self._loop.create_future()
+        )
+        self._waiting[job.sequence] = job
+        # Отмененная ожидающим задача сразу освобождает место в очереди
+        job.future.add_done_callback(lambda _: self._leave_queue(job))
+        self._queue.put_nowait((job.priority, job.sequence, job))
+        generation_queue_size.set(value=len(self._waiting))
+        return job
+    
+    def _leave_queue(self, job: GenerationJob):
+        self._waiting.pop(job.sequence, None)
+        job.dequeued.set()
+        generation_queue_size.set(value=len(self._waiting))
+    
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.future.done():
+                    continue
+                self._busy += 1
+                self._leave_queue(job)
+                job.started_at = time.perf_counter()
+                generation_queue_wait.observe(job.queued_seconds)
+                try:
+                    result = await job.func()
+                except Exception as e:
+                    logger.error(f"Ошибка задачи генерации: {e}")
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+                finally:
+                    self._busy -= 1
+                    job.finished_at = time.perf_counter()
+                    generation_job_duration.observe(job.run_seconds)
+                    # Воркер остановлен посреди задачи
+                    if not job.future.done():
+                        job.future.cancel()
+            finally:
+                self._queue.task_done()
+    
+    async def stop(self, timeout: float = 30.0):
+        """Прием задач прекращается, очередь дорабатывает не дольше timeout, затем воркеры останавливаются"""
+        if self._queue is None:
+            return
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Очередь генерации не доработала за {timeout:.0f} с, задач осталось: {self.size}")
+        
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for job in list(self._waiting.values()):
+            job.future.cancel()
+        self._tasks = []
+
+generation_queue = GenerationQueue(
+    workers=config.GENERATION_JOB_WORKERS,
+    max_size=config.GENERATION_JOB_QUEUE_SIZE
+)
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CleanupReport:
+    """Итог одного прохода очистки"""
+    files: int = 0
+    bytes: int = 0
+    remaining_files: int = 0
+    remaining_bytes: int = 0
+
+class OutputJanitor:
+    """
+    Фоновая очистка папки с готовыми документами по возрасту и общему размеру.
+    Сканирование и удаление выполняются небольшими порциями в пуле потоков.
+    """
+    
+    def __init__(self, path: str, max_age: float, max_total_bytes: int, interval: float, batch_size: int = 100):
+        # Нулевой интервал превратил бы фоновую задачу в непрерывное сканирование папки
+        if interval <= 0:
+            raise ValueError(f"Интервал очистки должен быть положительным: {interval}")
+        self.path = path
+        self.max_age = max_age
+        self.max_total_bytes = max_total_bytes
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._requests: List[Tuple[bool, asyncio.Future]] = []
+        self._lock = asyncio.Lock()
+    
+    def _scan(self) -> List[Tuple[str, float, int]]:
+        """Файлы папки: (путь, время изменения, размер), от старых к новым"""
+        entries = []
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        entries.append((entry.path, stat.st_mtime, stat.st_size))
+        except FileNotFoundError:
+            return []
+        
+        entries.sort(key=lambda item: item[1])
+        return entries
+    
+    def _select(self, entries: List[Tuple[str, float, int]], purge_all: bool) -> List[Tuple[str, int]]:
+        """Выбор файлов на удаление: просроченные, затем самые старые сверх бюджета"""
+        if purge_all:
+            return [(path, size) for path, _, size in entries]
+        
+        deadline = time.time() - self.max_age
+        total = sum(size for _, _, size in entries)
+        selected = []
+        for path, mtime, size in entries:
+            if mtime < deadline or total > self.max_total_bytes:
+                selected.append((path, size))
+                total -= size
+        return selected
+    
+    @staticmethod
+    def _delete(batch: List[Tuple[str, int]]) -> Tuple[int, int]:
+        files = 0
+        reclaimed = 0
+        for path, size in batch:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            files += 1
+            reclaimed += size
+        return files, reclaimed
+    
+    async def run_once(self, purge_all: bool = False) -> CleanupReport:
+        """Один проход очистки без блокировки event loop"""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            entries = await loop.run_in_executor(None, self._scan)
+            selected = self._select(entries, purge_all)
+            
+            report = CleanupReport()
+            for start in range(0, len(selected), self.batch_size):
+                files, reclaimed = await loop.run_in_executor(None, self._delete, selected[start:start + self.batch_size])
+                report.files += files
+                report.bytes += reclaimed
+            
+            report.remaining_files = len(entries) - report.files
+            report.remaining_bytes = sum(size for _, _, size in entries) - report.bytes
+            
+            if report.files:
+                logger.info(
+                    f"🧹 Очистка {self.path}: удалено {report.files} файлов ({report.bytes / 1024:.0f} КБ), "
+                    f"осталось {report.remaining_files} ({report.remaining_bytes / 1024:.0f} КБ)"
+                )
+            return report
+    
+    async def _run(self):
+        # Первый проход сразу после запуска, далее по интервалу или по запросу
+        while True:
+            requests, self._requests = self._requests, []
+            purge_all = any(purge for purge, _ in requests)
+            try:
+                report = await self.run_once(purge_all=purge_all)
+            except Exception as e:
+                logger.error(f"Ошибка очистки {self.path}: {e}")
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_result(report)
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+    
+    async def trigger(self, purge_all: bool = True) -> CleanupReport:
+        """Внеочередной проход фоновой задачи; возвращает ее отчет"""
+        if self._task is None:
+            return await self.run_once(purge_all=purge_all)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._requests.append((purge_all, future))
+        self._wakeup.set()
+        return await future
+    
+    def start(self):
+        """Запуск фоновой задачи очистки"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановка фоновой задачи"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+output_janitor = OutputJanitor(
+    path=config.OUTPUT_PATH,
+    max_age=config.OUTPUT_MAX_AGE_HOURS * 3600,
+    max_total_bytes=config.OUTPUT_MAX_TOTAL_MB * 1024 * 1024,
+    interval=config.OUTPUT_CLEANUP_INTERVAL_MIN * 60,
+    batch_size=config.OUTPUT_CLEANUP_BATCH
+)
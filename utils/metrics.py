@@ -0,0 +1,274 @@
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+
+from utils.startup import startup_report
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Metric:
+    kind = 'untyped'
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+    
+    def _key(self, label_values: Tuple[str, ...]) -> Tuple[str, ...]:
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labels}")
+        return tuple(str(value) for value in label_values)
+    
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+    
+    def expose(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        key = self._key(label_values)
+        self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, *label_values: str) -> float:
+        return self._values.get(self._key(label_values), 0)
+    
+    def total(self) -> float:
+        return sum(self._values.values())
+    
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+class Gauge(Counter):
+    """Текущее значение (например, число обрабатываемых обновлений)"""
+    kind = 'gauge'
+    
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+    
+    def set(self, *label_values: str, value: float) -> None:
+        self._values[self._key(label_values)] = value
+
+class Histogram(_Metric):
+    """Распределение длительностей по корзинам"""
+    kind = 'histogram'
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self._series: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, value: float, *label_values: str) -> None:
+        key = self._key(label_values)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+    
+    def quantile(self, q: float, *label_values: str) -> float:
+        """Оценка квантиля по корзинам (линейная интерполяция, как histogram_quantile)"""
+        series = self._series.get(self._key(label_values))
+        if not series or not series[2]:
+            return 0.0
+        
+        rank = q * series[2]
+        cumulative = 0
+        for index, count in enumerate(series[0]):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+    
+    def summary(self) -> List[Tuple[Tuple[str, ...], int, float, float]]:
+        """(метки, количество, среднее, p95) по всем сериям"""
+        return [
+            (key, series[2], series[1] / series[2], self.quantile(0.95, *key))
+            for key, series in sorted(self._series.items())
+            if series[2]
+        ]
+    
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                labels = _format_labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Набор метрик процесса. Все изменения выполняются в потоке event loop,
+    поэтому блокировки не нужны.
+    """
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def _register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+    
+    def gauge(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+    
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+    
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+updates_total = registry.counter('bot_updates_total', "Обработанные обновления", ('type',))
+update_errors_total = registry.counter('bot_update_errors_total', "Обновления, завершившиеся исключением", ('type',))
+updates_in_flight = registry.gauge('bot_updates_in_flight', "Обновления в обработке")
+update_duration = registry.histogram('bot_update_duration_seconds', "Полное время обработки обновления", ('type',))
+
+handler_duration = registry.histogram(
+    'bot_handler_duration_seconds', "Время работы обработчика по состоянию FSM", ('handler', 'state')
+)
+handler_errors_total = registry.counter(
+    'bot_handler_errors_total', "Исключения в обработчиках", ('handler', 'state')
+)
+handlers_in_flight = registry.gauge('bot_handlers_in_flight', "Выполняющиеся обработчики", ('handler',))
+
+document_render_duration = registry.histogram(
+    'bot_document_render_seconds', "Рендеринг документа в пуле генерации", ('template', 'format')
+)
+document_wait_duration = registry.histogram(
+    'bot_document_wait_seconds', "Ожидание документа с учетом очереди пула", ('template', 'format')
+)
+document_cache_requests = registry.counter(
+    'bot_document_cache_requests_total', "Обращения к кэшу документов", ('result', 'format')
+)
+
+startup_phase_duration = registry.gauge('bot_startup_phase_seconds', "Длительность фаз запуска", ('phase',))
+cold_start_to_first_update = registry.gauge(
+    'bot_cold_start_to_first_update_seconds', "Время от запуска процесса до обработки первого обновления"
+)
+
+def publish_startup_report() -> None:
+    """Фазы запуска в метриках"""
+    for phase, seconds in startup_report.phases:
+        startup_phase_duration.set(phase, value=seconds)
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: время, ошибки и число обновлений в обработке"""
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        updates_total.inc(update_type)
+        updates_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            update_errors_total.inc(update_type)
+            raise
+        finally:
+            update_duration.observe(time.perf_counter() - started, update_type)
+            updates_in_flight.dec()
+            cold_start = startup_report.first_update()
+            if cold_start is not None:
+                cold_start_to_first_update.set(value=cold_start)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время конкретного обработчика в разрезе состояния FSM"""
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        state = data.get('raw_state') or 'none'
+        
+        handlers_in_flight.inc(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors_total.inc(name, state)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, name, state)
+            handlers_in_flight.dec(name)
+
+def setup_metrics(dp: Dispatcher) -> None:
+    """Подключение сбора метрик к диспетчеру"""
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Внутренние middleware диспетчера действуют и на обработчики вложенных роутеров
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+
+def build_metrics_app(metrics: Optional[MetricsRegistry] = None) -> web.Application:
+    """aiohttp-приложение с одним адресом /metrics"""
+    metrics = metrics or registry
+    
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+    
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запуск HTTP-сервера метрик; остановка через runner.cleanup()"""
+    runner = web.AppRunner(build_metrics_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,347 @@
+import functools
+import io
+import os
+import struct
+from typing import Dict, Iterable, List, Set, Tuple
+
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject,
+    NameObject, NumberObject, TextStringObject
+)
+
+# Страница A4 и поля, в пунктах
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 56.7
+FONT_SIZE = 11
+LEADING = 15
+
+# Таблицы TrueType, которые нужны просмотрщику для CID-шрифта
+_SUBSET_TABLES = (b'head', b'hhea', b'maxp', b'hmtx', b'loca', b'glyf', b'cvt ', b'fpgm', b'prep')
+
+class FontError(ValueError):
+    """Файл шрифта не найден или не является TrueType"""
+
+class TrueTypeFont:
+    """Минимальный разбор TrueType: метрики, таблица символов и подмножество глифов"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.name = ''.join(ch for ch in os.path.splitext(os.path.basename(path))[0] if ch.isalnum() or ch == '-')
+        
+        try:
+            with open(path, 'rb') as f:
+                self.data = f.read()
+            self.tables = self._read_tables()
+            self._read_metrics()
+            self.cmap = self._read_cmap()
+        except (OSError, struct.error, KeyError) as e:
+            raise FontError(f"Не удалось загрузить шрифт {path}: {e}")
+    
+    def _read_tables(self) -> Dict[bytes, Tuple[int, int]]:
+        num_tables = struct.unpack_from('>H', self.data, 4)[0]
+        tables = {}
+        for index in range(num_tables):
+            tag, _, offset, length = struct.unpack_from('>4sIII', self.data, 12 + index * 16)
+            tables[tag] = (offset, length)
+        return tables
+    
+    def _table(self, tag: bytes) -> bytes:
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+    
+    def _read_metrics(self):
+        head = self._table(b'head')
+        self.units_per_em = struct.unpack_from('>H', head, 18)[0]
+        self.bbox = struct.unpack_from('>4h', head, 36)
+        self.long_loca = struct.unpack_from('>h', head, 50)[0] == 1
+        
+        hhea = self._table(b'hhea')
+        self.ascent, self.descent = struct.unpack_from('>hh', hhea, 4)
+        metrics_count = struct.unpack_from('>H', hhea, 34)[0]
+        self.num_glyphs = struct.unpack_from('>H', self._table(b'maxp'), 4)[0]
+        
+        hmtx = self._table(b'hmtx')
+        advances = [struct.unpack_from('>H', hmtx, index * 4)[0] for index in range(metrics_count)]
+        # Глифы после numberOfHMetrics используют последнюю ширину
+        advances.extend([advances[-1]] * (self.num_glyphs - metrics_count))
+        self.advances = advances
+        
+        loca = self._table(b'loca')
+        if self.long_loca:
+            self.loca = list(struct.unpack_from(f'>{self.num_glyphs + 1}I', loca))
+        else:
+            self.loca = [value * 2 for value in struct.unpack_from(f'>{self.num_glyphs + 1}H', loca)]
+    
+    def _read_cmap(self) -> Dict[int, int]:
+        cmap = self._table(b'cmap')
+        count = struct.unpack_from('>H', cmap, 2)[0]
+        subtables = {}
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from('>HHI', cmap, 4 + index * 8)
+            subtables[(platform, encoding)] = offset
+        
+        # Предпочитаем полную таблицу Unicode (формат 12), затем BMP (формат 4)
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+            if key in subtables:
+                offset = subtables[key]
+                table_format = struct.unpack_from('>H', cmap, offset)[0]
+                if table_format == 12:
+                    return self._read_cmap_12(cmap, offset)
+                if table_format == 4:
+                    return self._read_cmap_4(cmap, offset)
+        raise FontError(f"В шрифте {self.path} нет таблицы символов Unicode")
+    
+    @staticmethod
+    def _read_cmap_4(cmap: bytes, offset: int) -> Dict[int, int]:
+        seg_count = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+        ends = struct.unpack_from(f'>{seg_count}H', cmap, offset + 14)
+        starts = struct.unpack_from(f'>{seg_count}H', cmap, offset + 16 + seg_count * 2)
+        deltas = struct.unpack_from(f'>{seg_count}h', cmap, offset + 16 + seg_count * 4)
+        range_offsets_at = offset + 16 + seg_count * 6
+        range_offsets = struct.unpack_from(f'>{seg_count}H', cmap, range_offsets_at)
+        
+        mapping = {}
+        for index in range(seg_count):
+            for code in range(starts[index], ends[index] + 1):
+                if code == 0xFFFF:
+                    continue
+                if range_offsets[index] == 0:
+                    glyph = (code + deltas[index]) & 0xFFFF
+                else:
+                    at = range_offsets_at + index * 2 + range_offsets[index] + (code - starts[index]) * 2
+                    glyph = struct.unpack_from('>H', cmap, at)[0]
+                    if glyph:
+                        glyph = (glyph + deltas[index]) & 0xFFFF
+                if glyph:
+                    mapping[code] = glyph
+        return mapping
+    
+    @staticmethod
+    def _read_cmap_12(cmap: bytes, offset: int) -> Dict[int, int]:
+        groups = struct.unpack_from('>I', cmap, offset + 12)[0]
+        mapping = {}
+        for index in range(groups):
+            start, end, glyph = struct.unpack_from('>III', cmap, offset + 16 + index * 12)
+            for code in range(start, end + 1):
+                mapping[code] = glyph + code - start
+        return mapping
+    
+    def glyph(self, char: str) -> int:
+        return self.cmap.get(ord(char), 0)
+    
+    def text_width(self, text: str, size: float) -> float:
+        """Ширина строки в пунктах"""
+        return sum(self.advances[self.glyph(char)] for char in text) * size / self.units_per_em
+    
+    def width_1000(self, glyph: int) -> int:
+        """Ширина глифа в единицах PDF (1/1000 кегля)"""
+        return round(self.advances[glyph] * 1000 / self.units_per_em)
+    
+    def _with_components(self, glyphs: Set[int]) -> Set[int]:
+        """Добавление глифов, из которых собраны составные глифы"""
+        glyf_offset = self.tables[b'glyf'][0]
+        result = set(glyphs) | {0}
+        queue = list(result)
+        while queue:
+            glyph = queue.pop()
+            start, end = self.loca[glyph], self.loca[glyph + 1]
+            if end - start < 10 or struct.unpack_from('>h', self.data, glyf_offset + start)[0] >= 0:
+                continue
+            
+            at = glyf_offset + start + 10
+            while True:
+                flags, component = struct.unpack_from('>HH', self.data, at)
+                if component not in result:
+                    result.add(component)
+                    queue.append(component)
+                at += 4 + (4 if flags & 0x0001 else 2)
+                if flags & 0x0008:
+                    at += 2
+                elif flags & 0x0040:
+                    at += 4
+                elif flags & 0x0080:
+                    at += 8
+                if not flags & 0x0020:
+                    break
+        return result
+    
+    def subset(self, glyphs: Iterable[int]) -> bytes:
+        """
+        Файл шрифта, в котором остались только нужные глифы.
+        Номера глифов не меняются, неиспользуемые глифы становятся пустыми.
+        """
+        keep = self._with_components(set(glyphs))
+        glyf_offset = self.tables[b'glyf'][0]
+        
+        glyf = bytearray()
+        loca = [0]
+        for glyph in range(self.num_glyphs):
+            if glyph in keep:
+                glyf += self.data[glyf_offset + self.loca[glyph]:glyf_offset + self.loca[glyph + 1]]
+                glyf += b'\0' * (-len(glyf) % 4)
+            loca.append(len(glyf))
+        
+        head = bytearray(self._table(b'head'))
+        struct.pack_into('>I', head, 8, 0)
+        struct.pack_into('>h', head, 50, 1)
+        
+        tables = {tag: self._table(tag) for tag in _SUBSET_TABLES if tag in self.tables}
+        tables.update({b'head': bytes(head), b'glyf': bytes(glyf), b'loca': struct.pack(f'>{len(loca)}I', *loca)})
+        return _build_font_file(tables)
+
+def _checksum(data: bytes) -> int:
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+def _build_font_file(tables: Dict[bytes, bytes]) -> bytes:
+    tags = sorted(tables)
+    power = 1
+    while power * 2 <= len(tags):
+        power *= 2
+    header = struct.pack('>IHHHH', 0x00010000, len(tags), power * 16, power.bit_length() - 1,
+                         len(tags) * 16 - power * 16)
+    
+    directory = b''
+    body = b''
+    offset = 12 + len(tags) * 16
+    for tag in tags:
+        data = tables[tag]
+        directory += struct.pack('>4sIII', tag, _checksum(data), offset + len(body), len(data))
+        body += data + b'\0' * (-len(data) % 4)
+    return header + directory + body
+
+@functools.lru_cache(maxsize=4)
+def load_font(path: str) -> TrueTypeFont:
+    """Шрифт разбирается один раз на процесс"""
+    return TrueTypeFont(path)
+
+def wrap_lines(text: str, font: TrueTypeFont, size: float, width: float) -> List[str]:
+    """Перенос строк по словам под ширину колонки"""
+    lines = []
+    for paragraph in text.replace('\t', '    ').split('\n'):
+        line = ''
+        for word in paragraph.split(' '):
+            candidate = f"{line} {word}" if line else word
+            if font.text_width(candidate, size) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            # Слово длиннее строки переносится по символам
+            line = ''
+            for char in word:
+                if line and font.text_width(line + char, size) > width:
+                    lines.append(line)
+                    line = ''
+                line += char
+        lines.append(line)
+    return lines
+
+def _hex_glyphs(text: str, font: TrueTypeFont) -> str:
+    return ''.join(f'{font.glyph(char):04X}' for char in text)
+
+def _to_unicode_cmap(chars: Dict[int, str]) -> bytes:
+    """CMap для копирования и поиска текста в PDF"""
+    entries = sorted(chars.items())
+    lines = [
+        '/CIDInit /ProcSet findresource begin', '12 dict begin', 'begincmap',
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+        '/CMapName /Adobe-Identity-UCS def', '/CMapType 2 def',
+        '1 begincodespacerange', '<0000> <FFFF>', 'endcodespacerange',
+    ]
+    for start in range(0, len(entries), 100):
+        chunk = entries[start:start + 100]
+        lines.append(f'{len(chunk)} beginbfchar')
+        for glyph, char in chunk:
+            lines.append(f'<{glyph:04X}> <{char.encode("utf-16-be").hex().upper()}>')
+        lines.append('endbfchar')
+    lines += ['endcmap', 'CMapName currentdict /CMap defineresource pop', 'end', 'end']
+    return '\n'.join(lines).encode('ascii')
+
+def _stream(writer: PdfWriter, data: bytes, compress: bool = True, **entries) -> object:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    if compress:
+        stream = stream.flate_encode()
+    for key, value in entries.items():
+        stream[NameObject(f'/{key}')] = value
+    return writer._add_object(stream)
+
+def render_pdf(text: str, font_path: str, title: str = '') -> bytes:
+    """PDF формата A4 из готового текста документа со встроенным подмножеством шрифта"""
+    font = load_font(font_path)
+    lines = wrap_lines(text, font, FONT_SIZE, PAGE_WIDTH - 2 * MARGIN)
+    lines_per_page = max(1, int((PAGE_HEIGHT - 2 * MARGIN) // LEADING))
+    pages = [lines[start:start + lines_per_page] for start in range(0, len(lines), lines_per_page)] or [[]]
+    
+    used = {font.glyph(char): char for line in lines for char in line}
+    used.pop(0, None)
+    
+    writer = PdfWriter()
+    font_file = font.subset(used)
+    font_descriptor = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/FontDescriptor'),
+        NameObject('/FontName'): NameObject(f'/AAAAAA+{font.name}'),
+        NameObject('/Flags'): NumberObject(32),
+        NameObject('/FontBBox'): ArrayObject(
+            [NumberObject(round(value * 1000 / font.units_per_em)) for value in font.bbox]
+        ),
+        NameObject('/ItalicAngle'): NumberObject(0),
+        NameObject('/Ascent'): NumberObject(round(font.ascent * 1000 / font.units_per_em)),
+        NameObject('/Descent'): NumberObject(round(font.descent * 1000 / font.units_per_em)),
+        NameObject('/CapHeight'): NumberObject(round(font.ascent * 1000 / font.units_per_em)),
+        NameObject('/StemV'): NumberObject(80),
+        NameObject('/FontFile2'): _stream(writer, font_file, Length1=NumberObject(len(font_file))),
+    }))
+    
+    widths = ArrayObject()
+    for glyph in sorted(used):
+        widths += [NumberObject(glyph), ArrayObject([NumberObject(font.width_1000(glyph))])]
+    
+    cid_font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/CIDFontType2'),
+        NameObject('/BaseFont'): NameObject(f'/AAAAAA+{font.name}'),
+        NameObject('/CIDSystemInfo'): DictionaryObject({
+            NameObject('/Registry'): TextStringObject('Adobe'),
+            NameObject('/Ordering'): TextStringObject('Identity'),
+            NameObject('/Supplement'): NumberObject(0),
+        }),
+        NameObject('/FontDescriptor'): font_descriptor,
+        NameObject('/DW'): NumberObject(font.width_1000(0)),
+        NameObject('/W'): widths,
+        NameObject('/CIDToGIDMap'): NameObject('/Identity'),
+    }))
+    
+    font_ref = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type0'),
+        NameObject('/BaseFont'): NameObject(f'/AAAAAA+{font.name}'),
+        NameObject('/Encoding'): NameObject('/Identity-H'),
+        NameObject('/DescendantFonts'): ArrayObject([cid_font]),
+        NameObject('/ToUnicode'): _stream(writer, _to_unicode_cmap(used)),
+    }))
+    
+    for page_lines in pages:
+        page = PageObject.create_blank_page(writer, PAGE_WIDTH, PAGE_HEIGHT)
+        content = [f'BT /F1 {FONT_SIZE} Tf {LEADING} TL {MARGIN:.2f} {PAGE_HEIGHT - MARGIN - FONT_SIZE:.2f} Td']
+        for line in page_lines:
+            if line:
+                content.append(f'<{_hex_glyphs(line, font)}> Tj')
+            content.append('T*')
+        content.append('ET')
+        
+        page[NameObject('/Contents')] = _stream(writer, '\n'.join(content).encode('ascii'))
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font_ref})
+        })
+        writer.add_page(page)
+    
+    if title:
+        writer.add_metadata({'/Title': title, '/Producer': 'contract_bot'})
+    
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,56 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class StartupReport:
+    """
+    Время запуска бота по фазам.
+    Отсчет идет с импорта этого модуля, поэтому main.py импортирует его первым;
+    модуль намеренно зависит только от стандартной библиотеки
+    """
+    
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self.started_at = clock()
+        self.phases: List[Tuple[str, float]] = []
+        self._last_mark = self.started_at
+        self.first_update_seconds: Optional[float] = None
+    
+    def _record(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+        self._last_mark = self._clock()
+    
+    def mark(self, name: str):
+        """Фаза от предыдущей отметки до текущего момента (например, импорт модулей)"""
+        self._record(name, self._clock() - self._last_mark)
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Замер фазы запуска; время фазы записывается и при ошибке"""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self._record(name, self._clock() - started)
+    
+    @property
+    def elapsed(self) -> float:
+        """Время с начала запуска"""
+        return self._clock() - self.started_at
+    
+    def first_update(self) -> Optional[float]:
+        """Отметка первого обработанного обновления; возвращает время холодного старта только в первый раз"""
+        if self.first_update_seconds is not None:
+            return None
+        self.first_update_seconds = self.elapsed
+        return self.first_update_seconds
+    
+    def log(self):
+        """Отчет о запуске в лог: время каждой фазы и общее"""
+        lines = [f"  {name:<24}{seconds * 1000:>10.1f} мс" for name, seconds in self.phases]
+        logger.info(f"🚀 Запуск за {self.elapsed * 1000:.1f} мс:\n" + '\n'.join(lines))
+
+startup_report = StartupReport()
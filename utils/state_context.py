@@ -0,0 +1,131 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DEFAULT_DESTINY, BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+# Значение еще не прочитано из хранилища
+_NOT_LOADED: Any = object()
+
+class BufferedFSMContext(FSMContext):
+    """
+    Состояние FSM на время одного обновления.
+    Состояние и данные читаются из хранилища один раз, обработчик меняет их локально,
+    а flush() записывает изменения одной операцией, если хранилище это умеет
+    (get_state_and_data / set_state_and_data, как у SQLiteStorage)
+    """
+    
+    def __init__(self, storage: BaseStorage, key: StorageKey):
+        super().__init__(storage=storage, key=key)
+        self._state: Optional[str] = _NOT_LOADED
+        self._data: Dict[str, Any] = _NOT_LOADED
+        # То, что лежит в хранилище: неизмененное значение записывать не нужно
+        self._stored_state: Optional[str] = _NOT_LOADED
+        self._stored_data: Dict[str, Any] = _NOT_LOADED
+    
+    async def _load(self, with_data: bool = False):
+        read_both = getattr(self.storage, 'get_state_and_data', None)
+        if read_both is not None:
+            state, data = await read_both(self.key)
+            self._stored_state, self._stored_data = state, data.copy()
+            if self._state is _NOT_LOADED:
+                self._state = state
+            if self._data is _NOT_LOADED:
+                self._data = data
+        elif with_data:
+            self._data = await self.storage.get_data(key=self.key)
+            self._stored_data = self._data.copy()
+        else:
+            self._state = self._stored_state = await self.storage.get_state(key=self.key)
+    
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+    
+    async def get_state(self) -> Optional[str]:
+        if self._state is _NOT_LOADED:
+            await self._load()
+        return self._state
+    
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = data.copy()
+    
+    async def get_data(self) -> Dict[str, Any]:
+        if self._data is _NOT_LOADED:
+            await self._load(with_data=True)
+        return self._data.copy()
+    
+    async def get_value(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        if self._data is _NOT_LOADED:
+            await self._load(with_data=True)
+        return self._data.get(key, default)
+    
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        if self._data is _NOT_LOADED:
+            await self._load(with_data=True)
+        self._data.update(kwargs)
+        return self._data.copy()
+    
+    async def flush(self) -> None:
+        """Запись изменений за обновление; если ничего не изменилось, хранилище не трогаем"""
+        state_changed = self._state is not _NOT_LOADED and self._state != self._stored_state
+        data_changed = self._data is not _NOT_LOADED and self._data != self._stored_data
+        
+        write_both = getattr(self.storage, 'set_state_and_data', None)
+        if state_changed and data_changed and write_both is not None:
+            await write_both(self.key, self._state, self._data)
+        else:
+            if data_changed:
+                await self.storage.set_data(key=self.key, data=self._data)
+            if state_changed:
+                await self.storage.set_state(key=self.key, state=self._state)
+        
+        if state_changed:
+            self._stored_state = self._state
+        if data_changed:
+            self._stored_data = self._data.copy()
+
+class StateContextMiddleware(FSMContextMiddleware):
+    """
+    FSMContextMiddleware, который передает обработчикам BufferedFSMContext
+    и записывает изменения после обработки обновления (внутри блокировки событий)
+    """
+    
+    def resolve_event_context(self, bot: Bot, data: Dict[str, Any],
+                              destiny: str = DEFAULT_DESTINY) -> Optional[FSMContext]:
+        # get_context остается прежним: контексты вне обработки обновлений пишут сразу
+        context = super().resolve_event_context(bot, data, destiny)
+        if context is None:
+            return None
+        return BufferedFSMContext(storage=context.storage, key=context.key)
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        async def handle_and_flush(event: TelegramObject, data: Dict[str, Any]) -> Any:
+            try:
+                return await handler(event, data)
+            finally:
+                state = data.get('state')
+                if isinstance(state, BufferedFSMContext):
+                    await state.flush()
+        
+        return await super().__call__(handle_and_flush, event, data)
+
+def setup_state_context(dp: Dispatcher) -> None:
+    """Замена FSM-middleware диспетчера на буферизующий; порядок middleware сохраняется"""
+    middleware = StateContextMiddleware(
+        storage=dp.fsm.storage,
+        events_isolation=dp.fsm.events_isolation,
+        strategy=dp.fsm.strategy
+    )
+    
+    outer_middlewares = list(dp.update.outer_middleware)
+    for registered in outer_middlewares:
+        dp.update.outer_middleware.unregister(registered)
+    for registered in outer_middlewares:
+        dp.update.outer_middleware.register(middleware if registered is dp.fsm else registered)
+    dp.fsm = middleware
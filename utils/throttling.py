@@ -0,0 +1,146 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import config
+from utils.metrics import registry
+
+# Флаг обработчиков, запускающих генерацию комплекта документов
+GENERATION_FLAG = 'generation'
+
+throttled_total = registry.counter(
+    'bot_throttled_total', "Отклоненные ограничителем запросы", ('reason',)
+)
+generations_in_flight = registry.gauge('bot_generations_in_flight', "Выполняющиеся генерации документов")
+
+class TokenBucketLimiter:
+    """
+    Token bucket на каждый ключ: rate токенов в секунду, не больше capacity.
+    Полностью восстановившиеся корзины и самые давние сверх max_keys удаляются,
+    чтобы словарь не рос бесконечно; on_evict получает ключ удаленной корзины
+    """
+    
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_evict: Optional[Callable[[Hashable], None]] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._clock = clock
+        self._on_evict = on_evict
+        # Порядок корзин - по последнему обращению, давние в начале
+        self._buckets: OrderedDict[Hashable, Tuple[float, float]] = OrderedDict()
+    
+    def _tokens(self, key: Hashable, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+    
+    def allow(self, key: Hashable) -> bool:
+        """Списание токена; False, если корзина пуста"""
+        now = self._clock()
+        tokens = self._tokens(key, now)
+        allowed = tokens >= 1
+        self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        self._buckets.move_to_end(key)
+        self._prune(now)
+        return allowed
+    
+    def _prune(self, now: float):
+        """Удаление с начала очереди: проверка останавливается на первой нужной корзине"""
+        while self._buckets:
+            key = next(iter(self._buckets))
+            if len(self._buckets) <= self.max_keys and self._tokens(key, now) < self.capacity:
+                break
+            del self._buckets[key]
+            if self._on_evict is not None:
+                self._on_evict(key)
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware: ограничение частоты сообщений и нажатий одного пользователя"""
+    
+    def __init__(self, rate: float, burst: float):
+        # Предупреждаем один раз, пока пользователь не уложится в лимит;
+        # отметка удаляется вместе с корзиной пользователя
+        self._warned: Set[int] = set()
+        self.limiter = TokenBucketLimiter(rate, burst, on_evict=self._warned.discard)
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get('event_from_user')
+        if user is None or self.limiter.allow(user.id):
+            if user is not None:
+                self._warned.discard(user.id)
+            return await handler(event, data)
+        
+        throttled_total.inc('flood')
+        if isinstance(event, CallbackQuery):
+            await event.answer("⏳ Слишком часто, подождите немного")
+        elif isinstance(event, Message) and user.id not in self._warned:
+            self._warned.add(user.id)
+            await event.answer("⏳ Слишком много сообщений. Подождите немного и повторите.")
+        return None
+
+class GenerationLimitMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware обработчиков с флагом generation: у пользователя одна
+    генерация за раз и ограниченная частота, во всем боте - не больше max_in_flight
+    """
+    
+    def __init__(self, rate_per_minute: float, burst: float, max_in_flight: int):
+        self.limiter = TokenBucketLimiter(rate_per_minute / 60, burst) if rate_per_minute else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._active_users: Set[int] = set()
+    
+    def _rejection(self, user_id: int) -> Optional[Tuple[str, str]]:
+        """Причина отказа для метрики и текст ответа; None, если генерацию можно запускать"""
+        if user_id in self._active_users:
+            return 'duplicate', "⏳ Документы уже готовятся, дождитесь их отправки."
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return 'busy', "🚦 Бот сейчас загружен. Повторите через минуту - введенные данные сохранены."
+        if self.limiter is not None and not self.limiter.allow(user_id):
+            return 'rate', "⏳ Слишком много генераций подряд. Повторите через минуту - введенные данные сохранены."
+        return None
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get('event_from_user')
+        if user is None or not get_flag(data, GENERATION_FLAG):
+            return await handler(event, data)
+        
+        rejection = self._rejection(user.id)
+        if rejection is not None:
+            reason, text = rejection
+            throttled_total.inc(reason)
+            # Быстрый ответ вместо постановки генерации в очередь
+            await event.answer(text)
+            return None
+        
+        self._active_users.add(user.id)
+        self.in_flight += 1
+        generations_in_flight.inc()
+        try:
+            return await handler(event, data)
+        finally:
+            self._active_users.discard(user.id)
+            self.in_flight -= 1
+            generations_in_flight.dec()
+
+def setup_throttling(dp: Dispatcher) -> None:
+    """Подключение ограничителей к диспетчеру; нулевые лимиты в конфиге их отключают"""
+    if config.THROTTLE_RATE:
+        throttling = ThrottlingMiddleware(config.THROTTLE_RATE, config.THROTTLE_BURST)
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
+    
+    generation_limit = GenerationLimitMiddleware(
+        config.GENERATION_RATE_PER_MINUTE,
+        config.GENERATION_BURST,
+        config.GENERATION_MAX_IN_FLIGHT
+    )
+    dp.message.middleware(generation_limit)
+    dp.callback_query.middleware(generation_limit)
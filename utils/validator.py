@@ -1,6 +1,118 @@
+import functools
 import re
-from datetime import datetime
-from typing import Optional, Tuple
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTRACT_TYPES = ('agent', 'subagent', 'delivery')
+
+# Названия полей договора для сообщений об ошибках
+FIELD_LABELS = {
+    'agent_name': 'Название агента',
+    'subagent_name': 'Название субагента',
+    'principal_name': 'Название принципала',
+    'supplier_name': 'Название поставщика',
+    'buyer_name': 'Название покупателя',
+    'agreement_subject': 'Предмет соглашения',
+    'assignment_details': 'Детали поручения',
+    'report_details': 'Детали отчета',
+    'goods_services': 'Перечень товаров',
+    'delivery_terms': 'Условия поставки',
+    'responsibility': 'Ответственность сторон',
+}
+
+DATE_ERROR = "Неверный формат даты. Используйте формат ДД.ММ.ГГГГ (например: 01.01.2025)"
+MISSING_ERROR = "Поле не заполнено"
+
+# Регулярные выражения компилируются один раз при импорте
+_DATE_PATTERN = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+_DIGIT_PATTERN = re.compile(r'\d')
+
+# Проверка значения поля: текст ошибки или None
+FieldCheck = Callable[[str], Optional[str]]
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(value: str) -> Optional[date]:
+    """Дата в формате ДД.ММ.ГГГГ или None; в пакетах даты повторяются, поэтому разбор кэшируется"""
+    match = _DATE_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    day, month, year = map(int, match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+def check_date(value: str) -> Optional[str]:
+    return None if parse_date(value) else DATE_ERROR
+
+def check_length(value: str, min_length: int, max_length: int, too_short: str, too_long: str) -> Optional[str]:
+    if not value or len(value.strip()) < min_length:
+        return too_short
+    if len(value) > max_length:
+        return too_long
+    return None
+
+def check_money(value: str) -> Optional[str]:
+    if not value or not value.strip():
+        return "Сумма не может быть пустой"
+    if not _DIGIT_PATTERN.search(value):
+        return "Сумма должна содержать числовое значение"
+    return None
+
+def _name_rule(label: str) -> FieldCheck:
+    return functools.partial(
+        check_length, min_length=2, max_length=200,
+        too_short=f"{label} должно содержать минимум 2 символа",
+        too_long=f"{label} слишком длинное (максимум 200 символов)"
+    )
+
+def _text_rule(label: str, min_length: int = 5) -> FieldCheck:
+    return functools.partial(
+        check_length, min_length=min_length, max_length=2000,
+        too_short=f"{label} должно содержать минимум {min_length} символов",
+        too_long=f"{label} слишком длинное (максимум 2000 символов)"
+    )
+
+# Проверки полей; сообщения об ошибках собраны заранее
+FIELD_RULES: Dict[str, FieldCheck] = {
+    'contract_name': functools.partial(
+        check_length, min_length=1, max_length=100,
+        too_short="Название договора не может быть пустым",
+        too_long="Название договора слишком длинное (максимум 100 символов)"
+    ),
+    'contract_date': check_date,
+    'reward': check_money,
+    'price_payment_terms': check_money,
+    'requisites': functools.partial(
+        check_length, min_length=10, max_length=1000,
+        too_short="Реквизиты должны содержать минимум 10 символов",
+        too_long="Реквизиты слишком длинные (максимум 1000 символов)"
+    ),
+    **{field: _name_rule(label) for field, label in FIELD_LABELS.items() if field.endswith('_name')},
+    **{field: _text_rule(label) for field, label in FIELD_LABELS.items() if not field.endswith('_name')},
+}
+
+# Поля договора каждого типа; все обязательны
+CONTRACT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'agent': (
+        'contract_name', 'contract_date', 'agent_name', 'principal_name', 'reward', 'requisites',
+        'assignment_details', 'report_details'
+    ),
+    'subagent': (
+        'contract_name', 'contract_date', 'agent_name', 'subagent_name', 'principal_name', 'agreement_subject',
+        'reward', 'requisites', 'assignment_details', 'report_details'
+    ),
+    'delivery': (
+        'contract_name', 'contract_date', 'supplier_name', 'buyer_name', 'goods_services', 'price_payment_terms',
+        'delivery_terms', 'responsibility', 'requisites'
+    ),
+}
+
+# Схема по типу договора: поле -> проверка
+CONTRACT_SCHEMAS: Dict[str, Dict[str, FieldCheck]] = {
+    contract_type: {field: FIELD_RULES[field] for field in fields}
+    for contract_type, fields in CONTRACT_FIELDS.items()
+}
 
 class DataValidator:
     """Класс для валидации пользовательских данных"""
@@ -11,77 +123,97 @@ class DataValidator:
         Валидация даты в формате ДД.ММ.ГГГГ
         Возвращает (is_valid, error_message)
         """
-        try:
-            datetime.strptime(date_str, "%d.%m.%Y")
-            return True, None
-        except ValueError:
-            return False, "Неверный формат даты. Используйте формат ДД.ММ.ГГГГ (например: 01.01.2025)"
+        error = check_date(date_str)
+        return error is None, error
     
     @staticmethod
     def validate_contract_name(name: str) -> Tuple[bool, Optional[str]]:
         """
         Валидация названия договора
         """
-        if not name or len(name.strip()) < 1:
-            return False, "Название договора не может быть пустым"
-        
-        if len(name) > 100:
-            return False, "Название договора слишком длинное (максимум 100 символов)"
-        
-        return True, None
+        error = FIELD_RULES['contract_name'](name)
+        return error is None, error
     
     @staticmethod
     def validate_name(name: str, field_name: str) -> Tuple[bool, Optional[str]]:
         """
         Валидация имен/названий организаций
         """
-        if not name or len(name.strip()) < 2:
-            return False, f"{field_name} должно содержать минимум 2 символа"
-        
-        if len(name) > 200:
-            return False, f"{field_name} слишком длинное (максимум 200 символов)"
-        
-        return True, None
+        error = _name_rule(field_name)(name)
+        return error is None, error
     
     @staticmethod
     def validate_money_amount(amount: str) -> Tuple[bool, Optional[str]]:
         """
         Валидация денежных сумм
         """
-        if not amount or len(amount.strip()) < 1:
-            return False, "Сумма не может быть пустой"
-        
-        # Проверяем, содержит ли строка цифры
-        if not re.search(r'\d', amount):
-            return False, "Сумма должна содержать числовое значение"
-        
-        return True, None
+        error = check_money(amount)
+        return error is None, error
     
     @staticmethod
     def validate_text_field(text: str, field_name: str, min_length: int = 5) -> Tuple[bool, Optional[str]]:
         """
         Валидация текстовых полей
         """
-        if not text or len(text.strip()) < min_length:
-            return False, f"{field_name} должно содержать минимум {min_length} символов"
-        
-        if len(text) > 2000:
-            return False, f"{field_name} слишком длинное (максимум 2000 символов)"
-        
-        return True, None
+        error = _text_rule(field_name, min_length)(text)
+        return error is None, error
     
     @staticmethod
     def validate_requisites(requisites: str) -> Tuple[bool, Optional[str]]:
         """
         Валидация реквизитов
         """
-        if not requisites or len(requisites.strip()) < 10:
-            return False, "Реквизиты должны содержать минимум 10 символов"
+        error = FIELD_RULES['requisites'](requisites)
+        return error is None, error
+    
+    @staticmethod
+    def field_check(contract_type: str, field: str) -> FieldCheck:
+        """Проверка поля по схеме типа договора (для шагов диалога)"""
+        schema = CONTRACT_SCHEMAS.get(contract_type)
+        if schema is None or field not in schema:
+            raise KeyError(f"Поле {field} не описано в схеме договора {contract_type}")
+        return schema[field]
+    
+    def validate_contract(self, data: Dict) -> List[str]:
+        """
+        Проверка всех полей договора по схеме его типа.
+        Возвращает список ошибок; пустой список - данные корректны
+        """
+        return [f"{field}: {error}" for field, error in self.validate_many([data])[0].items()]
+    
+    def validate_many(self, rows: Iterable[Dict]) -> List[Dict[str, str]]:
+        """
+        Пакетная проверка строк (импорт договоров) без исключений.
+        Для каждой строки возвращает словарь поле -> ошибка; пустой словарь - строка корректна.
+        Проверка идет по столбцам: одинаковые значения поля проверяются один раз на пачку
+        """
+        rows = list(rows)
+        errors: List[Dict[str, str]] = [{} for _ in rows]
+        
+        rows_by_type: Dict[str, List[int]] = {}
+        for index, row in enumerate(rows):
+            contract_type = row.get('contract_type')
+            if contract_type in CONTRACT_SCHEMAS:
+                rows_by_type.setdefault(contract_type, []).append(index)
+            else:
+                errors[index]['contract_type'] = f"Неизвестный тип договора: {contract_type}"
         
-        if len(requisites) > 1000:
-            return False, "Реквизиты слишком длинные (максимум 1000 символов)"
+        for contract_type, indexes in rows_by_type.items():
+            for field, check in CONTRACT_SCHEMAS[contract_type].items():
+                checked: Dict[str, Optional[str]] = {}
+                for index in indexes:
+                    value = rows[index].get(field)
+                    if value is None or value == '':
+                        errors[index][field] = MISSING_ERROR
+                        continue
+                    
+                    value = str(value)
+                    if value not in checked:
+                        checked[value] = check(value)
+                    if checked[value] is not None:
+                        errors[index][field] = checked[value]
         
-        return True, None
+        return errors
 
 validator = DataValidator()
 
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import ClientSession, web
+
+logger = logging.getLogger(__name__)
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука: обновления обрабатываются в фоне,
+    но одновременно не больше max_in_flight. При достижении лимита ответ
+    Telegram задерживается, и новые обновления не принимаются до освобождения слота.
+    """
+    
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_in_flight: int,
+                 secret_token: Optional[str] = None, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True,
+                         secret_token=secret_token, **data)
+        self.max_in_flight = max(1, max_in_flight)
+        self.in_flight = 0
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+    
+    async def _feed_update_limited(self, bot: Bot, update: Dict[str, Any]):
+        try:
+            await self._background_feed_update(bot=bot, update=update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления из вебхука: {e}")
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+    
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self._slots.acquire()
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except Exception:
+            self._slots.release()
+            return web.Response(body="Bad Request", status=400)
+        
+        self.in_flight += 1
+        task = asyncio.create_task(self._feed_update_limited(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+def build_webhook_app(dispatcher: Dispatcher, bot: Bot, path: str, secret_token: Optional[str] = None,
+                      max_in_flight: int = 64) -> web.Application:
+    """aiohttp-приложение, принимающее обновления Telegram по адресу path"""
+    app = web.Application()
+    handler = LimitedRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        max_in_flight=max_in_flight,
+        secret_token=secret_token or None
+    )
+    handler.register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+async def replay_updates(url: str, updates: Iterable[Dict], secret_token: Optional[str] = None) -> List[int]:
+    """Отправка записанных обновлений на локальный вебхук, возвращает HTTP-статусы"""
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token else {}
+    async with ClientSession() as session:
+        statuses = []
+        for update in updates:
+            async with session.post(url, json=update, headers=headers) as response:
+                statuses.append(response.status)
+        return statuses
+
+def main():
+    """Воспроизведение обновлений из JSONL-файла: python -m utils.webhook updates.jsonl"""
+    parser = argparse.ArgumentParser(description="Отправка записанных обновлений на вебхук бота")
+    parser.add_argument('updates', help="JSONL-файл, по одному обновлению Telegram в строке")
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', default=None)
+    args = parser.parse_args()
+    
+    with open(args.updates, 'r', encoding='utf-8') as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    
+    statuses = asyncio.run(replay_updates(args.url, updates, args.secret))
+    print(f"Отправлено обновлений: {len(statuses)}, успешно: {statuses.count(200)}")
+
+if __name__ == '__main__':
+    main()
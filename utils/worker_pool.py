@@ -0,0 +1,69 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class PoolOverloadedError(RuntimeError):
+    """Очередь пула заполнена, задача не принята"""
+
+class WorkerPool:
+    """Пул потоков или процессов с ограниченной очередью ожидания"""
+    
+    def __init__(self, workers: int, queue_size: int, kind: str = 'thread'):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Неизвестный тип пула: {kind}")
+        
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+    
+    @property
+    def pending(self) -> int:
+        """Количество выполняемых и ожидающих задач"""
+        return self._pending
+    
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='generation')
+        return self._executor
+    
+    def _release(self, future: asyncio.Future):
+        self._pending -= 1
+    
+    def submit(self, *calls: Callable[[], Any]) -> List[asyncio.Future]:
+        """
+        Постановка задач в пул одной порцией: принимаются все или ни одной.
+        Возвращает futures в порядке переданных вызовов.
+        """
+        if self._pending + len(calls) > self.workers + self.queue_size:
+            raise PoolOverloadedError("Сервер перегружен, попробуйте повторить запрос через минуту")
+        
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        
+        futures = []
+        for call in calls:
+            self._pending += 1
+            future = loop.run_in_executor(executor, call)
+            future.add_done_callback(self._release)
+            futures.append(future)
+        return futures
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение функции в пуле без блокировки event loop"""
+        future, = self.submit(functools.partial(func, *args, **kwargs))
+        return await future
+    
+    def shutdown(self, wait: bool = True):
+        """Остановка пула"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None